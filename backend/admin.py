@@ -1,7 +1,10 @@
 from django.contrib import admin
+from django.utils import timezone
 from .models import (
     Category,
     Contact,
+    ImportJob,
+    OutboxEmail,
     Parameter,
     CustomUser,
     Order,
@@ -11,6 +14,7 @@ from .models import (
     ProductParameter,
     Shop,
 )
+from .orders import release_orders, transition_orders
 from django.contrib.auth.admin import UserAdmin
 
 
@@ -75,7 +79,52 @@ class ProductParameterAdmin(admin.ModelAdmin):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    pass
+    list_display = ("id", "user", "status", "total", "dt")
+    list_filter = ("status",)
+    actions = (
+        "mark_confirmed",
+        "mark_assembled",
+        "mark_sent",
+        "mark_delivered",
+        "mark_canceled",
+    )
+
+    def get_readonly_fields(self, request, obj=None):
+        # статус меняется только переходами, чтобы записались события заказа
+        return ("status",) if obj else ()
+
+    def transition(self, request, queryset, status):
+        results = transition_orders(
+            Order.objects.all(), list(queryset.values_list("id", flat=True)), status
+        )
+        changed = sum(result["Status"] for result in results)
+        self.message_user(
+            request, f"Изменен статус {changed} из {len(results)} заказов"
+        )
+
+    @admin.action(description="Подтвердить")
+    def mark_confirmed(self, request, queryset):
+        self.transition(request, queryset, "confirmed")
+
+    @admin.action(description="Собран")
+    def mark_assembled(self, request, queryset):
+        self.transition(request, queryset, "assembled")
+
+    @admin.action(description="Отправлен")
+    def mark_sent(self, request, queryset):
+        self.transition(request, queryset, "sent")
+
+    @admin.action(description="Доставлен")
+    def mark_delivered(self, request, queryset):
+        self.transition(request, queryset, "delivered")
+
+    @admin.action(description="Отменить")
+    def mark_canceled(self, request, queryset):
+        # отмена возвращает товары на склад, поэтому идет через release_orders
+        canceled = release_orders(Order.objects.filter(id__in=queryset.values("id")))
+        self.message_user(
+            request, f"Отменено {len(canceled)} из {queryset.count()} заказов"
+        )
 
 
 @admin.register(OrderItem)
@@ -86,3 +135,22 @@ class OrderItemAdmin(admin.ModelAdmin):
 @admin.register(Contact)
 class ContactAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "status", "rows_processed", "created_at")
+    list_filter = ("status",)
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ("id", "subject", "status", "attempts", "send_after", "sent_at")
+    list_filter = ("status",)
+    actions = ("retry",)
+
+    @admin.action(description="Отправить повторно")
+    def retry(self, request, queryset):
+        queryset.exclude(status="sent").update(
+            status="pending", attempts=0, send_after=timezone.now()
+        )
@@ -0,0 +1,224 @@
+"""
+Асинхронные версии чтения каталога и заказов для ASGI-воркеров (uvicorn).
+
+Ответы совпадают с синхронными представлениями из backend.views, но строки
+читаются асинхронным ORM (aiterator, aget) в виде values() и собираются
+в словари без сериализаторов DRF, поэтому медленный клиент или ожидание БД
+не занимают поток воркера. Ограничения частоты запросов и чтение каталога
+с реплик - такие же, как у синхронных представлений.
+"""
+from functools import wraps
+from math import ceil
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from rest_framework.settings import api_settings
+
+from backend.authentication import cached_user, get_token_data
+from backend.models import Category, Order, ProductInfo, Shop
+from backend.pagination import KeysetPagination, PaginationError
+from backend.projections import (
+    ORDER_VALUES,
+    contact_values,
+    format_orders,
+    format_product_info,
+    group_parameters,
+    item_product_infos,
+    order_item_values,
+    parameter_values,
+    product_info_values,
+)
+from backend.views import ProductInfoView
+
+
+async def get_user(request):
+    """Асинхронная проверка заголовка Authorization: Token <ключ>."""
+    keyword, _, key = request.headers.get("Authorization", "").partition(" ")
+    if keyword != "Token" or not key:
+        return None
+    data = await sync_to_async(get_token_data)(key)
+    if data is None or not data["is_active"]:
+        return None
+    return cached_user(data)
+
+
+def get_only(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != "GET":
+            return JsonResponse(
+                {"Status": False, "Error": "Метод не поддерживается"}, status=405
+            )
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def check_throttles(request, view):
+    """
+    Те же ограничения частоты, что DEFAULT_THROTTLE_CLASSES у синхронных
+    представлений. Возвращает None или сколько секунд ждать.
+    """
+    waits = [
+        throttle.wait()
+        for throttle in (cls() for cls in api_settings.DEFAULT_THROTTLE_CLASSES)
+        if not throttle.allow_request(request, view)
+    ]
+    if not waits:
+        return None
+    return max((wait for wait in waits if wait is not None), default=0)
+
+
+def throttled(view):
+    """Определяет пользователя по токену и применяет ограничения частоты."""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request.user = await get_user(request) or AnonymousUser()
+        wait = await sync_to_async(check_throttles)(request, view)
+        if wait is not None:
+            return JsonResponse(
+                {"Status": False, "Error": "Слишком много запросов"},
+                status=429,
+                headers={"Retry-After": str(ceil(wait))},
+            )
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def token_required(view):
+    """Только для пользователя, которого определил throttled."""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse(
+                {"Status": False, "Error": "Требуется авторизация"}, status=401
+            )
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def read_from_replica(view):
+    """Как read_from_replica = True у класса: GET читает с реплик."""
+    view.read_from_replica = True
+    return view
+
+
+async def load_parameters(product_info_ids):
+    return group_parameters(
+        [row async for row in parameter_values(product_info_ids).aiterator()]
+    )
+
+
+@read_from_replica
+@get_only
+@throttled
+async def shops(request):
+    data = [
+        row
+        async for row in Shop.objects.order_by("-name")
+        .values("name", "id", "state")
+        .aiterator()
+    ]
+    return JsonResponse(data, safe=False)
+
+
+@read_from_replica
+@get_only
+@throttled
+async def categories(request):
+    # магазины категории в порядке Shop.Meta.ordering, как в CategorySerializer
+    shop_ids = {}
+    async for row in (
+        Category.shops.through.objects.order_by("-shop__name")
+        .values("category_id", "shop_id")
+        .aiterator()
+    ):
+        shop_ids.setdefault(row["category_id"], []).append(row["shop_id"])
+    data = [
+        {"name": row["name"], "shops": shop_ids.get(row["id"], [])}
+        async for row in Category.objects.order_by("-name")
+        .values("id", "name")
+        .aiterator()
+    ]
+    return JsonResponse(data, safe=False)
+
+
+@read_from_replica
+@get_only
+@throttled
+async def product_infos(request):
+    """То же, что ProductInfoView.get без кеша: фильтры, fields и курсор."""
+    params = request.GET
+    try:
+        paginator = KeysetPagination(params)
+        fields = ProductInfoView.get_fields(params.get("fields"))
+        queryset = ProductInfo.objects.filter(ProductInfoView.get_filters(params))
+    except (PaginationError, ValueError) as error:
+        return JsonResponse({"Status": False, "Errors": str(error)}, status=400)
+
+    rows = [
+        row
+        async for row in product_info_values(paginator.paginate(queryset)).aiterator()
+    ]
+    rows, next_cursor = paginator.get_page(rows, dict.__getitem__)
+    parameters = {}
+    if "product_parameters" in fields:
+        parameters = await load_parameters([row["id"] for row in rows])
+    return JsonResponse(
+        {
+            "Status": True,
+            "Data": [format_product_info(row, parameters, fields) for row in rows],
+            "Next": next_cursor,
+        }
+    )
+
+
+async def load_orders(orders):
+    """Заказы в формате OrderSerializer, те же запросы, что в serialize_orders."""
+    orders = [row async for row in orders.values(*ORDER_VALUES).aiterator()]
+    items = [
+        row
+        async for row in order_item_values(
+            [order["id"] for order in orders]
+        ).aiterator()
+    ]
+    rows = item_product_infos(items)
+    parameters = await load_parameters(list(rows))
+    product_infos = {
+        product_info_id: format_product_info(row, parameters)
+        for product_info_id, row in rows.items()
+    }
+    contacts = {
+        row["id"]: row
+        async for row in contact_values(
+            {order["contact_id"] for order in orders} - {None}
+        ).aiterator()
+    }
+    return format_orders(orders, items, product_infos, contacts)
+
+
+@get_only
+@throttled
+@token_required
+async def basket(request):
+    data = await load_orders(
+        Order.objects.filter(user_id=request.user.id, status="basket").order_by("id")
+    )
+    return JsonResponse({"status": True, "answer": data})
+
+
+@get_only
+@throttled
+@token_required
+async def orders(request):
+    data = await load_orders(
+        Order.objects.filter(user_id=request.user.id)
+        .exclude(status="basket")
+        .order_by("id")
+    )
+    return JsonResponse({"Status": True, "Orders": data})
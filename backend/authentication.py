@@ -0,0 +1,202 @@
+"""
+Аутентификация по токену без запроса к БД на каждый запрос.
+
+Для токена кешируются id пользователя, type, is_active, is_staff и id
+магазина: сначала в LRU памяти процесса с коротким TTL, затем в Redis.
+request.user собирается из этих полей, остальные поля модели загрузятся из
+БД только при обращении к ним. Кеш сбрасывается сигналами после коммита
+сохранения или удаления пользователя, его магазина и удаления токена.
+Другие процессы увидят изменения после истечения AUTH_LOCAL_TIMEOUT.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from redis.exceptions import RedisError
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from backend.models import CustomUser
+
+
+AUTH_CACHE_TIMEOUT = 10 * 60
+AUTH_LOCAL_TIMEOUT = 30
+AUTH_LOCAL_SIZE = 10_000
+AUTH_PREFIX = "auth"
+CACHED_USER_FIELDS = ("id", "type", "is_active", "is_staff")
+STATS_KEYS = ("local_hits", "redis_hits", "misses", "invalidations")
+
+
+def token_cache_key(key):
+    return f"{AUTH_PREFIX}:token:{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+def user_cache_key(user_id):
+    return f"{AUTH_PREFIX}:user:{user_id}"
+
+
+class LocalCache:
+    """LRU на size записей, запись живет timeout секунд"""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def delete_where(self, test):
+        with self.lock:
+            for key in [key for key, (_, value) in self.entries.items() if test(value)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class AuthCache:
+    """Двухуровневый кеш токенов со счетчиками попаданий этого процесса"""
+
+    def __init__(self, size=AUTH_LOCAL_SIZE, timeout=AUTH_LOCAL_TIMEOUT):
+        self.local = LocalCache(size, timeout)
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(STATS_KEYS, 0)
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def get(self, key):
+        cache_key = token_cache_key(key)
+        data = self.local.get(cache_key)
+        if data is not None:
+            self.count("local_hits")
+            return data
+        try:
+            data = cache.get(cache_key)
+        except RedisError:
+            data = None
+        if data is not None:
+            self.count("redis_hits")
+            self.local.set(cache_key, data)
+            return data
+        self.count("misses")
+        return None
+
+    def set(self, key, data):
+        cache_key = token_cache_key(key)
+        self.local.set(cache_key, data)
+        try:
+            cache.set_many(
+                {cache_key: data, user_cache_key(data["id"]): cache_key},
+                timeout=AUTH_CACHE_TIMEOUT,
+            )
+        except RedisError:
+            pass
+
+    def invalidate_token(self, key):
+        cache_key = token_cache_key(key)
+        self.local.delete(cache_key)
+        self.count("invalidations")
+        try:
+            cache.delete(cache_key)
+        except RedisError:
+            pass
+
+    def invalidate_user(self, user_id):
+        self.local.delete_where(lambda data: data["id"] == user_id)
+        self.count("invalidations")
+        try:
+            token_key = cache.get(user_cache_key(user_id))
+            cache.delete_many(
+                [user_cache_key(user_id)] + ([token_key] if token_key else [])
+            )
+        except RedisError:
+            pass
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        hits = stats["local_hits"] + stats["redis_hits"]
+        requests = hits + stats["misses"]
+        stats["hit_rate"] = round(hits / requests, 4) if requests else None
+        return stats
+
+    def clear(self):
+        self.local.clear()
+        with self.lock:
+            self.counters = dict.fromkeys(STATS_KEYS, 0)
+
+
+auth_cache = AuthCache()
+
+
+def get_token_data(key):
+    """Поля пользователя для токена из кеша, при промахе - одним запросом"""
+    data = auth_cache.get(key)
+    if data is not None:
+        return data
+    row = (
+        Token.objects.filter(key=key)
+        .values(*(f"user__{field}" for field in CACHED_USER_FIELDS), "user__shop__id")
+        .first()
+    )
+    if row is None:
+        return None
+    data = {field: row[f"user__{field}"] for field in CACHED_USER_FIELDS}
+    data["shop_id"] = row["user__shop__id"]
+    auth_cache.set(key, data)
+    return data
+
+
+def cached_user(data):
+    """Пользователь только с закешированными полями, остальные отложены"""
+    # from_db ждет значения в порядке полей модели
+    fields = [
+        field.attname
+        for field in CustomUser._meta.concrete_fields
+        if field.attname in CACHED_USER_FIELDS
+    ]
+    user = CustomUser.from_db(
+        DEFAULT_DB_ALIAS, fields, [data[field] for field in fields]
+    )
+    user.shop_id = data["shop_id"]
+    return user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        data = get_token_data(key)
+        if data is None:
+            raise AuthenticationFailed(_("Invalid token."))
+        if not data["is_active"]:
+            raise AuthenticationFailed(_("User inactive or deleted."))
+        return cached_user(data), Token(key=key, user_id=data["id"])
@@ -0,0 +1,135 @@
+from django.db import transaction
+
+from backend.models import Order, OrderItem, ProductInfo
+
+
+class BasketError(ValueError):
+    pass
+
+
+def parse_items(items, key):
+    """
+    Проверяет формат позиций [{key: id, "quantity": n}] и складывает
+    количество повторяющихся id.
+    """
+    if not isinstance(items, list) or not items:
+        raise BasketError("Не указаны все необходимые аргументы")
+    quantities = {}
+    for item in items:
+        if not isinstance(item, dict):
+            raise BasketError("Позиция должна быть объектом")
+        item_id, quantity = item.get(key), item.get("quantity")
+        if type(item_id) != int or type(quantity) != int or quantity <= 0:
+            raise BasketError(f"Неверно указана позиция: {item}")
+        quantities[item_id] = quantities.get(item_id, 0) + quantity
+    return quantities
+
+
+def load_goods(quantities):
+    """
+    Одним запросом загружает товары и проверяет, что они продаются
+    и есть на складе в нужном количестве. quantities: {product_info_id: n}.
+    """
+    goods = {
+        info["id"]: info
+        for info in ProductInfo.objects.filter(id__in=quantities).values(
+            "id", "price", "quantity", "is_active", "shop__state"
+        )
+    }
+    errors = {}
+    for info_id, quantity in quantities.items():
+        info = goods.get(info_id)
+        if info is None:
+            errors[info_id] = "Товар не найден"
+        elif not info["is_active"] or not info["shop__state"]:
+            errors[info_id] = "Товар не продается"
+        elif info["quantity"] < quantity:
+            errors[info_id] = f"На складе {info['quantity']} шт."
+    if errors:
+        raise BasketError(errors)
+    return goods
+
+
+def lock_basket(basket):
+    """
+    Блокирует строку корзины до конца транзакции. Оформление заказа
+    блокирует ту же строку, поэтому после него корзина уже не найдется
+    и изменить размещенный заказ нельзя.
+    """
+    if not (
+        Order.objects.select_for_update().filter(id=basket.id, status="basket").exists()
+    ):
+        raise BasketError("Корзина уже оформлена")
+
+
+def add_items(basket, items):
+    """
+    Добавляет товары в корзину, для уже лежащих в корзине количество
+    суммируется. Строка корзины блокируется до конца транзакции, поэтому
+    параллельные добавления и оформление заказа выполняются по очереди и
+    не теряют количество друг друга. Возвращает число добавленных или
+    измененных позиций.
+    """
+    quantities = parse_items(items, "product_info")
+    with transaction.atomic():
+        lock_basket(basket)
+        existing = dict(
+            OrderItem.objects.filter(
+                order_id=basket.id, product_info_id__in=quantities
+            ).values_list("product_info_id", "quantity")
+        )
+        for info_id, quantity in existing.items():
+            quantities[info_id] += quantity
+        goods = load_goods(quantities)
+
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(
+                    order_id=basket.id,
+                    product_info_id=info_id,
+                    quantity=quantity,
+                    price=goods[info_id]["price"],
+                )
+                for info_id, quantity in quantities.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["order", "product_info"],
+            update_fields=["quantity", "price"],
+        )
+        Order.objects.filter(id=basket.id).update_totals()
+    return len(quantities)
+
+
+def update_items(basket, items):
+    """
+    Меняет количество в позициях корзины [{"id": id, "quantity": n}].
+    Остатки проверяются под блокировкой корзины, как в add_items.
+    """
+    quantities = parse_items(items, "id")
+    with transaction.atomic():
+        lock_basket(basket)
+        basket_items = list(
+            OrderItem.objects.filter(order_id=basket.id, id__in=quantities).only(
+                "id", "product_info_id"
+            )
+        )
+        goods = load_goods(
+            {item.product_info_id: quantities[item.id] for item in basket_items}
+        )
+        for item in basket_items:
+            item.quantity = quantities[item.id]
+            item.price = goods[item.product_info_id]["price"]
+        OrderItem.objects.bulk_update(basket_items, ["quantity", "price"])
+        Order.objects.filter(id=basket.id).update_totals()
+    return len(basket_items)
+
+
+def remove_items(basket, item_ids):
+    """Удаляет позиции корзины по id и пересчитывает цены и сумму."""
+    with transaction.atomic():
+        lock_basket(basket)
+        deleted, _ = OrderItem.objects.filter(
+            order_id=basket.id, id__in=item_ids
+        ).delete()
+        basket.refresh_prices()
+    return deleted
@@ -0,0 +1,145 @@
+"""
+Генератор данных для нагрузочных тестов (tests/benchmarks) и команды
+search_benchmark.
+
+Объем задается множителем scale: при scale=1 создается 10 тыс. магазинов,
+1 млн товаров магазинов и 100 тыс. заказов. Объекты готовит model_bakery
+(baker.prepare), в базу они пишутся пачками через bulk_create.
+"""
+import random
+from itertools import islice
+
+from django.db import transaction
+from model_bakery import baker
+
+from backend.models import (
+    Category,
+    CustomUser,
+    Order,
+    OrderItem,
+    Parameter,
+    Product,
+    ProductInfo,
+    ProductParameter,
+    Shop,
+)
+
+
+FULL_SIZE = {
+    "shops": 10_000,
+    "categories": 200,
+    "products": 100_000,
+    "product_infos": 1_000_000,
+    "orders": 100_000,
+}
+ITEMS_PER_ORDER = 3
+PARAMETERS = ("Цвет", "Диагональ (дюйм)", "Встроенная память (Гб)")
+BATCH_SIZE = 5000
+
+
+def sizes(scale):
+    return {name: max(1, int(size * scale)) for name, size in FULL_SIZE.items()}
+
+
+def write(model, objects):
+    """bulk_create пачками; возвращает созданные объекты с id."""
+    created = []
+    objects = iter(objects)
+    while batch := list(islice(objects, BATCH_SIZE)):
+        created.extend(model.objects.bulk_create(batch))
+    return created
+
+
+def prepare(model, number, **fields):
+    return baker.prepare(model, _quantity=number, **fields) if number else []
+
+
+@transaction.atomic
+def seed(scale, seed_value=0):
+    """
+    Заполняет базу и возвращает словарь с пользователями для сценариев:
+    buyer (корзина и заказы), partner (магазин с заказами).
+    """
+    random.seed(seed_value)
+    size = sizes(scale)
+
+    users = prepare(CustomUser, size["shops"] + 1, type="shop", is_active=True)
+    for number, user in enumerate(users):
+        user.email = f"user{number}@bench.local"
+        user.username = f"user{number}"
+    users[-1].type = "buyer"
+    users = write(CustomUser, users)
+    buyer, shop_users = users[-1], users[:-1]
+
+    shops = write(
+        Shop,
+        (baker.prepare(Shop, user=user, state=True, url=None) for user in shop_users),
+    )
+    categories = write(Category, prepare(Category, size["categories"]))
+    products = write(
+        Product,
+        (
+            baker.prepare(Product, category=random.choice(categories))
+            for _ in range(size["products"])
+        ),
+    )
+    infos = write(
+        ProductInfo,
+        (
+            baker.prepare(
+                ProductInfo,
+                shop=shops[number % len(shops)],
+                product=random.choice(products),
+                external_id=number,
+                price=random.randint(100, 100_000),
+                quantity=random.randint(0, 1000),
+                content_hash="",
+                is_active=True,
+            )
+            for number in range(size["product_infos"])
+        ),
+    )
+    parameters = write(Parameter, (Parameter(name=name) for name in PARAMETERS))
+    write(
+        ProductParameter,
+        (
+            ProductParameter(
+                product_info=info, parameter=parameter, value=str(info.price % 10)
+            )
+            for info in infos
+            for parameter in parameters
+        ),
+    )
+
+    # заказы размещены покупателем, в каждом есть товар первого магазина
+    partner_goods = infos[: len(shops) * 20 : len(shops)]
+
+    def order_goods():
+        goods = [random.choice(partner_goods)]
+        goods += random.sample(infos, ITEMS_PER_ORDER - 1)
+        return {info.id: info for info in goods}.values()
+
+    orders = write(
+        Order,
+        (Order(user=buyer, status="new", total=0) for _ in range(size["orders"])),
+    )
+    write(
+        OrderItem,
+        (
+            OrderItem(order=order, product_info=info, quantity=1, price=info.price)
+            for order in orders
+            for info in order_goods()
+        ),
+    )
+    Order.objects.update_totals()
+
+    basket = Order.objects.create(user=buyer, status="basket")
+    write(
+        OrderItem,
+        (
+            OrderItem(order=basket, product_info=info, quantity=1, price=info.price)
+            for info in random.sample(infos, 20)
+        ),
+    )
+    Order.objects.filter(id=basket.id).update_totals()
+    return {"buyer": buyer, "partner": shop_users[0], "shop": shops[0], "size": size}
@@ -0,0 +1,146 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from redis.exceptions import RedisError
+from rest_framework.renderers import JSONRenderer
+
+from backend.metrics import serialization_timer
+from backend.routers import replica_reads
+
+
+CATALOG_CACHE_TIMEOUT = 60 * 60
+CATALOG_PREFIX = "catalog"
+GLOBAL_GENERATION = "global"
+UNFILTERED_GENERATION = "all"
+STATS_KEYS = ("hits", "misses", "invalidations")
+
+
+def generation_key(name):
+    return f"{CATALOG_PREFIX}:gen:{name}"
+
+
+def stats_key(name):
+    return f"{CATALOG_PREFIX}:stats:{name}"
+
+
+def incr(key):
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+def get_generation(shop_id=None):
+    """
+    Версия кеша для списка. Глобальная версия входит в любой ключ,
+    вторая часть - версия магазина или версия списков без фильтра по магазину.
+    """
+    keys = [
+        generation_key(GLOBAL_GENERATION),
+        generation_key(shop_id if shop_id else UNFILTERED_GENERATION),
+    ]
+    values = cache.get_many(keys)
+    return ".".join(str(values.get(key, 0)) for key in keys)
+
+
+def bump_catalog_generation(shop_ids=None):
+    """
+    Сбрасывает кеш каталога. С shop_ids сбрасываются списки этих магазинов
+    и списки без фильтра, без shop_ids - весь кеш каталога.
+    Если Redis недоступен, сброс пропускается: кеш сейчас все равно не работает.
+    """
+    try:
+        if shop_ids is None:
+            incr(generation_key(GLOBAL_GENERATION))
+        else:
+            for shop_id in set(shop_ids):
+                incr(generation_key(shop_id))
+            incr(generation_key(UNFILTERED_GENERATION))
+        incr(stats_key("invalidations"))
+    except RedisError:
+        pass
+
+
+def cache_key(name, query_params, shop_id=None):
+    params = sorted(
+        (key, value) for key in query_params for value in query_params.getlist(key)
+    )
+    digest = hashlib.sha1(repr(params).encode()).hexdigest()
+    return f"{CATALOG_PREFIX}:{name}:{get_generation(shop_id)}:{digest}"
+
+
+def cached_json_response(request, name, build, shop_id=None):
+    """
+    Отдает готовые байты JSON из кеша. При промахе вызывает build(),
+    успешный ответ сохраняется в кеш до смены версии каталога.
+    Ответ, прочитанный с реплики, хранится только REPLICA_CACHE_TIMEOUT
+    секунд: он мог быть построен по данным до уже сброшенной версии.
+    Если Redis недоступен, ответ строится из БД без кеша.
+    """
+    try:
+        key = cache_key(name, request.query_params, shop_id)
+        content = cache.get(key)
+        if content is not None:
+            incr(stats_key("hits"))
+            return HttpResponse(content, content_type="application/json")
+        incr(stats_key("misses"))
+    except RedisError:
+        return build()
+
+    response = build()
+    if response.status_code == 200:
+        try:
+            cache.set(
+                key,
+                response.content,
+                timeout=(
+                    settings.REPLICA_CACHE_TIMEOUT
+                    if replica_reads.get()
+                    else CATALOG_CACHE_TIMEOUT
+                ),
+            )
+        except RedisError:
+            pass
+    return response
+
+
+def get_cache_stats():
+    try:
+        values = cache.get_many([stats_key(name) for name in STATS_KEYS])
+    except RedisError:
+        values = {}
+    stats = {name: values.get(stats_key(name), 0) for name in STATS_KEYS}
+    requests = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / requests, 4) if requests else None
+    stats["evictions"] = get_evictions()
+    return stats
+
+
+def get_evictions():
+    """Число вытесненных ключей из INFO Redis, для других бекендов None."""
+    client = getattr(getattr(cache, "_cache", None), "get_client", None)
+    if client is None:
+        return None
+    try:
+        return client().info("stats").get("evicted_keys")
+    except RedisError:
+        return None
+
+
+class CachedListMixin:
+    """Кеширование списков ListAPIView в виде готового JSON."""
+
+    cache_name = None
+
+    def list(self, request, *args, **kwargs):
+        def build():
+            response = super(CachedListMixin, self).list(request, *args, **kwargs)
+            with serialization_timer():
+                content = JSONRenderer().render(response.data)
+            return HttpResponse(content, content_type="application/json")
+
+        return cached_json_response(request, self.cache_name, build)
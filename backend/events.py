@@ -0,0 +1,103 @@
+"""
+Outbox событий смены статуса заказа.
+
+record_order_events пишет OrderEvent в транзакции, меняющей статус, и
+после коммита запускает relay_order_events. Relay забирает неопубликованные
+события по возрастанию id и отправляет пачкой одной задачей Celery, поэтому
+события одного заказа доходят до воркера в порядке их появления. Если
+брокер недоступен или relay после коммита застал работающий relay, события
+останутся в таблице, и их отправит периодическая задача
+relay_order_events_task.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from backend.models import OrderEvent, OrderItem
+
+
+ORDER_EVENTS_BATCH_SIZE = 500
+# ключ pg_advisory_xact_lock, по которому relay выполняются по очереди
+RELAY_LOCK_KEY = 5_202_301
+EVENT_FIELDS = ("id", "order_id", "user_id", "old_status", "new_status", "shop_ids")
+
+
+def order_shop_ids(order_ids):
+    """{id заказа: [id магазинов]} одним запросом"""
+    shop_ids = {order_id: [] for order_id in order_ids}
+    rows = (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values_list("order_id", "product_info__shop_id")
+        .distinct()
+        .order_by("order_id", "product_info__shop_id")
+    )
+    for order_id, shop_id in rows:
+        shop_ids[order_id].append(shop_id)
+    return shop_ids
+
+
+def record_order_events(transitions, new_status, shop_ids=None):
+    """
+    Записывает события перехода заказов в new_status.
+    transitions - список (id заказа, id покупателя, прежний статус),
+    shop_ids - {id заказа: [id магазинов]}, если не передан, выбирается из позиций.
+    Вызывается внутри транзакции, которая меняет статус.
+    """
+    if not transitions:
+        return []
+    if shop_ids is None:
+        shop_ids = order_shop_ids([order_id for order_id, _, _ in transitions])
+    events = OrderEvent.objects.bulk_create(
+        OrderEvent(
+            order_id=order_id,
+            user_id=user_id,
+            old_status=old_status,
+            new_status=new_status,
+            shop_ids=shop_ids.get(order_id, []),
+        )
+        for order_id, user_id, old_status in transitions
+    )
+    transaction.on_commit(lambda: relay_order_events(wait=False), robust=True)
+    return events
+
+
+def publish(events):
+    from backend.tasks import order_events_task
+
+    order_events_task.delay(events)
+
+
+def relay_order_events(batch_size=ORDER_EVENTS_BATCH_SIZE, wait=True):
+    """
+    Отправляет неопубликованные события пачками по batch_size.
+    Параллельные relay выполняются по очереди под advisory lock, поэтому
+    пачки уходят строго по возрастанию id. С wait=False relay не ждет
+    занятую блокировку, а сразу завершается: так запрос после коммита не
+    стоит в очереди, события отправит текущий или периодический relay.
+    Возвращает число отправленных событий.
+    """
+    published = 0
+    while True:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                if wait:
+                    cursor.execute("SELECT pg_advisory_xact_lock(%s)", [RELAY_LOCK_KEY])
+                else:
+                    cursor.execute(
+                        "SELECT pg_try_advisory_xact_lock(%s)", [RELAY_LOCK_KEY]
+                    )
+                    if not cursor.fetchone()[0]:
+                        return published
+            events = list(
+                OrderEvent.objects.filter(published_at__isnull=True)
+                .order_by("id")
+                .values(*EVENT_FIELDS)[:batch_size]
+            )
+            if not events:
+                return published
+            publish(events)
+            OrderEvent.objects.filter(id__in=[event["id"] for event in events]).update(
+                published_at=timezone.now()
+            )
+        published += len(events)
+        if len(events) < batch_size:
+            return published
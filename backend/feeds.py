@@ -0,0 +1,173 @@
+import csv
+import io
+import os
+
+import ujson
+import yaml
+
+
+FEED_FORMATS = ("yaml", "jsonl", "csv")
+FEED_EXTENSIONS = {
+    ".yaml": "yaml",
+    ".yml": "yaml",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".csv": "csv",
+}
+YAML_SECTIONS = {"categories": "category", "goods": "good"}
+CSV_GOOD_FIELDS = ("id", "category", "price", "price_rrc", "quantity")
+CSV_PARAMETER_PREFIX = "param:"
+
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class FeedError(ValueError):
+    pass
+
+
+def detect_format(name):
+    """Определяет формат прайс-листа по расширению файла, по умолчанию yaml."""
+    extension = os.path.splitext(name.split("?")[0])[1].lower()
+    return FEED_EXTENSIONS.get(extension, "yaml")
+
+
+class FeedReader:
+    """
+    Потоковое чтение прайс-листа.
+    Название магазина читается сразу и доступно в shop, затем при итерации
+    по одной отдаются пары ("category", dict) и ("good", dict), поэтому в памяти
+    держится только текущая запись, а не весь файл.
+    """
+
+    def __init__(self, file, format="yaml"):
+        if format not in PARSERS:
+            raise FeedError(f"Неизвестный формат прайс-листа: {format}")
+        self.records = PARSERS[format](file)
+        kind, value = next(self.records, (None, None))
+        if kind != "shop":
+            raise FeedError("Название магазина должно быть в начале прайс-листа")
+        self.shop = value
+
+    def __iter__(self):
+        return self.records
+
+
+def compose_yaml_node(loader):
+    """Собирает узел YAML из событий парсера, не читая документ целиком."""
+    event = loader.get_event()
+    if isinstance(event, yaml.AliasEvent):
+        raise FeedError("Ссылки (alias) в прайс-листе не поддерживаются")
+    if isinstance(event, yaml.ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == "!":
+            tag = loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+        return yaml.ScalarNode(
+            tag, event.value, event.start_mark, event.end_mark, style=event.style
+        )
+    if isinstance(event, yaml.SequenceStartEvent):
+        tag = event.tag or loader.resolve(yaml.SequenceNode, None, event.implicit)
+        items = []
+        while not loader.check_event(yaml.SequenceEndEvent):
+            items.append(compose_yaml_node(loader))
+        end = loader.get_event()
+        return yaml.SequenceNode(tag, items, event.start_mark, end.end_mark)
+    if isinstance(event, yaml.MappingStartEvent):
+        tag = event.tag or loader.resolve(yaml.MappingNode, None, event.implicit)
+        pairs = []
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = compose_yaml_node(loader)
+            pairs.append((key, compose_yaml_node(loader)))
+        end = loader.get_event()
+        return yaml.MappingNode(tag, pairs, event.start_mark, end.end_mark)
+    raise FeedError(f"Неожиданный элемент прайс-листа: {event}")
+
+
+def construct_yaml_node(loader, node):
+    data = loader.construct_object(node, deep=True)
+    loader.constructed_objects = {}
+    loader.recursive_objects = {}
+    return data
+
+
+def parse_yaml(file):
+    loader = YamlLoader(file)
+    try:
+        for event_class in (
+            yaml.StreamStartEvent,
+            yaml.DocumentStartEvent,
+            yaml.MappingStartEvent,
+        ):
+            if not loader.check_event(event_class):
+                raise FeedError("Прайс-лист должен быть словарем YAML")
+            loader.get_event()
+
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = construct_yaml_node(loader, compose_yaml_node(loader))
+            if key in YAML_SECTIONS and loader.check_event(yaml.SequenceStartEvent):
+                loader.get_event()
+                while not loader.check_event(yaml.SequenceEndEvent):
+                    node = compose_yaml_node(loader)
+                    yield YAML_SECTIONS[key], construct_yaml_node(loader, node)
+                loader.get_event()
+            else:
+                value = construct_yaml_node(loader, compose_yaml_node(loader))
+                if key == "shop":
+                    yield "shop", value
+    except yaml.YAMLError as error:
+        raise FeedError(str(error)) from error
+    finally:
+        loader.dispose()
+
+
+def parse_jsonl(file):
+    """Каждая строка - объект с одним ключом: shop, category или good."""
+    lines = io.TextIOWrapper(file, encoding="utf-8")
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = ujson.loads(line)
+        except ValueError as error:
+            raise FeedError(f"Строка {number}: {error}") from error
+        if not isinstance(record, dict) or len(record) != 1:
+            raise FeedError(f"Строка {number}: ожидается объект с одним ключом")
+        ((kind, value),) = record.items()
+        if kind not in ("shop", "category", "good"):
+            raise FeedError(f"Строка {number}: неизвестный тип записи {kind}")
+        yield kind, value
+
+
+def parse_csv(file):
+    """
+    Одна строка - один товар. Колонки: shop, category, category_name, id, name,
+    model, price, price_rrc, quantity, image и параметры с префиксом param:.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8", newline=""))
+    categories = set()
+    for number, row in enumerate(reader):
+        if number == 0:
+            yield "shop", row.get("shop", "")
+        # значения остаются строками, их проверяет и приводит импортер
+        good = {
+            field: row[field] for field in CSV_GOOD_FIELDS if row.get(field) is not None
+        }
+        category = good.get("category")
+        if category is not None and category not in categories:
+            categories.add(category)
+            yield "category", {"id": category, "name": row.get("category_name", "")}
+        good.update(
+            name=row.get("name", ""),
+            model=row.get("model", ""),
+            parameters={
+                name[len(CSV_PARAMETER_PREFIX) :]: value
+                for name, value in row.items()
+                if name.startswith(CSV_PARAMETER_PREFIX) and value != ""
+            },
+        )
+        if row.get("image"):
+            good["image"] = row["image"]
+        yield "good", good
+
+
+PARSERS = {"yaml": parse_yaml, "jsonl": parse_jsonl, "csv": parse_csv}
@@ -0,0 +1,117 @@
+"""
+Пакетная загрузка фото товаров.
+
+Ссылки качаются параллельно в нескольких потоках через одну сессию
+с пулом keep-alive соединений, тело пишется на диск частями. Имя файла
+строится по хешу ссылки, поэтому уже скачанная ссылка не загружается
+повторно, даже если она встречается у нескольких товаров или магазинов.
+"""
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+IMAGE_DOWNLOAD_TIMEOUT = (5, 30)
+IMAGE_CHUNK_SIZE = 64 * 1024
+IMAGE_WORKERS = 8
+IMAGE_RETRIES = 3
+IMAGE_BACKOFF = 0.5
+IMAGE_DIR = "products_image"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ImageFetchError(Exception):
+    pass
+
+
+def image_name(url):
+    """Путь в MEDIA_ROOT по sha256 ссылки, расширение берется из ссылки."""
+    digest = hashlib.sha256(url.encode()).hexdigest()
+    extension = os.path.splitext(urlsplit(url).path)[1].lower()[:5] or ".jpg"
+    return f"{IMAGE_DIR}/{digest[:2]}/{digest}{extension}"
+
+
+def make_session(workers):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class ImageFetcher:
+    def __init__(
+        self,
+        workers=IMAGE_WORKERS,
+        retries=IMAGE_RETRIES,
+        backoff=IMAGE_BACKOFF,
+        session=None,
+    ):
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.session = session or make_session(workers)
+
+    def fetch_all(self, urls):
+        """
+        Скачивает ссылки и возвращает ({url: имя файла}, {url: ошибка}).
+        Повторяющиеся ссылки качаются один раз.
+        """
+        urls = list(dict.fromkeys(urls))
+        fetched, errors = {}, {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for url, result in zip(urls, executor.map(self.try_fetch, urls)):
+                if isinstance(result, ImageFetchError):
+                    errors[url] = str(result)
+                else:
+                    fetched[url] = result
+        return fetched, errors
+
+    def try_fetch(self, url):
+        try:
+            return self.fetch(url)
+        except ImageFetchError as error:
+            return error
+
+    def fetch(self, url):
+        name = image_name(url)
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        if os.path.exists(path):
+            return name
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                self.download(url, path)
+                return name
+            except requests.HTTPError as error:
+                if error.response.status_code not in RETRY_STATUSES:
+                    raise ImageFetchError(str(error)) from error
+                last_error = error
+            except requests.RequestException as error:
+                last_error = error
+        raise ImageFetchError(str(last_error)) from last_error
+
+    def download(self, url, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = f"{path}.part"
+        try:
+            with self.session.get(
+                url, stream=True, timeout=IMAGE_DOWNLOAD_TIMEOUT
+            ) as response:
+                response.raise_for_status()
+                with open(partial, "wb") as file:
+                    for chunk in response.iter_content(chunk_size=IMAGE_CHUNK_SIZE):
+                        file.write(chunk)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        os.replace(partial, path)
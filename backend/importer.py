@@ -0,0 +1,435 @@
+import hashlib
+from itertools import chain, islice
+
+import ujson
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from backend.cache import bump_catalog_generation
+from backend.models import (
+    MISSING_GOODS_CHOICES,
+    Category,
+    Order,
+    OrderItem,
+    Parameter,
+    Product,
+    ProductInfo,
+    ProductParameter,
+    ProductSearchIndex,
+)
+from backend.search import refresh_search_index
+
+
+IMPORT_BATCH_SIZE = 1000
+# сколько ошибок строк хранится в ImportJob.errors, остальные только считаются
+IMPORT_MAX_ERRORS = 1000
+REQUIRED_GOODS_FIELDS = (
+    "id",
+    "category",
+    "model",
+    "name",
+    "price",
+    "price_rrc",
+    "quantity",
+)
+
+
+# целые поля товара; прайс-листы YAML и JSONL могут передать их строками,
+# CSV - всегда строками, поэтому приводятся здесь для всех форматов
+GOODS_INT_FIELDS = ("id", "category", "price", "price_rrc", "quantity")
+
+
+MISSING_GOODS_ACTIONS = tuple(action for action, _ in MISSING_GOODS_CHOICES)
+
+
+def parse_int(value):
+    """Неотрицательное целое из прайс-листа (число или строка цифр) или None."""
+    if type(value) is int:
+        return value if value >= 0 else None
+    if isinstance(value, str):
+        value = value.strip()
+        if value.isascii() and value.isdigit():
+            return int(value)
+    return None
+
+
+def clean_good(item):
+    """
+    Проверяет товар из прайс-листа и приводит целые поля к int.
+    Возвращает (товар, None) или (None, текст ошибки).
+    """
+    if not isinstance(item, dict):
+        return None, "Товар должен быть словарем"
+    missing = [field for field in REQUIRED_GOODS_FIELDS if field not in item]
+    if missing:
+        return None, f"Нет полей: {', '.join(missing)}"
+    values = {field: parse_int(item[field]) for field in GOODS_INT_FIELDS}
+    invalid = [field for field, value in values.items() if value is None]
+    if invalid:
+        return None, f"Ожидается целое неотрицательное число: {', '.join(invalid)}"
+    return {**item, **values}, None
+
+
+def content_hash(item):
+    """Отпечаток товара из прайс-листа: меняется только при изменении данных."""
+    data = [
+        item["name"],
+        item["category"],
+        item["model"],
+        item["price"],
+        item["price_rrc"],
+        item["quantity"],
+        sorted(
+            (str(name), str(value))
+            for name, value in item.get("parameters", {}).items()
+        ),
+    ]
+    return hashlib.sha1(ujson.dumps(data, ensure_ascii=False).encode()).hexdigest()
+
+
+def batched(iterable, size):
+    """Разбивает итерируемый объект на списки длиной не больше size."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def raw_delete(queryset):
+    """
+    DELETE одним запросом, без загрузки строк в модели. Для товаров и их
+    параметров есть получатели post_delete, из-за них обычный delete()
+    перебирает строки по одной и ставит сброс кеша на каждую; импорт сам
+    сбрасывает кеш и обновляет поисковый индекс один раз.
+    """
+    return queryset._raw_delete(queryset.db)
+
+
+class CatalogImporter:
+    """
+    Загрузка прайс-листа магазина пачками.
+    Для каждой пачки существующие записи выбираются несколькими запросами,
+    а запись идет через bulk_create с upsert, поэтому число запросов зависит
+    от количества пачек, а не от количества товаров.
+    Товары, отпечаток которых не изменился, пропускаются; товары, которых
+    нет в прайс-листе, обрабатываются согласно missing.
+    """
+
+    def __init__(
+        self,
+        shop,
+        batch_size=IMPORT_BATCH_SIZE,
+        on_batch=None,
+        force=False,
+        missing="keep",
+    ):
+        if missing not in MISSING_GOODS_ACTIONS:
+            raise ValueError(f"missing must be one of {MISSING_GOODS_ACTIONS}")
+        self.shop = shop
+        self.batch_size = batch_size
+        self.on_batch = on_batch
+        self.force = force
+        self.missing = missing
+        self.parameters = {}
+        # id из прайс-листа нужны только remove_missing
+        self.seen = set()
+        self.stats = {
+            "categories": 0,
+            "goods": 0,
+            "created": 0,
+            "updated": 0,
+            "unchanged": 0,
+            "removed": 0,
+            "errors_dropped": 0,
+        }
+        self.errors = []
+
+    def run(self, categories, goods):
+        return self.run_feed(
+            chain(
+                (("category", category) for category in categories),
+                (("good", item) for item in goods),
+            )
+        )
+
+    def run_feed(self, records):
+        """
+        Импорт из потока записей ("category", dict) и ("good", dict) в порядке
+        прайс-листа. В памяти держится не больше одной пачки каждого типа.
+        """
+        categories, goods = [], []
+        with transaction.atomic():
+            for kind, entry in records:
+                if kind == "category":
+                    categories.append(entry)
+                    if len(categories) >= self.batch_size:
+                        self.import_categories(categories)
+                        categories = []
+                elif kind == "good":
+                    if categories:
+                        self.import_categories(categories)
+                        categories = []
+                    goods.append(entry)
+                    if len(goods) >= self.batch_size:
+                        self.flush_goods(goods)
+                        goods = []
+            if categories:
+                self.import_categories(categories)
+            if goods:
+                self.flush_goods(goods)
+            self.remove_missing()
+            transaction.on_commit(lambda: bump_catalog_generation([self.shop.id]))
+        return self.stats
+
+    def flush_goods(self, batch):
+        self.import_goods(batch)
+        if self.on_batch:
+            self.on_batch(self.stats)
+
+    def add_error(self, error):
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append(error)
+        else:
+            self.stats["errors_dropped"] += 1
+
+    def import_categories(self, categories):
+        for batch in batched(categories, self.batch_size):
+            unique = {}
+            for category in batch:
+                category_id = (
+                    parse_int(category.get("id"))
+                    if isinstance(category, dict)
+                    else None
+                )
+                if category_id is None or "name" not in category:
+                    self.add_error(
+                        {"category": category, "error": "Неверная категория"}
+                    )
+                else:
+                    unique[category_id] = {**category, "id": category_id}
+            if not unique:
+                continue
+            Category.objects.bulk_create(
+                [
+                    Category(id=category["id"], name=category["name"])
+                    for category in unique.values()
+                ],
+                update_conflicts=True,
+                unique_fields=["id"],
+                update_fields=["name"],
+            )
+            Category.shops.through.objects.bulk_create(
+                [
+                    Category.shops.through(
+                        category_id=category_id, shop_id=self.shop.id
+                    )
+                    for category_id in unique
+                ],
+                ignore_conflicts=True,
+            )
+            self.stats["categories"] += len(unique)
+
+    def import_goods(self, batch):
+        items = {}
+        for raw in batch:
+            item, error = clean_good(raw)
+            if error:
+                self.add_error(
+                    {
+                        "id": raw.get("id") if isinstance(raw, dict) else None,
+                        "error": error,
+                    }
+                )
+            else:
+                items[item["id"]] = item
+        if not items:
+            return
+        if self.missing != "keep":
+            self.seen.update(items)
+        self.stats["goods"] += len(items)
+
+        existing = {
+            external_id: (info_id, fingerprint, is_active)
+            for info_id, external_id, fingerprint, is_active in ProductInfo.objects.filter(
+                shop_id=self.shop.id, external_id__in=items
+            ).values_list(
+                "id", "external_id", "content_hash", "is_active"
+            )
+        }
+        hashes = {
+            external_id: content_hash(item) for external_id, item in items.items()
+        }
+        changed = {
+            external_id: item
+            for external_id, item in items.items()
+            if self.force
+            or external_id not in existing
+            or existing[external_id][1] != hashes[external_id]
+        }
+        reactivated = [
+            existing[external_id][0]
+            for external_id in items.keys() - changed.keys()
+            if not existing[external_id][2]
+        ]
+        if reactivated:
+            ProductInfo.objects.filter(id__in=reactivated).update(is_active=True)
+            ProductSearchIndex.objects.filter(product_info_id__in=reactivated).update(
+                is_active=True
+            )
+        self.stats["created"] += len(changed.keys() - existing.keys())
+        self.stats["updated"] += len(changed.keys() & existing.keys())
+        self.stats["unchanged"] += len(items) - len(changed)
+        if changed:
+            self.write_goods(changed, hashes)
+
+    def write_goods(self, items, hashes):
+        Product.objects.bulk_create(
+            [
+                Product(id=item["id"], name=item["name"], category_id=item["category"])
+                for item in items.values()
+            ],
+            update_conflicts=True,
+            unique_fields=["id"],
+            update_fields=["name", "category"],
+        )
+
+        ProductInfo.objects.bulk_create(
+            [
+                ProductInfo(
+                    external_id=item["id"],
+                    product_id=item["id"],
+                    shop_id=self.shop.id,
+                    model=item["model"],
+                    quantity=item["quantity"],
+                    price=item["price"],
+                    price_rrc=item["price_rrc"],
+                    content_hash=hashes[external_id],
+                    is_active=True,
+                )
+                for external_id, item in items.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["shop", "external_id"],
+            update_fields=[
+                "product",
+                "model",
+                "quantity",
+                "price",
+                "price_rrc",
+                "content_hash",
+                "is_active",
+            ],
+        )
+        info_ids = dict(
+            ProductInfo.objects.filter(
+                shop_id=self.shop.id, external_id__in=items
+            ).values_list("external_id", "id")
+        )
+
+        self.write_parameters(items, info_ids)
+        refresh_search_index(info_ids.values())
+        self.refresh_baskets(info_ids.values())
+
+    def write_parameters(self, items, info_ids):
+        """
+        Перезаписывает параметры только тех товаров, у которых изменился
+        набор параметров: при смене цены или остатка строки не трогаются.
+        """
+        self.resolve_parameters(
+            {name for item in items.values() for name in item.get("parameters", {})}
+        )
+        wanted = {
+            info_ids[external_id]: {
+                (self.parameters[name], str(value))
+                for name, value in item.get("parameters", {}).items()
+            }
+            for external_id, item in items.items()
+        }
+        current = {info_id: set() for info_id in wanted}
+        for info_id, parameter_id, value in ProductParameter.objects.filter(
+            product_info_id__in=wanted
+        ).values_list("product_info_id", "parameter_id", "value"):
+            current[info_id].add((parameter_id, value))
+        changed = [
+            info_id
+            for info_id, parameters in wanted.items()
+            if parameters != current[info_id]
+        ]
+        if not changed:
+            return
+        raw_delete(ProductParameter.objects.filter(product_info_id__in=changed))
+        ProductParameter.objects.bulk_create(
+            [
+                ProductParameter(
+                    product_info_id=info_id, parameter_id=parameter_id, value=value
+                )
+                for info_id in changed
+                for parameter_id, value in wanted[info_id]
+            ],
+            batch_size=self.batch_size,
+        )
+
+    @staticmethod
+    def refresh_baskets(info_ids):
+        """
+        Цены в корзинах следуют за прайсом, размещенные заказы не меняются.
+        """
+        OrderItem.objects.filter(
+            order__status="basket", product_info_id__in=info_ids
+        ).snapshot_prices()
+        Order.objects.filter(
+            status="basket", ordered_items__product_info_id__in=info_ids
+        ).update_totals()
+
+    def remove_missing(self):
+        """
+        Снимает с продажи или удаляет товары магазина, которых нет в прайс-листе.
+        Товары, на которые есть позиции заказов, только снимаются с продажи.
+        """
+        if self.missing == "keep":
+            return
+        current = ProductInfo.objects.filter(shop_id=self.shop.id, is_active=True)
+        missing = [
+            external_id
+            for external_id in current.values_list("external_id", flat=True).iterator()
+            if external_id not in self.seen
+        ]
+        for batch in batched(missing, self.batch_size):
+            goods = ProductInfo.objects.filter(
+                shop_id=self.shop.id, external_id__in=batch
+            )
+            if self.missing == "delete":
+                # позиции заказов ссылаются на товар с CASCADE - товары из
+                # корзин и заказов не удаляем, а снимаем с продажи
+                ordered = Exists(
+                    OrderItem.objects.filter(product_info_id=OuterRef("pk"))
+                )
+                unordered = goods.filter(~ordered)
+                for model in (ProductParameter, ProductSearchIndex):
+                    raw_delete(model.objects.filter(product_info__in=unordered))
+                raw_delete(unordered)
+                goods = goods.filter(ordered)
+            goods.update(is_active=False)
+            ProductSearchIndex.objects.filter(
+                product_info__in=goods.values("id")
+            ).update(is_active=False)
+        self.stats["removed"] += len(missing)
+
+    def resolve_parameters(self, names):
+        """Заполняет кеш name -> id, создавая недостающие параметры одним запросом."""
+        missing = names - self.parameters.keys()
+        if not missing:
+            return
+        self.parameters.update(
+            Parameter.objects.filter(name__in=missing).values_list("name", "id")
+        )
+        missing -= self.parameters.keys()
+        if missing:
+            created = Parameter.objects.bulk_create(
+                [Parameter(name=name) for name in missing]
+            )
+            self.parameters.update(
+                (parameter.name, parameter.id) for parameter in created
+            )
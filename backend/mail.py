@@ -0,0 +1,184 @@
+"""
+Очередь исходящих писем.
+
+Во время запроса письмо только записывается в таблицу OutboxEmail, SMTP
+запрос не ждет. Периодическая задача send_outbox_emails_task забирает
+пачку готовых к отправке писем и отправляет их через одно соединение
+get_connection() с ограничением скорости. Неудачная отправка повторяется
+с экспоненциальной задержкой, после EMAIL_OUTBOX_MAX_ATTEMPTS попыток
+письмо остается в таблице со статусом dead.
+"""
+import smtplib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from backend.models import (
+    STATE_CHOICES,
+    ConfirmEmailToken,
+    CustomUser,
+    OutboxEmail,
+)
+
+
+# на сколько секунд пачка закрепляется за воркером; если он упадет,
+# не отправленные письма заберет следующий запуск
+OUTBOX_LEASE_SECONDS = 5 * 60
+SEND_ERRORS = (smtplib.SMTPException, OSError)
+
+
+def queue_email(subject, body, to, from_email=None):
+    """Записывает письмо в очередь, отправит его send_outbox"""
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=body,
+        to=list(to),
+        from_email=from_email or settings.EMAIL_HOST_USER or "",
+    )
+
+
+def queue_registration_email(user):
+    token, _ = ConfirmEmailToken.objects.get_or_create(user=user)
+    return queue_email(
+        f"Подтвердите регистранию по почте {user.email}",
+        f"Приветствуем {user.first_name}! Ваш токен для подтверждения регистрации: {token.key}",
+        [user.email],
+    )
+
+
+def queue_order_status_emails(events):
+    """Письма покупателям о смене статуса заказов, адреса одним запросом"""
+    emails = dict(
+        CustomUser.objects.filter(
+            id__in={event["user_id"] for event in events}
+        ).values_list("id", "email")
+    )
+    statuses = dict(STATE_CHOICES)
+    return OutboxEmail.objects.bulk_create(
+        OutboxEmail(
+            subject="Обновление статуса заказа",
+            body=f"Заказ №{event['order_id']}: {statuses[event['new_status']]}",
+            to=[emails[event["user_id"]]],
+            from_email=settings.EMAIL_HOST_USER or "",
+        )
+        for event in events
+        if event["user_id"] in emails
+    )
+
+
+def queue_password_reset_email(reset_password_token):
+    user = reset_password_token.user
+    return queue_email(
+        f"Сброс пароля для {user}",
+        f"Ваш токен для сброс пароля и создания нового: {reset_password_token.key}",
+        [user.email],
+    )
+
+
+def claim_batch(batch_size):
+    """
+    Выбирает готовые к отправке письма и откладывает их на время аренды,
+    чтобы параллельный запуск их не взял. Блокировка строк держится
+    только на время этой транзакции, а не всей отправки.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", send_after__lte=now)
+            .order_by("send_after", "id")[:batch_size]
+        )
+        OutboxEmail.objects.filter(id__in=[email.id for email in emails]).update(
+            send_after=now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+        )
+    return emails
+
+
+class Throttle:
+    """Не больше rate вызовов wait() в секунду, rate=0 - без ограничения"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = 0
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if now < self.next_at:
+            time.sleep(self.next_at - now)
+            now = self.next_at
+        self.next_at = now + self.interval
+
+
+def build_message(email, connection):
+    return EmailMultiAlternatives(
+        email.subject,
+        email.body,
+        email.from_email or None,
+        email.to,
+        connection=connection,
+    )
+
+
+def mark_failed(email, error, now):
+    email.attempts += 1
+    email.last_error = str(error) or error.__class__.__name__
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = "dead"
+        return "dead"
+    delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (email.attempts - 1)
+    email.send_after = now + timedelta(seconds=delay)
+    return "retried"
+
+
+def send_outbox(batch_size=None, rate=None):
+    """
+    Отправляет одну пачку писем через одно соединение.
+    Возвращает число отправленных, отложенных и не доставленных писем.
+    """
+    if batch_size is None:
+        batch_size = settings.EMAIL_OUTBOX_BATCH_SIZE
+    if rate is None:
+        rate = settings.EMAIL_OUTBOX_RATE
+    stats = {"sent": 0, "retried": 0, "dead": 0}
+    emails = claim_batch(batch_size)
+    if not emails:
+        return stats
+
+    throttle = Throttle(rate)
+    processed = []
+    connection = get_connection()
+    try:
+        connection.open()
+        for email in emails:
+            throttle.wait()
+            try:
+                connection.send_messages([build_message(email, connection)])
+            except Exception as error:
+                # любая ошибка одного письма не должна терять остальную пачку
+                stats[mark_failed(email, error, timezone.now())] += 1
+                processed.append(email)
+                if isinstance(error, SEND_ERRORS):
+                    # после ошибки SMTP сессия могла оборваться - открываем новую
+                    connection.close()
+                    connection.open()
+            else:
+                email.attempts += 1
+                email.status = "sent"
+                email.sent_at = timezone.now()
+                stats["sent"] += 1
+                processed.append(email)
+    except SEND_ERRORS:
+        # сервер недоступен: оставшиеся письма уйдут после окончания аренды
+        pass
+    finally:
+        connection.close()
+        OutboxEmail.objects.bulk_update(
+            processed, ["status", "attempts", "last_error", "send_after", "sent_at"]
+        )
+    return stats
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from backend.models import Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет цены позиций и суммы заказов пачками по диапазонам id. "
+        "Позициям без сохраненной цены проставляется текущая цена товара."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        last_id = Order.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+
+        total = 0
+        for start in range(0, last_id, batch_size):
+            orders = Order.objects.filter(id__gt=start, id__lte=start + batch_size)
+            with transaction.atomic():
+                OrderItem.objects.filter(
+                    order_id__gt=start, order_id__lte=start + batch_size, price=0
+                ).snapshot_prices()
+                total += orders.update_totals()
+            self.stdout.write(f"Обработано заказов: {total}")
+
+        self.stdout.write(self.style.SUCCESS(f"Готово, заказов: {total}"))
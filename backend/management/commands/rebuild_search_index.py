@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from backend.models import ProductInfo, ProductSearchIndex
+from backend.search import SEARCH_INDEX_BATCH_SIZE, refresh_search_index
+
+
+class Command(BaseCommand):
+    help = "Пересобирает поисковый индекс товаров пачками."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=SEARCH_INDEX_BATCH_SIZE)
+        parser.add_argument("--shop-id", type=int)
+
+    def handle(self, *args, **options):
+        queryset = ProductInfo.objects.order_by("id")
+        if options["shop_id"]:
+            queryset = queryset.filter(shop_id=options["shop_id"])
+
+        last_id, total = 0, 0
+        while True:
+            ids = list(
+                queryset.filter(id__gt=last_id).values_list("id", flat=True)[
+                    : options["batch_size"]
+                ]
+            )
+            if not ids:
+                break
+            refresh_search_index(ids)
+            last_id, total = ids[-1], total + len(ids)
+            self.stdout.write(f"Проиндексировано товаров: {total}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Готово, записей в индексе: {ProductSearchIndex.objects.count()}"
+            )
+        )
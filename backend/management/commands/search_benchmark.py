@@ -0,0 +1,70 @@
+import statistics
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+
+from backend.benchmark_data import seed
+from backend.models import ProductInfo, ProductSearchIndex
+from backend.search import search_products
+
+
+DEFAULT_QUERIES = ("iphone", "смартфон apple", "кабель белый", "накопитель 64")
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет время поиска (выдача и фасеты) на текущих данных "
+        "и завершается с ошибкой, если p95 выше порога. С --scale сначала "
+        "заполняет пустую базу генератором нагрузочных тестов "
+        "(1 - 1 млн товаров) и строит поисковый индекс."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("queries", nargs="*", default=DEFAULT_QUERIES)
+        parser.add_argument("--runs", type=int, default=50)
+        parser.add_argument("--threshold-ms", type=float, default=50.0)
+        parser.add_argument("--scale", type=float)
+
+    def handle(self, *args, **options):
+        if options["runs"] < 2:
+            raise CommandError("--runs должен быть не меньше 2")
+        if options["scale"] is not None:
+            self.seed(options["scale"])
+        self.stdout.write(
+            f"Записей в индексе: {ProductSearchIndex.objects.count()}, "
+            f"запусков на запрос: {options['runs']}"
+        )
+        worst = 0.0
+        for text in options["queries"]:
+            params = QueryDict(mutable=True)
+            params["q"] = text
+            search_products(params)
+
+            timings = []
+            for _ in range(options["runs"]):
+                started = time.perf_counter()
+                search_products(params)
+                timings.append((time.perf_counter() - started) * 1000)
+            p95 = statistics.quantiles(timings, n=20)[-1]
+            worst = max(worst, p95)
+            self.stdout.write(
+                f"{text!r}: p50={statistics.median(timings):.1f} ms, "
+                f"p95={p95:.1f} ms, max={max(timings):.1f} ms"
+            )
+
+        if worst > options["threshold_ms"]:
+            raise CommandError(
+                f"p95 {worst:.1f} ms выше порога {options['threshold_ms']} ms"
+            )
+        self.stdout.write(self.style.SUCCESS("Порог по времени поиска соблюден"))
+
+    def seed(self, scale):
+        if scale <= 0:
+            raise CommandError("--scale должен быть больше 0")
+        if ProductInfo.objects.exists():
+            raise CommandError("--scale заполняет только пустую базу")
+        size = seed(scale)["size"]
+        self.stdout.write(f"Создано товаров магазинов: {size['product_infos']}")
+        call_command("rebuild_search_index", stdout=self.stdout)
@@ -0,0 +1,152 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+current_request = ContextVar("current_request_metrics", default=None)
+
+
+class RequestMetrics:
+    """Замеры одного запроса: SQL-запросы, время БД и сериализации."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.sql_time = 0.0
+        self.serialization_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper для подключений к БД."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.sql_time += duration
+            self.queries.append((sql, duration))
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+@contextmanager
+def serialization_timer():
+    """Учитывает время сериализации ответа в метриках текущего запроса."""
+    metrics = current_request.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.serialization_time += time.perf_counter() - start
+
+
+class Histogram:
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        counts, total = self.series.get(labels, ([0] * (len(self.buckets) + 1), 0))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.series[labels] = (counts, total + value)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for labels, (counts, total) in sorted(self.series.items()):
+            label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Гистограммы запросов в памяти процесса в текстовом формате Prometheus.
+    Каждый воркер gunicorn отдает свои значения, суммирует их Prometheus.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {
+            "duration": Histogram(
+                "http_request_duration_seconds",
+                "Время обработки запроса",
+                SECONDS_BUCKETS,
+            ),
+            "queries": Histogram(
+                "http_request_db_queries", "Число SQL-запросов", QUERY_BUCKETS
+            ),
+            "sql_time": Histogram(
+                "http_request_db_duration_seconds",
+                "Время выполнения SQL-запросов",
+                SECONDS_BUCKETS,
+            ),
+            "serialization_time": Histogram(
+                "http_request_serialization_seconds",
+                "Время сериализации ответа",
+                SECONDS_BUCKETS,
+            ),
+            "size": Histogram(
+                "http_response_size_bytes", "Размер ответа", SIZE_BUCKETS
+            ),
+        }
+
+    def observe(self, view, method, status, values):
+        labels = (("method", method), ("status", str(status)), ("view", view))
+        with self.lock:
+            for name, value in values.items():
+                self.histograms[name].observe(labels, value)
+
+    def render(self):
+        with self.lock:
+            lines = [
+                line
+                for histogram in self.histograms.values()
+                for line in histogram.render()
+            ]
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self.lock:
+            for histogram in self.histograms.values():
+                histogram.series.clear()
+
+
+def render_cache_stats(stats):
+    """Счетчики кеша каталога (get_cache_stats) в формате Prometheus."""
+    lines = []
+    for name in ("hits", "misses", "invalidations"):
+        lines.append(f"# TYPE catalog_cache_{name}_total counter")
+        lines.append(f"catalog_cache_{name}_total {stats[name]}")
+    return "\n".join(lines) + "\n"
+
+
+def render_auth_cache_stats(stats):
+    """Счетчики кеша токенов этого процесса (auth_cache.get_stats)."""
+    lines = []
+    for name in ("local_hits", "redis_hits", "misses", "invalidations"):
+        lines.append(f"# TYPE auth_cache_{name}_total counter")
+        lines.append(f"auth_cache_{name}_total {stats[name]}")
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
@@ -0,0 +1,220 @@
+import hashlib
+import logging
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from redis.exceptions import RedisError
+
+from backend.metrics import RequestMetrics, current_request, registry
+from backend.routers import replica_reads
+
+
+logger = logging.getLogger("backend.metrics")
+
+
+def get_view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unknown"
+    view_class = getattr(match.func, "view_class", None)
+    return view_class.__name__ if view_class else match.view_name
+
+
+class RequestMetricsMiddleware:
+    """
+    Считает для каждого запроса число SQL-запросов, время БД, сериализации
+    и размер ответа. Отдает их в заголовке Server-Timing, копит гистограммы
+    для /metrics и пишет в лог все запросы к БД для медленных ответов.
+    Работает и под WSGI, и под ASGI без перехода в поток.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            with self.wrap_connections(metrics):
+                response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        # Соединения с БД привязаны к потоку, в котором sync_to_async
+        # выполняет запросы ORM, поэтому обертка ставится в этом же потоке.
+        stack = await sync_to_async(self.wrap_connections)(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            current_request.reset(token)
+        return self.finish(request, response, metrics)
+
+    @staticmethod
+    def wrap_connections(metrics):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics))
+        return stack
+
+    def finish(self, request, response, metrics):
+        response["Server-Timing"] = ", ".join(
+            (
+                f'db;dur={metrics.sql_time * 1000:.1f};desc="queries={len(metrics.queries)}"',
+                f"serialize;dur={metrics.serialization_time * 1000:.1f}",
+                f"total;dur={metrics.elapsed * 1000:.1f}",
+            )
+        )
+        if not response.streaming:
+            self.observe(request, response, metrics, len(response.content))
+        elif getattr(response, "is_async", False):
+            self.observe(request, response, metrics, 0)
+        else:
+            # потоковый ответ выполняет запросы к БД уже после выхода из
+            # middleware, поэтому замер заканчивается вместе с потоком;
+            # Server-Timing при этом описывает только время до первого байта
+            response.streaming_content = self.measure_stream(
+                request, response, metrics, response.streaming_content
+            )
+        return response
+
+    def measure_stream(self, request, response, metrics, content):
+        size = 0
+        try:
+            with self.wrap_connections(metrics):
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self.observe(request, response, metrics, size)
+
+    @staticmethod
+    def observe(request, response, metrics, size):
+        elapsed = metrics.elapsed
+        view = get_view_name(request)
+        registry.observe(
+            view,
+            request.method,
+            response.status_code,
+            {
+                "duration": elapsed,
+                "queries": len(metrics.queries),
+                "sql_time": metrics.sql_time,
+                "serialization_time": metrics.serialization_time,
+                "size": size,
+            },
+        )
+        if (
+            len(metrics.queries) > settings.SLOW_REQUEST_QUERIES
+            or elapsed * 1000 > settings.SLOW_REQUEST_MS
+        ):
+            logger.warning(
+                "Медленный запрос %s %s (%s): %.1f мс, %d SQL-запросов\n%s",
+                request.method,
+                request.path,
+                view,
+                elapsed * 1000,
+                len(metrics.queries),
+                "\n".join(
+                    f"{duration * 1000:.1f} мс: {sql}"
+                    for sql, duration in metrics.queries
+                ),
+            )
+
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def client_key(request):
+    """Клиент определяется по токену, для анонимных запросов - по IP."""
+    authorization = request.META.get("HTTP_AUTHORIZATION")
+    if authorization:
+        client = hashlib.sha1(authorization.encode()).hexdigest()
+    else:
+        client = request.META.get("REMOTE_ADDR", "")
+    return f"db:primary:{client}"
+
+
+class ReplicaRoutingMiddleware:
+    """
+    GET к представлениям с read_from_replica = True (атрибут класса или
+    функции) читают с реплик.
+    После изменяющего запроса клиент REPLICA_STICKY_SECONDS секунд читает
+    с основной базы, чтобы видеть свои изменения несмотря на отставание реплик.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = replica_reads.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS:
+            try:
+                cache.set(client_key(request), True, settings.REPLICA_STICKY_SECONDS)
+            except RedisError:
+                # изменение уже закоммичено, ответ не должен стать ошибкой;
+                # без Redis чтения и так идут с основной базы (см. sticky)
+                pass
+        return response
+
+    async def __acall__(self, request):
+        token = replica_reads.set(False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS:
+            try:
+                await cache.aset(
+                    client_key(request), True, settings.REPLICA_STICKY_SECONDS
+                )
+            except RedisError:
+                pass
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method in SAFE_METHODS
+            and getattr(
+                getattr(view_func, "view_class", view_func), "read_from_replica", False
+            )
+            and not self.sticky(request)
+        ):
+            replica_reads.set(True)
+
+    @staticmethod
+    def sticky(request):
+        """
+        Читает ли клиент с основной базы после своего изменения.
+        Без Redis это неизвестно, поэтому чтение идет с основной базы.
+        """
+        try:
+            return bool(cache.get(client_key(request)))
+        except RedisError:
+            return True
@@ -1,4 +1,9 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connections, models, router
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import BaseUserManager, AbstractUser
@@ -15,6 +20,33 @@ STATE_CHOICES = (
     ("delivered", "Доставлен"),
     ("canceled", "Отменен"),
 )
+# статус заказа -> статусы, из которых в него можно перейти
+ORDER_TRANSITIONS = {
+    "new": ("basket",),
+    "confirmed": ("new",),
+    "assembled": ("confirmed",),
+    "sent": ("assembled",),
+    "delivered": ("sent",),
+    "canceled": ("new", "confirmed"),
+}
+IMPORT_STATUS_CHOICES = (
+    ("pending", "В очереди"),
+    ("fetching", "Загрузка файла"),
+    ("importing", "Импорт товаров"),
+    ("done", "Завершен"),
+    ("failed", "Ошибка"),
+)
+FEED_FORMAT_CHOICES = (("yaml", "YAML"), ("jsonl", "JSON Lines"), ("csv", "CSV"))
+MISSING_GOODS_CHOICES = (
+    ("keep", "Оставить"),
+    ("deactivate", "Снять с продажи"),
+    ("delete", "Удалить"),
+)
+EMAIL_STATUS_CHOICES = (
+    ("pending", "Ожидает отправки"),
+    ("sent", "Отправлено"),
+    ("dead", "Не доставлено"),
+)
 
 
 class CustomAccountManager(BaseUserManager):
@@ -77,6 +109,11 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.email
 
+    @cached_property
+    def shop_id(self):
+        """id магазина пользователя, CachedTokenAuthentication берет его из кеша"""
+        return Shop.objects.filter(user_id=self.id).values_list("id", flat=True).first()
+
     class Meta:
         verbose_name = "Пользователь"
         verbose_name_plural = "Список пользователей"
@@ -154,8 +191,14 @@ class ProductInfo(models.Model):
     product = models.ForeignKey(
         Product, related_name="products_info", blank=True, on_delete=models.CASCADE
     )
+    # отдельный индекс не нужен: shop - первый столбец unique_shop_external_id
+    # и productinfo_shop_product
     shop = models.ForeignKey(
-        Shop, related_name="products_info", blank=True, on_delete=models.CASCADE
+        Shop,
+        related_name="products_info",
+        blank=True,
+        on_delete=models.CASCADE,
+        db_index=False,
     )
     description = models.TextField(blank=True)
     image = models.ImageField(
@@ -164,10 +207,58 @@ class ProductInfo(models.Model):
     quantity = models.PositiveIntegerField(verbose_name="Колличество")
     price = models.PositiveIntegerField(verbose_name="Цена")
     price_rrc = models.PositiveIntegerField(verbose_name="Рекомендуемая розничная цена")
+    content_hash = models.CharField(
+        max_length=40, blank=True, verbose_name="Отпечаток данных из прайс-листа"
+    )
+    is_active = models.BooleanField(default=True, verbose_name="В продаже")
 
     class Meta:
         verbose_name = "Информация о товаре"
         verbose_name_plural = "Список атрибутов продукта"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["shop", "external_id"], name="unique_shop_external_id"
+            ),
+        ]
+        indexes = [
+            # каталог магазина с фильтром по категории (через product)
+            models.Index(fields=["shop", "product"], name="productinfo_shop_product"),
+            # keyset-пагинация каталога по цене среди товаров в продаже
+            models.Index(
+                fields=["price", "id"],
+                condition=models.Q(is_active=True),
+                name="productinfo_active_price_id",
+            ),
+        ]
+
+
+class ProductSearchIndex(models.Model):
+    """Денормализованная запись для полнотекстового поиска по товару магазина."""
+
+    product_info = models.OneToOneField(
+        ProductInfo,
+        primary_key=True,
+        related_name="search_index",
+        on_delete=models.CASCADE,
+    )
+    shop = models.ForeignKey(
+        Shop, related_name="search_index", on_delete=models.CASCADE
+    )
+    category = models.ForeignKey(
+        Category, related_name="search_index", on_delete=models.CASCADE
+    )
+    name = models.CharField(max_length=100, blank=True)
+    model = models.CharField(max_length=90, blank=True)
+    category_name = models.CharField(max_length=70, blank=True)
+    parameters = models.TextField(blank=True)
+    price = models.PositiveIntegerField()
+    is_active = models.BooleanField(default=True)
+    search_vector = SearchVectorField(null=True)
+
+    class Meta:
+        verbose_name = "Поисковый индекс товара"
+        verbose_name_plural = "Поисковый индекс товаров"
+        indexes = [GinIndex(fields=["search_vector"], name="product_search_vector")]
 
 
 class Parameter(models.Model):
@@ -178,29 +269,43 @@ class Parameter(models.Model):
     class Meta:
         verbose_name = "Название параметра"
         verbose_name_plural = "Список названия параметров"
+        indexes = [models.Index(fields=["name"], name="parameter_name")]
 
     def __str__(self):
         return self.name
 
 
 class ProductParameter(models.Model):
+    # внешние ключи покрыты составными индексами из Meta
     product_info = models.ForeignKey(
         ProductInfo,
         verbose_name="Информация о продуктe",
         related_name="product_param",
         on_delete=models.CASCADE,
+        db_index=False,
     )
     parameter = models.ForeignKey(
         Parameter,
         verbose_name="Параметр",
         related_name="product_param",
         on_delete=models.CASCADE,
+        db_index=False,
     )
     value = models.CharField(verbose_name="Колличество", null=False, blank=False)
 
     class Meta:
         verbose_name = "Параметр"
         verbose_name_plural = "Список параметров"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product_info", "parameter"],
+                name="unique_product_info_parameter",
+            ),
+        ]
+        indexes = [
+            # фильтр каталога parameter=Название:значение
+            models.Index(fields=["parameter", "value"], name="productparam_value"),
+        ]
 
 
 class Contact(models.Model):
@@ -228,7 +333,54 @@ class Contact(models.Model):
         return f"{self.city} {self.street} {self.house}"
 
 
+class OrderQuerySet(models.QuerySet):
+    def update_totals(self):
+        """Пересчитывает сумму заказов одним UPDATE по ценам, сохраненным в позициях."""
+        totals = (
+            OrderItem.objects.filter(order=models.OuterRef("pk"))
+            .values("order")
+            .annotate(total=models.Sum(models.F("quantity") * models.F("price")))
+            .values("total")
+        )
+        return self.update(total=Coalesce(models.Subquery(totals), 0))
+
+    def transition(self, status):
+        """
+        Переводит заказы в status одним UPDATE: меняются только те, что сейчас
+        в одном из допустимых предшествующих статусов. Вызывается в транзакции.
+        Возвращает [(id, id покупателя, прежний статус)] измененных заказов.
+        """
+        if status not in ORDER_TRANSITIONS:
+            raise ValueError(f"Неизвестный статус заказа: {status}")
+        db = router.db_for_write(self.model)
+        changed = (
+            self.using(db)
+            .filter(status__in=ORDER_TRANSITIONS[status])
+            .select_for_update()
+            .values("id", "user_id", "status")
+        )
+        sql, params = changed.query.get_compiler(using=db).as_sql()
+        table = connections[db].ops.quote_name(self.model._meta.db_table)
+        with connections[db].cursor() as cursor:
+            cursor.execute(
+                f"WITH changed AS ({sql}) "
+                f'UPDATE {table} SET "status" = %s FROM changed '
+                f'WHERE {table}."id" = changed."id" '
+                f'RETURNING {table}."id", {table}."user_id", changed."status"',
+                (*params, status),
+            )
+            return cursor.fetchall()
+
+
+class OrderItemQuerySet(models.QuerySet):
+    def snapshot_prices(self):
+        """Записывает в позиции текущую цену товара одним UPDATE."""
+        prices = ProductInfo.objects.filter(pk=models.OuterRef("product_info_id"))
+        return self.update(price=models.Subquery(prices.values("price")[:1]))
+
+
 class Order(models.Model):
+    # отдельный индекс не нужен: user - первый столбец order_user_status
     user = models.ForeignKey(
         CustomUser,
         verbose_name="Пользователь",
@@ -236,6 +388,7 @@ class Order(models.Model):
         blank=True,
         null=False,
         on_delete=models.CASCADE,
+        db_index=False,
     )
     dt = models.DateTimeField(auto_now_add=True)
     status = models.CharField(choices=STATE_CHOICES, verbose_name="Статус", blank=True)
@@ -246,19 +399,53 @@ class Order(models.Model):
         null=True,
         on_delete=models.CASCADE,
     )
+    total = models.PositiveIntegerField(default=0, verbose_name="Сумма заказа")
+    reserved_until = models.DateTimeField(
+        null=True, blank=True, verbose_name="Резерв товаров до"
+    )
+
+    objects = OrderQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Список заказов"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user"],
+                condition=models.Q(status="basket"),
+                name="unique_user_basket",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["user", "status"], name="order_user_status"),
+            # лента заказов магазина по дате
+            models.Index(fields=["-dt", "-id"], name="order_dt_id"),
+            # поиск просроченных резервов
+            models.Index(
+                fields=["reserved_until"],
+                condition=models.Q(status="new"),
+                name="order_new_reserved_until",
+            ),
+        ]
+
+    def can_transition(self, status):
+        return self.status in ORDER_TRANSITIONS.get(status, ())
+
+    def refresh_prices(self):
+        """Подтягивает в позиции корзины текущие цены и пересчитывает сумму."""
+        OrderItem.objects.filter(order_id=self.id).snapshot_prices()
+        Order.objects.filter(id=self.id).update_totals()
 
 
 class OrderItem(models.Model):
+    # внешние ключи покрыты составными индексами из Meta
     order = models.ForeignKey(
         Order,
         verbose_name="Заказ",
         related_name="ordered_items",
         blank=True,
         on_delete=models.CASCADE,
+        db_index=False,
     )
     product_info = models.ForeignKey(
         ProductInfo,
@@ -266,16 +453,80 @@ class OrderItem(models.Model):
         related_name="ordered_items",
         blank=True,
         on_delete=models.CASCADE,
+        db_index=False,
     )
 
     quantity = models.PositiveIntegerField(
         verbose_name="Колличество",
         blank=True,
     )
+    price = models.PositiveIntegerField(default=0, verbose_name="Цена на момент заказа")
+
+    objects = OrderItemQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Список заказов"
+        constraints = [
+            # покрывающий: сумма заказа считается только по индексу
+            models.UniqueConstraint(
+                fields=["order", "product_info"],
+                include=["quantity", "price"],
+                name="unique_order_product_info",
+            ),
+        ]
+        indexes = [
+            # позиции магазина в ленте заказов поставщика
+            models.Index(
+                fields=["product_info"],
+                include=["order", "quantity", "price"],
+                name="orderitem_info_covering",
+            ),
+        ]
+
+
+class OrderEvent(models.Model):
+    """
+    Смена статуса заказа. Пишется в той же транзакции, что и сам переход,
+    после коммита relay_order_events передает события в Celery.
+    """
+
+    order = models.ForeignKey(
+        Order,
+        verbose_name="Заказ",
+        related_name="events",
+        on_delete=models.CASCADE,
+    )
+    user = models.ForeignKey(
+        CustomUser,
+        verbose_name="Покупатель",
+        related_name="order_events",
+        on_delete=models.CASCADE,
+    )
+    old_status = models.CharField(
+        choices=STATE_CHOICES, max_length=15, verbose_name="Прежний статус"
+    )
+    new_status = models.CharField(
+        choices=STATE_CHOICES, max_length=15, verbose_name="Новый статус"
+    )
+    shop_ids = models.JSONField(default=list, verbose_name="Магазины")
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Событие заказа"
+        verbose_name_plural = "События заказов"
+        indexes = [
+            # очередь неопубликованных событий
+            models.Index(
+                fields=["id"],
+                condition=models.Q(published_at__isnull=True),
+                name="orderevent_unpublished",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.order_id}: {self.old_status} -> {self.new_status}"
 
 
 class ConfirmEmailToken(models.Model):
@@ -307,3 +558,91 @@ class ConfirmEmailToken(models.Model):
 
     def __str__(self):
         return "Password reset token for user {user}".format(user=self.user)
+
+
+class ImportJob(models.Model):
+    user = models.ForeignKey(
+        CustomUser,
+        verbose_name="Пользователь",
+        related_name="import_jobs",
+        on_delete=models.CASCADE,
+    )
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name="Магазин",
+        related_name="import_jobs",
+        blank=True,
+        null=True,
+        on_delete=models.CASCADE,
+    )
+    url = models.URLField(max_length=500, verbose_name="Ссылка на прайс-лист")
+    feed = models.FileField(upload_to="imports/", blank=True)
+    format = models.CharField(
+        choices=FEED_FORMAT_CHOICES,
+        max_length=5,
+        default="yaml",
+        verbose_name="Формат прайс-листа",
+    )
+    task_id = models.CharField(max_length=36, blank=True)
+    force = models.BooleanField(default=False, verbose_name="Перезаписать все товары")
+    missing = models.CharField(
+        choices=MISSING_GOODS_CHOICES,
+        max_length=10,
+        default="keep",
+        verbose_name="Товары, которых нет в прайс-листе",
+    )
+    status = models.CharField(
+        choices=IMPORT_STATUS_CHOICES,
+        max_length=10,
+        default="pending",
+        verbose_name="Статус",
+    )
+    rows_processed = models.PositiveIntegerField(default=0)
+    stats = models.JSONField(default=dict, blank=True)
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Загрузка прайс-листа"
+        verbose_name_plural = "Список загрузок прайс-листов"
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return f"{self.url} ({self.status})"
+
+
+class OutboxEmail(models.Model):
+    """Письмо, записанное в запросе и отправляемое периодической задачей"""
+
+    subject = models.CharField(max_length=255, verbose_name="Тема")
+    body = models.TextField(verbose_name="Текст")
+    from_email = models.CharField(max_length=254, blank=True)
+    to = models.JSONField(default=list, verbose_name="Получатели")
+    status = models.CharField(
+        choices=EMAIL_STATUS_CHOICES,
+        max_length=10,
+        default="pending",
+        verbose_name="Статус",
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    send_after = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Письмо в очереди"
+        verbose_name_plural = "Очередь писем"
+        indexes = [
+            # выборка очередной пачки к отправке
+            models.Index(
+                fields=["send_after", "id"],
+                condition=models.Q(status="pending"),
+                name="outboxemail_pending",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} ({self.status})"
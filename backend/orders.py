@@ -0,0 +1,183 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from backend.cache import bump_catalog_generation
+from backend.events import record_order_events
+from backend.models import ORDER_TRANSITIONS, Order, OrderItem, ProductInfo
+
+
+CANCELABLE_STATUSES = ORDER_TRANSITIONS["canceled"]
+# статусы, в которые магазин переводит свои заказы; отмена возвращает
+# товары на склад и идет через release_orders
+PARTNER_STATUSES = ("confirmed", "assembled", "sent", "delivered")
+TRANSITION_MAX_ORDERS = 10_000
+
+
+class CheckoutError(ValueError):
+    pass
+
+
+class InsufficientStock(CheckoutError):
+    pass
+
+
+def lock_goods(quantities):
+    """
+    Блокирует строки товаров FOR UPDATE всегда в порядке id, поэтому
+    параллельные оформления одних и тех же товаров не попадают в deadlock.
+    """
+    return list(
+        ProductInfo.objects.select_for_update()
+        .filter(id__in=quantities)
+        .order_by("id")
+        .only("id", "shop_id", "quantity", "is_active")
+    )
+
+
+def order_quantities(order_ids):
+    return dict(
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values("product_info_id")
+        .annotate(total=Sum("quantity"))
+        .values_list("product_info_id", "total")
+    )
+
+
+def change_stock(goods, quantities, sign):
+    """
+    Меняет остатки на складе. Кеш каталога сбрасывается, только если товар
+    закончился или снова появился: иначе каждое оформление и отмена заказа
+    сбрасывали бы весь кеш. Точный остаток в закешированном каталоге может
+    отставать до CATALOG_CACHE_TIMEOUT, при оформлении он проверяется по БД.
+    """
+    shop_ids = set()
+    for info in goods:
+        in_stock = info.quantity > 0
+        info.quantity += sign * quantities[info.id]
+        if in_stock != (info.quantity > 0):
+            shop_ids.add(info.shop_id)
+    ProductInfo.objects.bulk_update(goods, ["quantity"])
+    if shop_ids:
+        transaction.on_commit(lambda: bump_catalog_generation(shop_ids))
+
+
+def checkout(user_id, order_id, contact_id):
+    """
+    Размещает корзину: резервирует товары на складе, фиксирует цены и сумму.
+    Если какого-то товара не хватает, не меняется ничего.
+    """
+    with transaction.atomic():
+        order = (
+            Order.objects.select_for_update()
+            .filter(user_id=user_id, id=order_id, status="basket")
+            .first()
+        )
+        if order is None:
+            raise CheckoutError("Корзина не найдена")
+        quantities = order_quantities([order.id])
+        if not quantities:
+            raise CheckoutError("Корзина пуста")
+
+        goods = lock_goods(quantities)
+        errors = {
+            info.id: "Товар не продается"
+            if not info.is_active
+            else f"На складе {info.quantity} шт."
+            for info in goods
+            if not info.is_active or info.quantity < quantities[info.id]
+        }
+        errors.update(
+            {
+                info_id: "Товар не найден"
+                for info_id in set(quantities) - {info.id for info in goods}
+            }
+        )
+        if errors:
+            raise InsufficientStock(errors)
+
+        change_stock(goods, quantities, -1)
+        OrderItem.objects.filter(order_id=order.id).snapshot_prices()
+        orders = Order.objects.filter(id=order.id)
+        orders.update_totals()
+        orders.update(
+            contact_id=contact_id,
+            status="new",
+            reserved_until=timezone.now()
+            + timedelta(seconds=settings.ORDER_RESERVATION_TIMEOUT),
+        )
+        record_order_events(
+            [(order.id, order.user_id, "basket")],
+            "new",
+            {order.id: sorted({info.shop_id for info in goods})},
+        )
+    return order
+
+
+def release_orders(orders):
+    """
+    Отменяет заказы и возвращает их товары на склад.
+    orders - queryset, строки заказов блокируются, занятые другими
+    транзакциями пропускаются. Возвращает id отмененных заказов.
+    """
+    with transaction.atomic():
+        transitions = list(
+            orders.filter(status__in=CANCELABLE_STATUSES)
+            .select_for_update(skip_locked=True)
+            .order_by("id")
+            .values_list("id", "user_id", "status")
+        )
+        if not transitions:
+            return []
+        order_ids = [order_id for order_id, _, _ in transitions]
+        quantities = order_quantities(order_ids)
+        change_stock(lock_goods(quantities), quantities, 1)
+        Order.objects.filter(id__in=order_ids).update(
+            status="canceled", reserved_until=None
+        )
+        record_order_events(transitions, "canceled")
+    return order_ids
+
+
+def release_expired_reservations():
+    return release_orders(
+        Order.objects.filter(status="new", reserved_until__lt=timezone.now())
+    )
+
+
+def transition_orders(orders, order_ids, status):
+    """
+    Переводит заказы order_ids из queryset orders в status одним UPDATE
+    и пишет события в той же транзакции. Возвращает результат по каждому id.
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    orders = orders.using(router.db_for_write(Order))
+    with transaction.atomic(using=orders.db):
+        changed = orders.filter(id__in=order_ids).transition(status)
+        record_order_events(changed, status)
+    previous = {order_id: old_status for order_id, _, old_status in changed}
+    missing = [order_id for order_id in order_ids if order_id not in previous]
+    current = dict(orders.filter(id__in=missing).values_list("id", "status"))
+
+    results = []
+    for order_id in order_ids:
+        if order_id in previous:
+            results.append(
+                {"id": order_id, "Status": True, "old_status": previous[order_id]}
+            )
+        elif order_id in current:
+            results.append(
+                {
+                    "id": order_id,
+                    "Status": False,
+                    "Error": f"Нельзя перевести заказ из статуса {current[order_id]} в {status}",
+                }
+            )
+        else:
+            results.append(
+                {"id": order_id, "Status": False, "Error": "Заказ не найден"}
+            )
+    return results
@@ -0,0 +1,136 @@
+import base64
+import binascii
+from datetime import datetime, timedelta, timezone
+
+import ujson
+from django.db.models import Q
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(ujson.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        values = ujson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError) as error:
+        raise PaginationError("Неверный курсор") from error
+    if not isinstance(values, list) or not all(
+        isinstance(value, int) for value in values
+    ):
+        raise PaginationError("Неверный курсор")
+    return values
+
+
+class KeysetPagination:
+    """
+    Постраничная выдача по ключу (keyset): следующая страница выбирается
+    условием "после последней записи", а не OFFSET, поэтому любая страница
+    стоит столько же, сколько первая. Поля сортировки должны быть уникальны
+    в совокупности, поэтому последним всегда идет id.
+    """
+
+    orderings = {
+        "id": ("id",),
+        "-id": ("-id",),
+        "price": ("price", "id"),
+        "-price": ("-price", "-id"),
+    }
+    default_ordering = "id"
+    default_limit = 50
+    max_limit = 500
+
+    def __init__(self, query_params):
+        self.ordering = query_params.get("ordering", self.default_ordering)
+        if self.ordering not in self.orderings:
+            raise PaginationError(f"Доступные сортировки: {', '.join(self.orderings)}")
+        self.fields = self.orderings[self.ordering]
+
+        limit = query_params.get("limit", str(self.default_limit))
+        if not limit.isdigit() or not 0 < int(limit) <= self.max_limit:
+            raise PaginationError(f"limit должен быть от 1 до {self.max_limit}")
+        self.limit = int(limit)
+
+        cursor = query_params.get("cursor")
+        self.position = decode_cursor(cursor) if cursor else None
+        if self.position is not None and len(self.position) != len(self.fields):
+            raise PaginationError("Курсор не подходит для выбранной сортировки")
+
+    def after_position(self):
+        """
+        Условие (a, b) > (x, y) в виде a >= x AND (a > x OR (a = x AND b > y)).
+        Первое слагаемое избыточно, но только его планировщик может отдать
+        индексу как Index Cond: без него индекс читается с начала, а строки
+        до курсора отбрасываются фильтром.
+        """
+        query = Q()
+        equal = {}
+        for field, value in zip(self.fields, self.position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            query |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        if len(self.fields) > 1:
+            first = self.fields[0]
+            lookup = "lte" if first.startswith("-") else "gte"
+            query &= Q(**{f"{first.lstrip('-')}__{lookup}": self.position[0]})
+        return query
+
+    def ordered(self, queryset):
+        """Все записи после курсора в порядке сортировки, без limit."""
+        queryset = queryset.order_by(*self.fields)
+        if self.position is not None:
+            queryset = queryset.filter(self.after_position())
+        return queryset
+
+    def paginate(self, queryset):
+        """Возвращает queryset страницы (limit + 1 строка для проверки продолжения)."""
+        return self.ordered(queryset)[: self.limit + 1]
+
+    def get_page(self, rows, key):
+        """
+        Отрезает лишнюю строку и строит курсор следующей страницы.
+        key возвращает значения полей сортировки для строки.
+        """
+        rows = list(rows)
+        if len(rows) <= self.limit:
+            return rows, None
+        rows = rows[: self.limit]
+        return rows, encode_cursor(
+            [key(rows[-1], field.lstrip("-")) for field in self.fields]
+        )
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class OrderFeedPagination(KeysetPagination):
+    """Лента заказов по дате. В курсоре время хранится в микросекундах."""
+
+    orderings = {
+        "-dt": ("-dt", "-id"),
+        "dt": ("dt", "id"),
+    }
+    default_ordering = "-dt"
+    default_limit = 20
+    max_limit = 100
+
+    def __init__(self, query_params):
+        super().__init__(query_params)
+        if self.position is not None:
+            try:
+                self.position[0] = EPOCH + self.position[0] * MICROSECOND
+            except OverflowError as error:
+                raise PaginationError("Неверный курсор") from error
+
+    @staticmethod
+    def cursor_value(order, field):
+        value = getattr(order, field)
+        if isinstance(value, datetime):
+            return (value - EPOCH) // MICROSECOND
+        return value
@@ -0,0 +1,159 @@
+"""
+Быстрая сериализация горячих списков только для чтения.
+
+Строки читаются через values(), по одному запросу на таблицу, и сразу
+собираются в словари. Результат совпадает с ProductInfoSerializer и
+OrderSerializer, но без полей DRF и моделей на каждый объект.
+Запросы отдаются отдельно от сборки, чтобы асинхронные представления
+могли читать те же строки через aiterator.
+"""
+from rest_framework.fields import DateTimeField
+
+from backend.models import Contact, OrderItem, ProductInfo, ProductParameter
+from backend.serializers import ContactSerializer, ProductInfoSerializer
+from backend.thumbnails import thumbnail_urls
+
+
+PRODUCT_INFO_VALUES = (
+    "id",
+    "model",
+    "product_id",
+    "product__name",
+    "product__category__name",
+    "shop_id",
+    "quantity",
+    "image",
+    "price",
+    "price_rrc",
+)
+ORDER_VALUES = ("id", "status", "dt", "total", "contact_id")
+ORDER_ITEM_VALUES = (
+    "id",
+    "order_id",
+    "product_info_id",
+    "quantity",
+    "price",
+    *(f"product_info__{field}" for field in PRODUCT_INFO_VALUES),
+)
+CONTACT_FIELDS = tuple(
+    field for field in ContactSerializer.Meta.fields if field != "user"
+)
+PRODUCT_INFO_FIELDS = ProductInfoSerializer.Meta.fields
+
+datetime_field = DateTimeField()
+image_storage = ProductInfo._meta.get_field("image").storage
+
+
+def product_info_values(queryset):
+    return queryset.values(*PRODUCT_INFO_VALUES)
+
+
+def parameter_values(product_info_ids):
+    return (
+        ProductParameter.objects.filter(product_info_id__in=product_info_ids)
+        .order_by("id")
+        .values("product_info_id", "parameter__name", "value")
+    )
+
+
+def order_item_values(order_ids):
+    return (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .order_by("id")
+        .values(*ORDER_ITEM_VALUES)
+    )
+
+
+def contact_values(contact_ids):
+    return Contact.objects.filter(id__in=contact_ids).values(*CONTACT_FIELDS)
+
+
+def item_product_infos(items):
+    """Строки товаров, прочитанные вместе с позициями order_item_values()."""
+    return {
+        item["product_info_id"]: {
+            field: item[f"product_info__{field}"] for field in PRODUCT_INFO_VALUES
+        }
+        for item in items
+    }
+
+
+def group_parameters(rows):
+    parameters = {}
+    for row in rows:
+        parameters.setdefault(row["product_info_id"], []).append(
+            {"parameter": row["parameter__name"], "value": row["value"]}
+        )
+    return parameters
+
+
+def format_product_info(row, parameters, fields=PRODUCT_INFO_FIELDS):
+    """Строка product_info_values() в формате ProductInfoSerializer."""
+    data = {
+        "id": row["id"],
+        "model": row["model"],
+        "product": {
+            "category": row["product__category__name"],
+            "name": row["product__name"],
+            "id": row["product_id"],
+        },
+        "shop": row["shop_id"],
+        "quantity": row["quantity"],
+        "image": image_storage.url(row["image"]) if row["image"] else None,
+        "thumbnails": thumbnail_urls(row["image"]),
+        "price": row["price"],
+        "price_rrc": row["price_rrc"],
+        "product_parameters": parameters.get(row["id"], []),
+    }
+    return {field: data[field] for field in fields}
+
+
+def format_orders(orders, items, product_infos, contacts):
+    """Строки заказов, позиций и контактов в формате OrderSerializer."""
+    ordered_items = {}
+    for item in items:
+        ordered_items.setdefault(item["order_id"], []).append(
+            {
+                "product_info": product_infos[item["product_info_id"]],
+                "quantity": item["quantity"],
+                "price": item["price"],
+                "id": item["id"],
+            }
+        )
+    return [
+        {
+            "id": order["id"],
+            "ordered_items": ordered_items.get(order["id"], []),
+            "status": order["status"],
+            "dt": datetime_field.to_representation(order["dt"]),
+            "total_sum": order["total"],
+            "contact": contacts.get(order["contact_id"]),
+        }
+        for order in orders
+    ]
+
+
+def serialize_product_infos(rows, fields=PRODUCT_INFO_FIELDS):
+    """Строки product_info_values(), параметры читаются одним запросом."""
+    rows = list(rows)
+    parameters = {}
+    if "product_parameters" in fields:
+        parameters = group_parameters(parameter_values([row["id"] for row in rows]))
+    return [format_product_info(row, parameters, fields) for row in rows]
+
+
+def serialize_orders(orders):
+    """Заказы из строк queryset.values(*ORDER_VALUES), до четырех запросов на пачку."""
+    orders = list(orders)
+    items = list(order_item_values([order["id"] for order in orders]))
+    rows = item_product_infos(items)
+    parameters = group_parameters(parameter_values(list(rows)))
+    product_infos = {
+        product_info_id: format_product_info(row, parameters)
+        for product_info_id, row in rows.items()
+    }
+    contacts = {
+        row["id"]: row
+        for row in contact_values({order["contact_id"] for order in orders} - {None})
+    }
+    return format_orders(orders, items, product_infos, contacts)
@@ -0,0 +1,28 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+replica_reads = ContextVar("replica_reads", default=False)
+
+
+class ReplicaRouter:
+    """
+    Чтение идет на случайную реплику только внутри запросов, которые
+    ReplicaRoutingMiddleware пометила как read-only, остальное - на default.
+    """
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and replica_reads.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
@@ -0,0 +1,157 @@
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import Count, F
+
+from backend.models import ProductInfo, ProductParameter, ProductSearchIndex
+
+
+SEARCH_CONFIG = "russian"
+SEARCH_INDEX_BATCH_SIZE = 1000
+SEARCH_MAX_LIMIT = 100
+FACET_LIMIT = 20
+
+SEARCH_VECTOR = (
+    SearchVector("name", weight="A", config=SEARCH_CONFIG)
+    + SearchVector("model", weight="B", config=SEARCH_CONFIG)
+    + SearchVector("category_name", weight="B", config=SEARCH_CONFIG)
+    + SearchVector("parameters", weight="C", config=SEARCH_CONFIG)
+)
+
+
+class SearchError(ValueError):
+    pass
+
+
+def refresh_search_index(product_info_ids):
+    """
+    Пересобирает записи поискового индекса для переданных товаров магазинов.
+    На пачку уходит четыре запроса: товары, параметры, upsert и расчет tsvector.
+    """
+    product_info_ids = list(product_info_ids)
+    for start in range(0, len(product_info_ids), SEARCH_INDEX_BATCH_SIZE):
+        batch = product_info_ids[start : start + SEARCH_INDEX_BATCH_SIZE]
+        parameters = defaultdict(list)
+        for info_id, name, value in ProductParameter.objects.filter(
+            product_info_id__in=batch
+        ).values_list("product_info_id", "parameter__name", "value"):
+            parameters[info_id].append(f"{name} {value}")
+
+        rows = ProductInfo.objects.filter(id__in=batch).values(
+            "id",
+            "shop_id",
+            "price",
+            "is_active",
+            "model",
+            "product__name",
+            "product__category_id",
+            "product__category__name",
+        )
+        entries = [
+            ProductSearchIndex(
+                product_info_id=row["id"],
+                shop_id=row["shop_id"],
+                category_id=row["product__category_id"],
+                name=row["product__name"],
+                model=row["model"],
+                category_name=row["product__category__name"],
+                parameters=" ".join(parameters[row["id"]]),
+                price=row["price"],
+                is_active=row["is_active"],
+            )
+            for row in rows
+        ]
+        if not entries:
+            continue
+        ProductSearchIndex.objects.bulk_create(
+            entries,
+            update_conflicts=True,
+            unique_fields=["product_info"],
+            update_fields=[
+                "shop",
+                "category",
+                "name",
+                "model",
+                "category_name",
+                "parameters",
+                "price",
+                "is_active",
+            ],
+        )
+        ProductSearchIndex.objects.filter(product_info_id__in=batch).update(
+            search_vector=SEARCH_VECTOR
+        )
+
+
+def search_products(params):
+    """
+    Ранжированный поиск по индексу с подсчетом фасетов по категориям,
+    магазинам и значениям параметров для всех найденных товаров.
+    """
+    text = params.get("q", "").strip()
+    if not text:
+        raise SearchError("Укажите строку поиска q")
+    limit = params.get("limit", "20")
+    offset = params.get("offset", "0")
+    if not limit.isdigit() or not 0 < int(limit) <= SEARCH_MAX_LIMIT:
+        raise SearchError(f"limit должен быть от 1 до {SEARCH_MAX_LIMIT}")
+    if not offset.isdigit():
+        raise SearchError("offset должен быть числом")
+    limit, offset = int(limit), int(offset)
+
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+    matches = ProductSearchIndex.objects.filter(
+        search_vector=query, is_active=True, shop__state=True
+    )
+    for param, lookup in (
+        ("shop_id", "shop_id"),
+        ("category_id", "category_id"),
+        ("price_min", "price__gte"),
+        ("price_max", "price__lte"),
+    ):
+        value = params.get(param)
+        if value:
+            if not value.isdigit():
+                raise SearchError(f"{param} должен быть числом")
+            matches = matches.filter(**{lookup: int(value)})
+
+    hits = list(
+        matches.annotate(rank=SearchRank(F("search_vector"), query))
+        .order_by("-rank", "product_info_id")
+        .values(
+            "product_info_id",
+            "name",
+            "model",
+            "category_id",
+            "category_name",
+            "shop_id",
+            "price",
+            "rank",
+        )[offset : offset + limit]
+    )
+    for hit in hits:
+        hit["id"] = hit.pop("product_info_id")
+        hit["rank"] = round(hit["rank"], 6)
+    return {
+        "hits": hits,
+        "facets": {
+            "categories": list(
+                matches.values("category_id", "category_name")
+                .annotate(count=Count("pk"))
+                .order_by("-count", "category_id")[:FACET_LIMIT]
+            ),
+            "shops": list(
+                matches.values("shop_id", "shop__name")
+                .annotate(count=Count("pk"))
+                .order_by("-count", "shop_id")[:FACET_LIMIT]
+            ),
+            "parameters": list(
+                ProductParameter.objects.filter(
+                    product_info_id__in=matches.values("product_info_id")
+                )
+                .values("parameter__name", "value")
+                .annotate(count=Count("pk"))
+                .order_by("-count", "parameter__name", "value")[:FACET_LIMIT]
+            ),
+        },
+    }
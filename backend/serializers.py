@@ -1,9 +1,12 @@
+from django.utils import timezone
 from rest_framework import serializers
 
+from .thumbnails import thumbnail_urls
 from .models import (
     AvatarUser,
     Contact,
     CustomUser,
+    ImportJob,
     Order,
     OrderItem,
     Parameter,
@@ -34,9 +37,14 @@ class ContactSerializer(serializers.ModelSerializer):
 
 
 class AvatarSerializer(serializers.ModelSerializer):
+    thumbnails = serializers.SerializerMethodField()
+
     class Meta:
         model = AvatarUser
-        fields = "avatar"
+        fields = ("avatar", "thumbnails")
+
+    def get_thumbnails(self, obj):
+        return thumbnail_urls(obj.avatar.name)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -83,7 +91,7 @@ class ProductSerializer(serializers.ModelSerializer):
 
 
 class ProductParameterSerializer(serializers.ModelSerializer):
-    parametr = serializers.StringRelatedField()
+    parameter = serializers.StringRelatedField()
 
     class Meta:
         model = ProductParameter
@@ -92,7 +100,17 @@ class ProductParameterSerializer(serializers.ModelSerializer):
 
 class ProductInfoSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
-    product_parameters = ProductParameterSerializer(read_only=True, many=True)
+    product_parameters = ProductParameterSerializer(
+        source="product_param", read_only=True, many=True
+    )
+    thumbnails = serializers.SerializerMethodField()
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
     class Meta:
         model = ProductInfo
@@ -103,11 +121,15 @@ class ProductInfoSerializer(serializers.ModelSerializer):
             "shop",
             "quantity",
             "image",
+            "thumbnails",
             "price",
             "price_rrc",
             "product_parameters",
         )
 
+    def get_thumbnails(self, obj):
+        return thumbnail_urls(obj.image.name)
+
 
 class ParameterSerializer(serializers.ModelSerializer):
     class Meta:
@@ -118,8 +140,8 @@ class ParameterSerializer(serializers.ModelSerializer):
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
-        fields = ("product_info", "quantity", "order", "id")
-        read_only_fields = ("id",)
+        fields = ("product_info", "quantity", "price", "order", "id")
+        read_only_fields = ("id", "price")
         extra_kwargs = {"order": {"write_only": True}}
 
 
@@ -130,7 +152,7 @@ class OrderItemCreateSerializer(OrderItemSerializer):
 class OrderSerializer(serializers.ModelSerializer):
     ordered_items = OrderItemCreateSerializer(read_only=True, many=True)
 
-    total_sum = serializers.IntegerField()
+    total_sum = serializers.IntegerField(source="total", read_only=True)
     contact = ContactSerializer(read_only=True)
 
     class Meta:
@@ -140,8 +162,10 @@ class OrderSerializer(serializers.ModelSerializer):
 
 
 class PartnerOrderSerializer(serializers.ModelSerializer):
-    ordered_items = OrderItemCreateSerializer(read_only=True, many=True)
-    total = serializers.IntegerField()
+    ordered_items = OrderItemCreateSerializer(
+        source="shop_items", read_only=True, many=True
+    )
+    total = serializers.IntegerField(source="shop_total", read_only=True)
 
     class Meta:
         model = Order
@@ -159,3 +183,31 @@ class PartProductInfoSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductInfo
         fields = ("id",)
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    elapsed = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = (
+            "id",
+            "url",
+            "status",
+            "force",
+            "missing",
+            "rows_processed",
+            "stats",
+            "errors",
+            "created_at",
+            "finished_at",
+            "elapsed",
+        )
+        read_only_fields = fields
+
+    def get_elapsed(self, obj):
+        """Время выполнения загрузки в секундах."""
+        if obj.started_at is None:
+            return None
+        finished_at = obj.finished_at or timezone.now()
+        return round((finished_at - obj.started_at).total_seconds(), 3)
@@ -1,7 +1,22 @@
-from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver, Signal
 from django_rest_passwordreset.signals import reset_password_token_created
+from rest_framework.authtoken.models import Token
+
+from backend.authentication import auth_cache
+from backend.cache import bump_catalog_generation
+from backend.mail import queue_password_reset_email
+from backend.models import (
+    Category,
+    CustomUser,
+    Parameter,
+    Product,
+    ProductInfo,
+    ProductParameter,
+    Shop,
+)
+from backend.search import refresh_search_index
 
 new_user_registered = Signal()
 
@@ -11,7 +26,7 @@ new_order = Signal()
 @receiver(reset_password_token_created)
 def password_reset_token_created(sender, instance, reset_password_token, **kwargs):
     """
-    Отправляем письмо с токеном для сброса пароля
+    Ставим в очередь письмо с токеном для сброса пароля
     When a token is created, an e-mail needs to be sent to the user
     :param sender: View Class that sent the signal
     :param instance: View Instance that sent the signal
@@ -19,16 +34,94 @@ def password_reset_token_created(sender, instance, reset_password_token, **kwarg
     :param kwargs:
     :return:
     """
-    # send an e-mail to the user
-
-    msg = EmailMultiAlternatives(
-        # title:
-        f"Сброс пароля для {reset_password_token.user}",
-        # message:
-        f"Ваш токен для сброс пароля и создания нового: {reset_password_token.key}",
-        # from:
-        settings.EMAIL_HOST_USER,
-        # to:
-        [reset_password_token.user.email],
+    queue_password_reset_email(reset_password_token)
+
+
+def bump_catalog_generation_on_commit(shop_ids=None):
+    """
+    Сбрасываем кеш после коммита: до него параллельный запрос успел бы
+    снова положить в кеш еще не измененные данные.
+    """
+    transaction.on_commit(lambda: bump_catalog_generation(shop_ids))
+
+
+@receiver([post_save, post_delete], sender=Shop)
+@receiver([post_save, post_delete], sender=ProductInfo)
+def shop_catalog_changed(sender, instance, **kwargs):
+    """Сбрасываем кеш каталога магазина при изменении через админку или save()"""
+    bump_catalog_generation_on_commit(
+        [instance.shop_id if sender is ProductInfo else instance.id]
+    )
+
+
+@receiver([post_save, post_delete], sender=ProductParameter)
+def product_parameter_changed(sender, instance, **kwargs):
+    shop_id = (
+        ProductInfo.objects.filter(id=instance.product_info_id)
+        .values_list("shop_id", flat=True)
+        .first()
+    )
+    bump_catalog_generation_on_commit([shop_id] if shop_id else None)
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Parameter)
+@receiver(m2m_changed, sender=Category.shops.through)
+def catalog_changed(sender, **kwargs):
+    """Категории, товары и параметры общие для магазинов - сбрасываем весь кеш"""
+    bump_catalog_generation_on_commit()
+
+
+def refresh_search_index_on_commit(product_infos):
+    ids = list(product_infos.values_list("id", flat=True))
+    transaction.on_commit(lambda: refresh_search_index(ids))
+
+
+@receiver(post_save, sender=ProductInfo)
+def product_info_search_changed(sender, instance, **kwargs):
+    """Обновляем поисковый индекс при изменении товара через админку или save()"""
+    refresh_search_index_on_commit(ProductInfo.objects.filter(id=instance.id))
+
+
+@receiver([post_save, post_delete], sender=ProductParameter)
+def product_parameter_search_changed(sender, instance, **kwargs):
+    refresh_search_index_on_commit(
+        ProductInfo.objects.filter(id=instance.product_info_id)
+    )
+
+
+@receiver(post_save, sender=Product)
+def product_search_changed(sender, instance, **kwargs):
+    refresh_search_index_on_commit(ProductInfo.objects.filter(product=instance))
+
+
+@receiver(post_save, sender=Category)
+def category_search_changed(sender, instance, **kwargs):
+    refresh_search_index_on_commit(
+        ProductInfo.objects.filter(product__category=instance)
     )
-    msg.send()
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def user_auth_changed(sender, instance, **kwargs):
+    """
+    Смена пароля, типа, активности или удаление пользователя.
+    Кеш сбрасывается после коммита, иначе параллельный запрос успел бы
+    закешировать еще старые данные из БД.
+    """
+    user_id = instance.id
+    transaction.on_commit(lambda: auth_cache.invalidate_user(user_id))
+
+
+@receiver([post_save, post_delete], sender=Shop)
+def shop_owner_changed(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: auth_cache.invalidate_user(user_id))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Выход пользователя или удаление токена через админку"""
+    key = instance.key
+    transaction.on_commit(lambda: auth_cache.invalidate_token(key))
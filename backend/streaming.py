@@ -0,0 +1,50 @@
+"""
+Потоковая выдача больших списков в JSON.
+
+Queryset читается через iterator(chunk_size), каждая пачка сериализуется
+отдельно и сразу уходит клиенту, поэтому в памяти держится одна пачка,
+а не весь ответ целиком.
+"""
+import ujson
+from django.http import StreamingHttpResponse
+
+
+STREAM_CHUNK_SIZE = 500
+
+
+def dumps(value):
+    return ujson.dumps(value, ensure_ascii=False, escape_forward_slashes=False)
+
+
+def wants_stream(request):
+    return request.query_params.get("stream", "").lower() in ("1", "true")
+
+
+def iter_chunks(queryset, serialize, chunk_size=STREAM_CHUNK_SIZE):
+    """Пачки объектов queryset, каждая пропущена через serialize(список)."""
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            yield serialize(chunk)
+            chunk = []
+    if chunk:
+        yield serialize(chunk)
+
+
+def iter_json(fields, key, chunks):
+    """Части JSON-объекта {**fields, key: [...]}, список собирается из chunks."""
+    head = dumps(fields)[:-1]
+    yield f"{head}, {dumps(key)}: [" if fields else f"{{{dumps(key)}: ["
+    separator = ""
+    for chunk in chunks:
+        if chunk:
+            yield separator + ",".join(dumps(item) for item in chunk)
+            separator = ","
+    yield "]}"
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    def __init__(self, fields, key, chunks, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(iter_json(fields, key, chunks), **kwargs)
@@ -1,88 +1,218 @@
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
-from celery import shared_task
-import PIL.Image as Image
-import io
+from django.utils import timezone
+from celery import chain, shared_task
 import requests
-import base64
 import os
-from django.core.files import File
-
-from backend.models import AvatarUser, ConfirmEmailToken, CustomUser, ProductInfo
+import uuid
+
+from backend.cache import bump_catalog_generation
+from backend.feeds import FeedReader
+from backend.images import ImageFetcher
+from backend.events import relay_order_events
+from backend.mail import queue_order_status_emails, send_outbox
+from backend.importer import CatalogImporter, parse_int
+from backend.orders import release_expired_reservations
+from backend.thumbnails import generate_thumbnails, store_original
+from backend.uploads import AvatarError, transcode_avatar
+from backend.models import (
+    AvatarUser,
+    ImportJob,
+    ProductInfo,
+    Shop,
+)
+
+
+FEED_DOWNLOAD_TIMEOUT = 30
+FEED_CHUNK_SIZE = 64 * 1024
+IMAGE_BATCH_SIZE = 500
 
 
 @shared_task()
-def new_user_registered_task(user_id, **kwargs):
-    """
-    Отправляем письмо на почту для подтверждения регистрации через токен.
-    """
-    # send an e-mail to the user
-    token, _ = ConfirmEmailToken.objects.get_or_create(user_id=user_id)
-
-    msg = EmailMultiAlternatives(
-        # title:
-        f"Подтвердите регистранию по почте {token.user.email}",
-        # message:
-        f"Приветствуем {token.user.first_name}! Ваш токен для подтверждения регистрации: {token.key}",
-        # from:
-        settings.EMAIL_HOST_USER,
-        # to:
-        [token.user.email],
-    )
-    msg.send()
+def upload_image(user_id, staging_name):
+    """Аватар пользователя из файла, сохраненного при загрузке в staging"""
 
+    try:
+        name = transcode_avatar(staging_name)
+    except AvatarError as error:
+        return {"Status": False, "Error": str(error)}
+    return {
+        "Status": True,
+        "Avatar": AvatarUser.objects.create(user_id=user_id, avatar=name).id,
+    }
 
-@shared_task()
-def new_order_task(user_id, **kwargs):
+
+@shared_task
+def fetch_images(shop_id, images):
+    """
+    Загрузка пачки фото товаров магазина: images - список пар
+    [external_id, url]. Пути к файлам записываются одним bulk_update.
     """
-    Отправяем письмо при изменении статуса заказа.
+    urls = {int(external_id): url for external_id, url in images}
+    fetched, errors = ImageFetcher().fetch_all(urls.values())
+    originals = {
+        url: store_original(os.path.join(settings.MEDIA_ROOT, name))
+        for url, name in fetched.items()
+    }
+    failed = {
+        name: error
+        for name, error in generate_thumbnails(originals.values()).items()
+        if error
+    }
+    for url, name in list(originals.items()):
+        if name in failed:
+            errors[url] = failed[name]
+            del originals[url]
+
+    goods = []
+    for info in ProductInfo.objects.filter(shop_id=shop_id, external_id__in=urls).only(
+        "id", "external_id", "image"
+    ):
+        name = originals.get(urls[info.external_id])
+        if name and info.image.name != name:
+            info.image = name
+            goods.append(info)
+    ProductInfo.objects.bulk_update(goods, ["image"], batch_size=IMAGE_BATCH_SIZE)
+    if goods:
+        bump_catalog_generation([shop_id])
+    return {"fetched": len(fetched), "updated": len(goods), "errors": errors}
+
+
+def start_price_list_import(job):
     """
-    # send an e-mail to the user
-    user = CustomUser.objects.get(id=user_id)
-
-    msg = EmailMultiAlternatives(
-        # title:
-        f"Обновление статуса заказа",
-        # message:
-        "Заказ сформирован",
-        # from:
-        settings.EMAIL_HOST_USER,
-        # to:
-        [user.email],
-    )
-    msg.send()
+    Запускает цепочку задач загрузки прайс-листа:
+    скачивание файла, импорт товаров и загрузка фото.
+    """
+    job.task_id = str(uuid.uuid4())
+    job.save(update_fields=["task_id"])
+    chain(
+        fetch_price_list.si(job.id),
+        import_price_list.s().set(task_id=job.task_id),
+        prefetch_images.s(),
+    ).apply_async()
 
 
-@shared_task()
-def upload_image(data):
-    """Загрузка фото в карточку пользователя"""
+def fail_import_job(job, error):
+    job.status = "failed"
+    job.errors = job.errors + [{"error": str(error)}]
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "errors", "finished_at"])
+
+
+@shared_task
+def fetch_price_list(job_id):
+    """Скачивание прайс-листа во временный файл частями"""
+
+    job = ImportJob.objects.get(id=job_id)
+    job.status = "fetching"
+    job.started_at = timezone.now()
+    job.save(update_fields=["status", "started_at"])
+
+    name = f"imports/job_{job.id}.{job.format}"
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        with requests.get(
+            job.url, stream=True, timeout=FEED_DOWNLOAD_TIMEOUT
+        ) as response:
+            response.raise_for_status()
+            with open(path, "wb") as file:
+                for chunk in response.iter_content(chunk_size=FEED_CHUNK_SIZE):
+                    file.write(chunk)
+    except requests.RequestException as error:
+        fail_import_job(job, error)
+        raise
+
+    job.feed.name = name
+    job.save(update_fields=["feed"])
+    return job.id
+
+
+@shared_task(bind=True)
+def import_price_list(self, job_id):
+    """Потоковый импорт товаров из скачанного прайс-листа"""
+
+    job = ImportJob.objects.get(id=job_id)
+    job.status = "importing"
+    job.save(update_fields=["status"])
+
+    def report_progress(stats):
+        if not self.request.called_directly:
+            self.update_state(state="PROGRESS", meta={"rows_processed": stats["goods"]})
+
+    try:
+        with job.feed.open("rb") as file:
+            feed = FeedReader(file, job.format)
+            shop, _ = Shop.objects.get_or_create(name=feed.shop, user_id=job.user_id)
+            importer = CatalogImporter(
+                shop, on_batch=report_progress, force=job.force, missing=job.missing
+            )
+            stats = importer.run_feed(feed)
+    except Exception as error:
+        fail_import_job(job, error)
+        raise
+
+    job.shop = shop
+    job.rows_processed = stats["goods"]
+    job.stats = stats
+    job.errors = importer.errors
+    job.save(update_fields=["shop", "rows_processed", "stats", "errors"])
+    return job.id
+
 
-    user_id = data["user_id"]
-    byte_data = data["avatar"].encode(encoding="utf-8")
-    b = base64.b64decode(byte_data)
-    img = Image.open(io.BytesIO(b))
-    img.save(data["name"], format=img.format)
+@shared_task
+def prefetch_images(job_id):
+    """Постановка в очередь загрузки фото товаров из прайс-листа"""
+
+    job = ImportJob.objects.get(id=job_id)
+    images = []
+    with job.feed.open("rb") as file:
+        for kind, item in FeedReader(file, job.format):
+            if (
+                kind != "good"
+                or not isinstance(item, dict)
+                or not isinstance(item.get("image"), str)
+            ):
+                continue
+            external_id = parse_int(item.get("id"))
+            if item["image"] and external_id is not None:
+                images.append([external_id, item["image"]])
+                if len(images) == IMAGE_BATCH_SIZE:
+                    fetch_images.delay(job.shop_id, images)
+                    images = []
+    if images:
+        fetch_images.delay(job.shop_id, images)
+    job.feed.delete(save=False)
+    job.status = "done"
+    job.finished_at = timezone.now()
+    job.save(update_fields=["feed", "status", "finished_at"])
 
-    with open(data["name"], "rb") as file:
-        picture = File(file)
 
-        instance = AvatarUser(user_id=user_id, avatar=picture)
-        instance.save()
+@shared_task
+def release_expired_reservations_task():
+    """Отмена неподтвержденных заказов с истекшим резервом товаров"""
 
-    os.remove(data["name"])
+    return len(release_expired_reservations())
 
 
 @shared_task
-def download_image(data):
-    """Загрузка фото продукта по ссылке"""
-
-    response = requests.get(data["url"])
-    path = f"media/products_image/shop_id_{data['shop_id']}"
-    if not os.path.exists(path):
-        os.makedirs(path)
-    f_name = f'{path}/{data["filename"]}'
-    with open(f_name, "wb") as f:
-        f.write(response.content)
-        ProductInfo.objects.filter(external_id=data["product_id"]).update(
-            image=data["filename"]
-        )
+def send_outbox_emails_task():
+    """Отправка очередной пачки писем из очереди"""
+
+    return send_outbox()
+
+
+@shared_task
+def order_events_task(events):
+    """
+    Обработка пачки событий заказов от relay_order_events.
+    События одного заказа идут в пачке по порядку.
+    """
+
+    return len(queue_order_status_emails(events))
+
+
+@shared_task
+def relay_order_events_task():
+    """Отправка событий, которые не ушли в Celery сразу после коммита"""
+
+    return relay_order_events()
@@ -0,0 +1,115 @@
+"""
+Оригиналы фото по хешу содержимого и уменьшенные копии к ним.
+
+Оригинал лежит в images/ под sha256 своего содержимого, поэтому одна и та же
+картинка разных магазинов или пользователей хранится на диске один раз.
+Для каждого оригинала строятся копии THUMBNAIL_SIZES в WebP и JPEG, их имена
+выводятся из имени оригинала, так что в базе хранится только оно.
+"""
+import hashlib
+import os
+import re
+import shutil
+
+import PIL.Image as Image
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+
+ORIGINALS_DIR = "images"
+THUMBNAILS_DIR = "thumbnails"
+THUMBNAIL_SIZES = {"small": 160, "medium": 480}
+THUMBNAIL_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+THUMBNAIL_QUALITY = 80
+DIGEST_CHUNK_SIZE = 64 * 1024
+
+CONTENT_NAME = re.compile(rf"^{ORIGINALS_DIR}/[0-9a-f]{{2}}/([0-9a-f]{{64}})\.\w+$")
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(DIGEST_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link(source, target):
+    """Жесткая ссылка target -> source, если ФС не умеет - копия."""
+    partial = f"{target}.link"
+    try:
+        os.link(source, partial)
+    except OSError:
+        shutil.copyfile(source, partial)
+    os.replace(partial, target)
+
+
+def store_original(path):
+    """
+    Кладет файл из MEDIA_ROOT под адрес по содержимому и возвращает новое имя.
+    Если такая картинка уже есть, path становится ссылкой на нее же.
+    """
+    extension = os.path.splitext(path)[1].lower()[:5] or ".jpg"
+    digest = file_digest(path)
+    name = f"{ORIGINALS_DIR}/{digest[:2]}/{digest}{extension}"
+    target = os.path.join(settings.MEDIA_ROOT, name)
+    if os.path.exists(target):
+        link(target, path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        link(path, target)
+    return name
+
+
+def thumbnail_name(name, size, extension):
+    digest = CONTENT_NAME.match(name).group(1)
+    return f"{THUMBNAILS_DIR}/{digest[:2]}/{digest}_{size}.{extension}"
+
+
+def thumbnail_urls(name):
+    """Адреса копий для имени оригинала, для старых файлов без хеша - None."""
+    if not name or not CONTENT_NAME.match(name):
+        return None
+    return {
+        size: {
+            extension: default_storage.url(thumbnail_name(name, size, extension))
+            for extension in THUMBNAIL_FORMATS
+        }
+        for size in THUMBNAIL_SIZES
+    }
+
+
+def make_thumbnails(name, media_root):
+    """Строит копии одного оригинала. Возвращает текст ошибки или None."""
+    try:
+        with Image.open(os.path.join(media_root, name)) as image:
+            image.load()
+            for size, pixels in THUMBNAIL_SIZES.items():
+                thumbnail = image.copy()
+                thumbnail.thumbnail((pixels, pixels))
+                for extension, image_format in THUMBNAIL_FORMATS.items():
+                    path = os.path.join(
+                        media_root, thumbnail_name(name, size, extension)
+                    )
+                    if os.path.exists(path):
+                        continue
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    output = thumbnail
+                    if image_format == "JPEG" and output.mode not in ("RGB", "L"):
+                        output = output.convert("RGB")
+                    output.save(f"{path}.part", image_format, quality=THUMBNAIL_QUALITY)
+                    os.replace(f"{path}.part", path)
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        return str(error) or error.__class__.__name__
+    return None
+
+
+def generate_thumbnails(names):
+    """
+    Копии для нескольких оригиналов по очереди. Сжатие упирается в CPU,
+    но задачи выполняются в prefork-воркерах Celery, а они демонические
+    и не могут запускать дочерние процессы: параллельность дает
+    --concurrency воркера. Возвращает {имя: текст ошибки или None}.
+    """
+    media_root = settings.MEDIA_ROOT
+    return {name: make_thumbnails(name, media_root) for name in dict.fromkeys(names)}
@@ -0,0 +1,112 @@
+"""
+Загрузка аватаров без буферизации в памяти и без передачи файла через брокер.
+
+StagingFileUploadHandler пишет тело файла частями прямо в MEDIA_ROOT/staging,
+в очередь Celery уходит только имя файла. Воркер проверяет и перекодирует
+картинку из этого файла: JPEG декодируется сразу в уменьшенном размере
+(Image.draft), поэтому память на загрузку не зависит от размера исходника.
+"""
+import os
+import uuid
+
+import PIL.Image as Image
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+from backend.thumbnails import generate_thumbnails, store_original
+
+
+STAGING_DIR = "staging"
+AVATAR_SIZE = 1024
+AVATAR_FORMATS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp", "GIF": ".png"}
+AVATAR_MAX_PIXELS = 50_000_000
+
+
+class AvatarError(ValueError):
+    pass
+
+
+class StagedUploadedFile(UploadedFile):
+    """Файл, уже лежащий в MEDIA_ROOT под staging_name."""
+
+    def __init__(self, staging_name, name, content_type, size, charset):
+        self.staging_name = staging_name
+        path = os.path.join(settings.MEDIA_ROOT, staging_name)
+        super().__init__(open(path, "rb"), name, content_type, size, charset)
+
+
+class StagingFileUploadHandler(FileUploadHandler):
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        extension = os.path.splitext(self.file_name)[1].lower()[:5]
+        self.staging_name = f"{STAGING_DIR}/{uuid.uuid4().hex}{extension}"
+        self.path = os.path.join(settings.MEDIA_ROOT, self.staging_name)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.path, "wb")
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > settings.AVATAR_MAX_UPLOAD_SIZE:
+            self.discard()
+            raise StopUpload(connection_reset=True)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.close()
+        return StagedUploadedFile(
+            self.staging_name,
+            self.file_name,
+            self.content_type,
+            file_size,
+            self.charset,
+        )
+
+    def upload_interrupted(self):
+        self.discard()
+
+    def discard(self):
+        if getattr(self, "file", None) is not None:
+            self.file.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def discard_staged(uploaded):
+    """Удаляет из staging файл, который не будет передан воркеру."""
+    uploaded.close()
+    path = os.path.join(settings.MEDIA_ROOT, uploaded.staging_name)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def transcode_avatar(staging_name):
+    """
+    Проверяет картинку из staging и сохраняет ее не больше AVATAR_SIZE
+    по большей стороне. Возвращает имя оригинала по хешу содержимого.
+    Файл в staging удаляется в любом случае.
+    """
+    source = os.path.join(settings.MEDIA_ROOT, staging_name)
+    target = f"{os.path.splitext(source)[0]}.out"
+    try:
+        try:
+            with Image.open(source) as image:
+                source_format = image.format
+                if source_format not in AVATAR_FORMATS:
+                    raise AvatarError(f"Неподдерживаемый формат: {source_format}")
+                if image.width * image.height > AVATAR_MAX_PIXELS:
+                    raise AvatarError("Слишком большое изображение")
+                image.draft("RGB", (AVATAR_SIZE, AVATAR_SIZE))
+                image.thumbnail((AVATAR_SIZE, AVATAR_SIZE))
+                target += AVATAR_FORMATS[source_format]
+                image.save(target, "PNG" if source_format == "GIF" else source_format)
+        except (OSError, SyntaxError, Image.DecompressionBombError) as error:
+            raise AvatarError("Файл не является изображением") from error
+        name = store_original(target)
+    finally:
+        for path in (source, target):
+            if os.path.exists(path):
+                os.remove(path)
+    generate_thumbnails([name])
+    return name
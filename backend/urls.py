@@ -4,17 +4,22 @@ from django_rest_passwordreset.views import (
     reset_password_confirm,
 )
 
+from backend import async_views
 from backend.views import (
     AuthorizationUser,
     AvatarUsers,
+    CatalogCacheStats,
     BasketView,
     ConfirmAccount,
+    LogoutUser,
     ContactView,
     OrderView,
     PartnerOrders,
     PartnerState,
     PartnerUpdate,
+    PartnerUpdateStatus,
     ProductInfoView,
+    ProductSearchView,
     ProductView,
     RegisterAccount,
     ShopsView,
@@ -26,9 +31,15 @@ from backend.views import (
 app_name = "backend"
 urlpatterns = [
     path("partner/update", PartnerUpdate.as_view(), name="partner-update"),
+    path(
+        "partner/update/status",
+        PartnerUpdateStatus.as_view(),
+        name="partner-update-status",
+    ),
     path("partner/state", PartnerState.as_view(), name="partner-state"),
     path("user/register", RegisterAccount.as_view(), name="user-register"),
     path("user/auth", AuthorizationUser.as_view(), name="user-auth"),
+    path("user/logout", LogoutUser.as_view(), name="user-logout"),
     path(
         "user/register/confirm", ConfirmAccount.as_view(), name="user-register-confirm"
     ),
@@ -43,9 +54,16 @@ urlpatterns = [
     path("shops", ShopsView.as_view(), name="shops"),
     path("product/all", ProductView.as_view(), name="products"),
     path("category", CategoryView.as_view(), name="category"),
+    path("cache/stats", CatalogCacheStats.as_view(), name="cache-stats"),
     path("basket", BasketView.as_view(), name="basket"),
     path("products", ProductInfoView.as_view(), name="products"),
+    path("products/search", ProductSearchView.as_view(), name="products-search"),
     path("order", OrderView.as_view(), name="orders"),
     path("partner/orders", PartnerOrders.as_view(), name="partner-orders"),
     path("avatar", AvatarUsers.as_view(), name="avatar"),
+    path("async/shops", async_views.shops, name="async-shops"),
+    path("async/category", async_views.categories, name="async-category"),
+    path("async/products", async_views.product_infos, name="async-products"),
+    path("async/basket", async_views.basket, name="async-basket"),
+    path("async/order", async_views.orders, name="async-orders"),
 ]
@@ -1,54 +1,89 @@
-import base64
+import hmac
+
 from distutils.util import strtobool
-import os
+from django.conf import settings
 from django.db import IntegrityError
 from rest_framework.generics import ListAPIView
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.contrib.auth.password_validation import validate_password
-from requests import get
 from django.contrib.auth.views import LoginView
-from django.db.models import Q, Sum, F
+from django.db.models import Exists, F, OuterRef, Prefetch, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.core.validators import URLValidator
 from rest_framework.views import APIView
 from django.contrib.auth import authenticate
 from rest_framework.authtoken.models import Token
-import yaml
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from celery.result import AsyncResult
 from backend.models import (
+    STATE_CHOICES,
     Category,
     Contact,
     CustomUser,
     Order,
     OrderItem,
-    Parameter,
     Product,
     ProductParameter,
     Shop,
     ProductInfo,
     ConfirmEmailToken,
+    ImportJob,
 )
 from backend.serializers import (
     AvatarSerializer,
     CategorySerializer,
     ContactSerializer,
-    OrderItemSerializer,
-    OrderSerializer,
+    ImportJobSerializer,
     PartnerOrderSerializer,
     ProductInfoSerializer,
     ProductSerializer,
     ShopSerializer,
     UserSerializer,
 )
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import BasePermission, IsAdminUser, IsAuthenticated
 from drf_spectacular.utils import extend_schema
 
-
-from backend.tasks import (
-    download_image,
-    new_user_registered_task,
-    new_order_task,
-    upload_image,
+from backend.basket import BasketError, add_items, remove_items, update_items
+from backend.authentication import auth_cache
+from backend.cache import (
+    CachedListMixin,
+    bump_catalog_generation,
+    cached_json_response,
+    get_cache_stats,
+)
+from backend.feeds import FEED_FORMATS, detect_format
+from backend.importer import MISSING_GOODS_ACTIONS
+from backend.mail import queue_registration_email
+from backend.metrics import (
+    registry,
+    render_auth_cache_stats,
+    render_cache_stats,
+    serialization_timer,
+)
+from backend.orders import (
+    PARTNER_STATUSES,
+    TRANSITION_MAX_ORDERS,
+    CheckoutError,
+    InsufficientStock,
+    checkout,
+    release_orders,
+    transition_orders,
 )
+from backend.pagination import (
+    KeysetPagination,
+    OrderFeedPagination,
+    PaginationError,
+)
+from backend.projections import (
+    ORDER_VALUES,
+    product_info_values,
+    serialize_orders,
+    serialize_product_infos,
+)
+from backend.search import SearchError, search_products
+from backend.streaming import StreamingJsonResponse, iter_chunks, wants_stream
+from backend.tasks import fetch_images, start_price_list_import, upload_image
+from backend.uploads import StagingFileUploadHandler, discard_staged
 
 
 class RegisterAccount(APIView):
@@ -58,7 +93,17 @@ class RegisterAccount(APIView):
 
     @extend_schema(summary="Получить список пользователей")
     def get(self, request, *args, **kwargs):
+        """С stream=1 список отдается потоком, пачками по STREAM_CHUNK_SIZE."""
         users = CustomUser.objects.all().prefetch_related("avatars", "contacts")
+        if wants_stream(request):
+            return StreamingJsonResponse(
+                {},
+                "users",
+                iter_chunks(
+                    users,
+                    lambda chunk: UserSerializer(chunk, many=True).data,
+                ),
+            )
         serializer = UserSerializer(users, many=True)
         return JsonResponse({"users": serializer.data})
 
@@ -82,7 +127,7 @@ class RegisterAccount(APIView):
                     user = user_serializer.save()
                     user.set_password(request.data["password"])
                     user.save()
-                    new_user_registered_task.delay(user_id=user.id)
+                    queue_registration_email(user)
                     return JsonResponse(
                         {"Status": True, "user": user_serializer.data}, status=200
                     )
@@ -112,23 +157,33 @@ class RegisterAccount(APIView):
 
 
 class AvatarUsers(APIView):
+    """
+    Загрузка аватара: файл пишется частями в MEDIA_ROOT/staging,
+    воркеру передается только имя файла.
+    """
+
     serializer_class = AvatarSerializer
 
     def get_queryset(self):
         return AvatarUsers.objects.filter(user_id=self.kwargs["user_id"])
 
-    def post(self, request, *args, **kwargs):
-        avatar = request.FILES.get("avatar").read()
-
-        byte = base64.b64encode(avatar)
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [StagingFileUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
 
-        data = {
-            "user_id": request.data["user_id"],
-            "avatar": byte.decode("utf-8"),
-            "name": request.FILES.get("avatar").name,
-        }
+    def post(self, request, *args, **kwargs):
+        avatar = request.FILES.get("avatar")
+        user_id = request.data.get("user_id")
+        for uploaded in request.FILES.values():
+            if uploaded is not avatar or not str(user_id).isdigit():
+                discard_staged(uploaded)
+        if avatar is None or not str(user_id).isdigit():
+            return JsonResponse(
+                {"Status": False, "Errors": "Не указаны все необходимые аргументы"},
+                status=400,
+            )
 
-        upload_image.delay(data=data)
+        upload_image.delay(user_id=int(user_id), staging_name=avatar.staging_name)
 
         return JsonResponse(
             {
@@ -165,6 +220,19 @@ class AuthorizationUser(APIView, LoginView):
         )
 
 
+class LogoutUser(APIView):
+    """
+    Класс для выхода пользователя: токен удаляется и больше не принимается.
+    """
+
+    permission_classes = (IsAuthenticated,)
+
+    @extend_schema(summary="Выход и удаление токена")
+    def post(self, request, *args, **kwargs):
+        Token.objects.filter(key=request.auth.key).delete()
+        return JsonResponse({"Status": True, "Answer": "Выход выполнен"})
+
+
 class ConfirmAccount(APIView):
     """
     Класс для подтверждения почтового адреса.
@@ -210,16 +278,14 @@ class PartnerUpdate(APIView):
 
         if {"image", "external_id"}.issubset(request.data):
             url = request.data["image"]
-            shop_id = Shop.objects.get(user_id=request.user.id).id
+            shop_id = request.user.shop_id
             product_id = request.data["external_id"]
-            filename = os.path.basename(url)
-            data = {
-                "url": url,
-                "filename": filename,
-                "product_id": product_id,
-                "shop_id": shop_id,
-            }
-            download_image.delay(data)
+            if shop_id is None or not str(product_id).isdigit():
+                return JsonResponse(
+                    {"Status": False, "Errors": "Неправильно указаны аргументы"},
+                    status=400,
+                )
+            fetch_images.delay(shop_id, [[int(product_id), url]])
             return JsonResponse(
                 {
                     "Status": True,
@@ -229,67 +295,130 @@ class PartnerUpdate(APIView):
         url = request.data.get("url")
         if url:
             try:
-                URLValidator(url)
-            except Exception as url_errorы:
+                URLValidator()(url)
+            except ValidationError as url_error:
                 return JsonResponse(
                     {
                         "Status": False,
-                        "Errors": {"url": [error for error in url_errorы]},
-                    }
+                        "Errors": {"url": url_error.messages},
+                    },
+                    status=400,
                 )
             else:
-                data = get(url).content
-                data_dict = yaml.load(data, Loader=yaml.Loader)
-                shop = Shop.objects.get_or_create(
-                    name=data_dict["shop"], user_id=request.user.id
-                )
-                for category in data_dict["categories"]:
-                    category_object, _ = Category.objects.get_or_create(
-                        id=category["id"], name=category["name"]
+                feed_format = request.data.get("format") or detect_format(url)
+                if feed_format not in FEED_FORMATS:
+                    return JsonResponse(
+                        {
+                            "Status": False,
+                            "Errors": {"format": f"Доступные форматы: {FEED_FORMATS}"},
+                        },
+                        status=400,
                     )
-                    category_object.shops.add(shop[0].id)
-                    category_object.save()
-
-                for item in data_dict["goods"]:
-                    product = Product.objects.get_or_create(
-                        name=item["name"], id=item["id"], category_id=item["category"]
+                missing = request.data.get("missing", "keep")
+                if missing not in MISSING_GOODS_ACTIONS:
+                    return JsonResponse(
+                        {
+                            "Status": False,
+                            "Errors": {
+                                "missing": f"Доступные значения: {MISSING_GOODS_ACTIONS}"
+                            },
+                        },
+                        status=400,
                     )
-
-                    prodinfo = ProductInfo.objects.get_or_create(
-                        external_id=item["id"],
-                        product_id=product[0].id,
-                        model=item["model"],
-                        quantity=item["quantity"],
-                        price=item["price"],
-                        price_rrc=item["price_rrc"],
-                        shop_id=shop[0].id,
+                try:
+                    force = bool(strtobool(str(request.data.get("force", "False"))))
+                except ValueError as error:
+                    return JsonResponse(
+                        {"Status": False, "Errors": {"force": str(error)}}, status=400
                     )
-                    for name, value in item["parameters"].items():
-                        parameter_object = Parameter.objects.get_or_create(name=name)
-                        ProductParameter.objects.create(
-                            product_info_id=prodinfo[0].id,
-                            parameter_id=parameter_object[0].id,
-                            value=value,
-                        )
-        return JsonResponse({"Status": True, "Answer": "Информация успешно добавлена!"})
+                job = ImportJob.objects.create(
+                    user_id=request.user.id,
+                    url=url,
+                    format=feed_format,
+                    force=force,
+                    missing=missing,
+                )
+                start_price_list_import(job)
+                return JsonResponse({"Status": True, "Job": job.id}, status=202)
+
+        return JsonResponse(
+            {"Status": False, "Errors": "Не указаны все необходимые аргументы"},
+            status=400,
+        )
+
+
+class PartnerUpdateStatus(APIView):
+    """
+    Класс для получения прогресса загрузки прайс-листа.
+    Передается job_id, без него отдается последняя загрузка магазина.
+    """
+
+    permission_classes = (IsAuthenticated,)
+
+    @extend_schema(summary="Получить статус загрузки товаров")
+    def get(self, request, *args, **kwargs):
+        if request.user.type != "shop":
+            return JsonResponse(
+                {"Status": False, "Error": "Только для магазинов"}, status=403
+            )
+
+        jobs = ImportJob.objects.filter(user_id=request.user.id)
+        job_id = request.query_params.get("job_id")
+        if job_id:
+            if not job_id.isdigit():
+                return JsonResponse(
+                    {"Status": False, "Error": "Указан неверный формат данных"},
+                    status=400,
+                )
+            jobs = jobs.filter(id=job_id)
+        job = jobs.first()
+        if job is None:
+            return JsonResponse(
+                {"Status": False, "Error": "Загрузка не найдена"}, status=404
+            )
+
+        data = ImportJobSerializer(job).data
+        if job.status == "importing" and job.task_id:
+            progress = AsyncResult(job.task_id)
+            if progress.state == "PROGRESS":
+                data["rows_processed"] = progress.info["rows_processed"]
+        return JsonResponse({"Status": True, "Job": data})
 
 
-class ShopsView(ListAPIView):
+class ShopsView(CachedListMixin, ListAPIView):
     """
     Класс отражает список магазинов.
     """
 
     queryset = Shop.objects.all()
     serializer_class = ShopSerializer
+    cache_name = "shops"
+    read_from_replica = True
 
 
-class ProductView(ListAPIView):
+class ProductView(CachedListMixin, ListAPIView):
     """
     Класс отражает список товаров.
     """
 
-    queryset = Product.objects.all()
+    queryset = Product.objects.select_related("category")
     serializer_class = ProductSerializer
+    cache_name = "products"
+    read_from_replica = True
+
+
+class CatalogCacheStats(APIView):
+    """
+    Класс для получения статистики кеша каталога. Только для администраторов.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    @extend_schema(summary="Статистика кеша каталога")
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(
+            {"Status": True, "Cache": get_cache_stats(), "Auth": auth_cache.get_stats()}
+        )
 
 
 class UserDetails(APIView):
@@ -301,6 +430,8 @@ class UserDetails(APIView):
 
     @extend_schema(summary="Изменения данных пользователя")
     def post(self, request, *args, **kwargs):
+        # в request.user из кеша токенов только часть полей
+        user = CustomUser.objects.get(id=request.user.id)
         if {"password"}.issubset(request.data):
             try:
                 validate_password(request.data["password"])
@@ -313,8 +444,8 @@ class UserDetails(APIView):
                     status=400,
                 )
             else:
-                request.user.set_password(request.data["password"])
-        user_serializer = UserSerializer(request.user, data=request.data, partial=True)
+                user.set_password(request.data["password"])
+        user_serializer = UserSerializer(user, data=request.data, partial=True)
         if user_serializer.is_valid():
             user_serializer.save()
             return JsonResponse(
@@ -330,13 +461,15 @@ class UserDetails(APIView):
             )
 
 
-class CategoryView(ListAPIView):
+class CategoryView(CachedListMixin, ListAPIView):
     """
     Класс для отражания всех категорий.
     """
 
-    queryset = Category.objects.all()
+    queryset = Category.objects.prefetch_related("shops")
     serializer_class = CategorySerializer
+    cache_name = "categories"
+    read_from_replica = True
 
 
 class PartnerState(APIView):
@@ -366,9 +499,10 @@ class PartnerState(APIView):
         state = request.data.get("state")
         if state:
             try:
-                Shop.objects.filter(user_id=request.user.id).update(
+                if Shop.objects.filter(id=request.user.shop_id).update(
                     state=strtobool(request.data["state"])
-                )
+                ):
+                    bump_catalog_generation([request.user.shop_id])
                 return JsonResponse({"Status": True, "Answer": "Данные изменены"})
             except ValueError as e:
                 return JsonResponse({"Status": False, "Error": str(e)}, status=400)
@@ -489,76 +623,56 @@ class BasketView(APIView):
 
     @extend_schema(summary="Получить корзину пользователя")
     def get(self, request, *args, **kwargs):
-        basket = (
-            Order.objects.filter(user_id=request.user.id, status="basket")
-            .prefetch_related(
-                "ordered_items__product_info__product__category",
-                "ordered_items__product_info__product_param__parameter",
-            )
-            .annotate(
-                total_sum=Sum(
-                    F("ordered_items__quantity")
-                    * F("ordered_items__product_info__price")
-                )
-            )
-            .distinct()
-        )
+        baskets = Order.objects.filter(user_id=request.user.id, status="basket")
+        with serialization_timer():
+            data = serialize_orders(baskets.order_by("id").values(*ORDER_VALUES))
+            return JsonResponse({"status": True, "answer": data}, status=200)
 
-        serializer = OrderSerializer(basket, many=True)
-        return JsonResponse({"status": True, "answer": serializer.data}, status=200)
-
-    @extend_schema(summary="Добавить товар в корзину")
+    @extend_schema(summary="Добавить товары в корзину")
     def post(self, request, *args, **kwargs):
-        items = request.data.get("items")
-        if items:
-            basket, _ = Order.objects.get_or_create(
-                user_id=request.user.id, status="basket"
-            )
-            objects_created = 0
-            for order_item in items:
-                order_item.update({"order": basket.id})
-                serializer = OrderItemSerializer(data=order_item)
-                if serializer.is_valid():
-                    try:
-                        serializer.save()
-                    except IntegrityError as error:
-                        return JsonResponse(
-                            {"Status": False, "Erorr": str(error)}, status=400
-                        )
-                    else:
-                        objects_created += 1
-
-                else:
-                    return JsonResponse(
-                        {"Status": False, "Errors": serializer.errors}, status=400
-                    )
-
-                return JsonResponse(
-                    {"Status": True, "Created_objects": objects_created}, status=201
-                )
+        """
+        Добавляет пачку товаров [{"product_info": id, "quantity": n}].
+        Все товары проверяются одним запросом, при ошибке корзина не меняется.
+        """
+        basket, _ = Order.objects.get_or_create(
+            user_id=request.user.id, status="basket"
+        )
+        try:
+            objects_created = add_items(basket, request.data.get("items"))
+        except BasketError as error:
+            return JsonResponse({"Status": False, "Errors": error.args[0]}, status=400)
         return JsonResponse(
-            {"Status": False, "Errors": "Не указаны все необходимые аргументы"},
-            status=400,
+            {
+                "Status": True,
+                "Created_objects": objects_created,
+                "Basket": self.get_basket(basket),
+            },
+            status=201,
         )
 
     @extend_schema(summary="Изменить количество товаров в корзине")
     def put(self, request, *args, **kwargs):
-        items_sting = request.data.get("items")
-        if items_sting:
-            basket, _ = Order.objects.get_or_create(
-                user_id=request.user.id, status="basket"
-            )
-            objects_updated = 0
-            for order_item in items_sting:
-                if (
-                    type(order_item["id"]) == int
-                    and type(order_item["quantity"]) == int
-                ):
-                    objects_updated += OrderItem.objects.filter(
-                        order_id=basket.id, id=order_item["id"]
-                    ).update(quantity=order_item["quantity"])
+        basket, _ = Order.objects.get_or_create(
+            user_id=request.user.id, status="basket"
+        )
+        try:
+            objects_updated = update_items(basket, request.data.get("items"))
+        except BasketError as error:
+            return JsonResponse({"Status": False, "Errors": error.args[0]}, status=400)
+        return JsonResponse(
+            {
+                "Status": True,
+                "Обновлено объектов": objects_updated,
+                "Basket": self.get_basket(basket),
+            }
+        )
 
-            return JsonResponse({"Status": True, "Обновлено объектов": objects_updated})
+    @staticmethod
+    def get_basket(basket):
+        (data,) = serialize_orders(
+            Order.objects.filter(id=basket.id).values(*ORDER_VALUES)
+        )
+        return data
 
     @extend_schema(summary="Удалить товар из корзины")
     def delete(self, request, *args, **kwargs):
@@ -568,15 +682,18 @@ class BasketView(APIView):
             basket, _ = Order.objects.get_or_create(
                 user_id=request.user.id, status="basket"
             )
-            query = Q()
-            objects_deleted = False
-            for order_item_id in items_list:
-                if order_item_id.isdigit():
-                    query = query | Q(order_id=basket.id, id=order_item_id)
-                    objects_deleted = True
-
-            if objects_deleted:
-                deleted_count = OrderItem.objects.filter(query).delete()[0]
+            item_ids = [
+                int(order_item_id)
+                for order_item_id in items_list
+                if order_item_id.isdigit()
+            ]
+            if item_ids:
+                try:
+                    deleted_count = remove_items(basket, item_ids)
+                except BasketError as error:
+                    return JsonResponse(
+                        {"Status": False, "Errors": error.args[0]}, status=400
+                    )
                 return JsonResponse(
                     {"Status": True, "Удалено объектов": deleted_count}, status=204
                 )
@@ -595,75 +712,218 @@ class OrderView(APIView):
 
     @extend_schema(summary="Получить список заказов пользователя")
     def get(self, request, *args, **kwargs):
-        order = (
+        orders = (
             Order.objects.filter(user_id=request.user.id)
             .exclude(status="basket")
-            .prefetch_related(
-                "ordered_items__product_info__product__category",
-                "ordered_items__product_info__product_param__parameter",
-            )
-            .select_related("contact")
-            .annotate(
-                total_sum=Sum(
-                    F("ordered_items__quantity")
-                    * F("ordered_items__product_info__price")
-                )
-            )
-            .distinct()
+            .order_by("id")
+            .values(*ORDER_VALUES)
         )
+        if wants_stream(request):
+            return StreamingJsonResponse(
+                {"Status": True}, "Orders", iter_chunks(orders, serialize_orders)
+            )
 
-        serializer = OrderSerializer(order, many=True)
-        return JsonResponse({"Status": True, "Orders": serializer.data}, status=200)
+        with serialization_timer():
+            data = serialize_orders(orders)
+            return JsonResponse({"Status": True, "Orders": data}, status=200)
 
     @extend_schema(summary="Разместить заказ, добавив контакты")
     def post(self, request, *args, **kwargs):
+        """
+        Размещение корзины: товары резервируются на складе, цены и сумма
+        фиксируются. Если товара не хватает, возвращаются остатки по позициям.
+        """
         if {"id", "contact"}.issubset(request.data):
-            if request.data["id"]:
+            if str(request.data["id"]).isdigit():
                 try:
-                    is_updated = Order.objects.filter(
-                        user_id=request.user.id, id=request.data["id"]
-                    ).update(contact_id=request.data["contact"], status="new")
-                except IntegrityError as error:
+                    checkout(
+                        request.user.id, request.data["id"], request.data["contact"]
+                    )
+                except InsufficientStock as error:
+                    return JsonResponse(
+                        {"Status": False, "Errors": error.args[0]}, status=409
+                    )
+                except CheckoutError as error:
+                    return JsonResponse(
+                        {"Status": False, "Errors": error.args[0]}, status=400
+                    )
+                except (IntegrityError, ValueError):
                     return JsonResponse(
                         {"Status": False, "Errors": "Неправильно указаны аргументы"},
                         status=400,
                     )
-                else:
-                    if is_updated:
-                        new_order_task.send(
-                            sender=self.__class__, user_id=request.user.id
-                        )
-                        return JsonResponse({"Status": True}, status=201)
+                return JsonResponse({"Status": True}, status=201)
 
         return JsonResponse(
             {"Status": False, "Errors": "Не указаны все необходимые аргументы"},
             status=400,
         )
 
+    @extend_schema(summary="Отменить заказ")
+    def delete(self, request, *args, **kwargs):
+        """Отмена нового или подтвержденного заказа, товары возвращаются на склад."""
+        order_id = request.data.get("id")
+        if not str(order_id).isdigit():
+            return JsonResponse(
+                {"Status": False, "Errors": "Не указаны все необходимые аргументы"},
+                status=400,
+            )
+        if release_orders(Order.objects.filter(user_id=request.user.id, id=order_id)):
+            return JsonResponse({"Status": True})
+        return JsonResponse(
+            {"Status": False, "Errors": "Заказ нельзя отменить"}, status=400
+        )
+
 
 class ProductInfoView(APIView):
     """
-    Класс по отражению всех товаров или по магазину или по категории.
+    Класс по отражению товаров с фильтрами по магазину, категории, цене и параметрам.
+    Выдача постраничная по курсору, fields= ограничивает набор полей.
     """
 
+    flat_fields = ("id", "model", "shop", "quantity", "image", "price", "price_rrc")
+    read_from_replica = True
+
     @extend_schema(summary="Получить список товаров по магазину или по категориям")
     def get(self, request, *args, **kwargs):
-        query = Q(shop_id__state=True)
+        """С stream=1 вся выборка после курсора отдается потоком, без limit и кеша."""
+        if wants_stream(request):
+            return self.stream_response(request)
+        shop_id = request.query_params.get("shop_id")
+        return cached_json_response(
+            request,
+            "product_infos",
+            lambda: self.build_response(request),
+            shop_id=shop_id if shop_id and shop_id.isdigit() else None,
+        )
+
+    def build_response(self, request):
+        params = request.query_params
+        try:
+            paginator = KeysetPagination(params)
+            fields = self.get_fields(params.get("fields"))
+            queryset = ProductInfo.objects.filter(self.get_filters(params))
+        except (PaginationError, ValueError) as error:
+            return JsonResponse({"Status": False, "Errors": str(error)}, status=400)
+
+        if set(fields) <= set(self.flat_fields):
+            sort_fields = [field.lstrip("-") for field in paginator.fields]
+            rows = paginator.paginate(queryset).values(
+                *dict.fromkeys((*fields, *sort_fields))
+            )
+            rows, next_cursor = paginator.get_page(rows, dict.__getitem__)
+            data = self.format_rows(rows, fields)
+        else:
+            rows, next_cursor = paginator.get_page(
+                product_info_values(paginator.paginate(queryset)), dict.__getitem__
+            )
+            with serialization_timer():
+                data = serialize_product_infos(rows, fields)
+        with serialization_timer():
+            return JsonResponse(
+                {"Status": True, "Data": data, "Next": next_cursor}, status=200
+            )
+
+    def stream_response(self, request):
+        params = request.query_params
+        try:
+            paginator = KeysetPagination(params)
+            fields = self.get_fields(params.get("fields"))
+            queryset = paginator.ordered(
+                ProductInfo.objects.filter(self.get_filters(params))
+            )
+        except (PaginationError, ValueError) as error:
+            return JsonResponse({"Status": False, "Errors": str(error)}, status=400)
+
+        if set(fields) <= set(self.flat_fields):
+            chunks = iter_chunks(
+                queryset.values(*fields),
+                lambda chunk: self.format_rows(chunk, fields),
+            )
+        else:
+            chunks = iter_chunks(
+                product_info_values(queryset),
+                lambda chunk: serialize_product_infos(chunk, fields),
+            )
+        return StreamingJsonResponse({"Status": True}, "Data", chunks)
+
+    @staticmethod
+    def format_rows(rows, fields):
+        storage = ProductInfo._meta.get_field("image").storage
+        return [
+            {
+                field: storage.url(row[field])
+                if field == "image" and row[field]
+                else row[field]
+                for field in fields
+            }
+            for row in rows
+        ]
+
+    @staticmethod
+    def get_fields(value):
+        allowed = ProductInfoSerializer.Meta.fields
+        if not value:
+            return allowed
+        fields = tuple(dict.fromkeys(field.strip() for field in value.split(",")))
+        unknown = set(fields) - set(allowed)
+        if unknown:
+            raise ValueError(f"Неизвестные поля: {', '.join(sorted(unknown))}")
+        return fields
+
+    @staticmethod
+    def get_filters(params):
+        query = Q(shop__state=True, is_active=True)
+        for param, lookup in (
+            ("shop_id", "shop_id"),
+            ("category_id", "product__category_id"),
+            ("price_min", "price__gte"),
+            ("price_max", "price__lte"),
+        ):
+            value = params.get(param)
+            if value:
+                if not value.isdigit():
+                    raise ValueError(f"{param} должен быть числом")
+                query &= Q(**{lookup: int(value)})
+        for parameter in params.getlist("parameter"):
+            name, separator, value = parameter.partition(":")
+            if not separator:
+                raise ValueError("parameter указывается в виде Название:значение")
+            query &= Q(
+                Exists(
+                    ProductParameter.objects.filter(
+                        product_info=OuterRef("pk"), parameter__name=name, value=value
+                    )
+                )
+            )
+        return query
+
+
+class ProductSearchView(APIView):
+    """
+    Класс полнотекстового поиска товаров с фасетами по категориям, магазинам и параметрам.
+    """
+
+    read_from_replica = True
+
+    @extend_schema(summary="Поиск товаров")
+    def get(self, request, *args, **kwargs):
         shop_id = request.query_params.get("shop_id")
-        category_id = request.query_params.get("category_id")
-
-        if shop_id:
-            query &= Q(shop_id=shop_id)
-        if category_id:
-            query &= Q(product__category_id=category_id)
-        queryset = (
-            ProductInfo.objects.filter(query)
-            .select_related("shop", "product__category")
-            .prefetch_related("product_param__parameter")
+        return cached_json_response(
+            request,
+            "search",
+            lambda: self.build_response(request),
+            shop_id=shop_id if shop_id and shop_id.isdigit() else None,
         )
 
-        serializer = ProductInfoSerializer(queryset, many=True)
-        return JsonResponse({"Status": True, "Data": serializer.data}, status=200)
+    def build_response(self, request):
+        try:
+            result = search_products(request.query_params)
+        except SearchError as error:
+            return JsonResponse({"Status": False, "Errors": str(error)}, status=400)
+        return JsonResponse(
+            {"Status": True, "Data": result["hits"], "Facets": result["facets"]}
+        )
 
 
 class PartnerOrders(APIView):
@@ -671,64 +931,167 @@ class PartnerOrders(APIView):
     Класс для получения заказов поставщиками
     """
 
+    permission_classes = (IsAuthenticated,)
+
     @extend_schema(summary="Получить список заказов для магазина")
     def get(self, request, *args, **kwargs):
+        """
+        Лента заказов магазина: в заказе только позиции этого магазина,
+        сумма считается по ним же. Постранично по дате, фильтры id и status.
+        """
         if request.user.type != "shop":
             return JsonResponse(
                 {"Status": False, "Error": "Только для магазинов"}, status=403
             )
-        id_order = request.data.get("id")
-        if id_order:
-            orders = (
-                Order.objects.filter(
-                    ordered_items__product_info__shop__user_id=request.user.id,
-                    id=id_order,
-                )
-                .exclude(status="basket")
-                .prefetch_related(
-                    "ordered_items__product_info__product",
-                    "ordered_items__product_info__product_param__parameter",
+        try:
+            paginator = OrderFeedPagination(request.query_params)
+        except PaginationError as error:
+            return JsonResponse({"Status": False, "Errors": str(error)}, status=400)
+
+        shop_items = OrderItem.objects.filter(
+            product_info__shop__user_id=request.user.id
+        )
+        orders = (
+            Order.objects.filter(id__in=shop_items.values("order_id"))
+            .exclude(status="basket")
+            .annotate(
+                shop_total=Coalesce(
+                    Subquery(
+                        shop_items.filter(order_id=OuterRef("pk"))
+                        .values("order_id")
+                        .annotate(total=Sum(F("quantity") * F("price")))
+                        .values("total")
+                    ),
+                    0,
                 )
-                .annotate(
-                    total=Sum(
-                        F("ordered_items__quantity")
-                        * F("ordered_items__product_info__price")
-                    )
+            )
+            .prefetch_related(
+                Prefetch(
+                    "ordered_items",
+                    queryset=shop_items.select_related(
+                        "product_info__product__category"
+                    ).prefetch_related(
+                        Prefetch(
+                            "product_info__product_param",
+                            queryset=ProductParameter.objects.select_related(
+                                "parameter"
+                            ),
+                        )
+                    ),
+                    to_attr="shop_items",
                 )
-                .distinct()
-                .values()
             )
+        )
 
-            for order in orders:
-                prod = OrderItem.objects.filter(
-                    product_info__shop__user_id=request.user.id, order_id=order["id"]
-                )
-                order.update({"ordered_items": prod})
-            serializer = PartnerOrderSerializer(orders, many=True)
-            return JsonResponse({"Orders": serializer.data}, status=200)
-        else:
-            orders = (
-                Order.objects.filter(
-                    ordered_items__product_info__shop__user_id=request.user.id
-                )
-                .exclude(status="basket")
-                .prefetch_related(
-                    "ordered_items__product_info__product",
-                    "ordered_items__product_info__product_param__parameter",
+        id_order = request.query_params.get("id", request.data.get("id"))
+        if id_order:
+            if not str(id_order).isdigit():
+                return JsonResponse(
+                    {"Status": False, "Errors": "id должен быть числом"}, status=400
                 )
-                .annotate(
-                    total=Sum(
-                        F("ordered_items__quantity")
-                        * F("ordered_items__product_info__price")
-                    )
+            orders = orders.filter(id=id_order)
+        status = request.query_params.get("status")
+        if status:
+            if status not in dict(STATE_CHOICES) or status == "basket":
+                return JsonResponse(
+                    {"Status": False, "Errors": "Неизвестный статус заказа"},
+                    status=400,
                 )
-                .distinct()
-                .values()
+            orders = orders.filter(status=status)
+
+        page, next_cursor = paginator.get_page(
+            paginator.paginate(orders), paginator.cursor_value
+        )
+        serializer = PartnerOrderSerializer(page, many=True)
+        with serialization_timer():
+            return JsonResponse(
+                {"Status": True, "Orders": serializer.data, "Next": next_cursor},
+                status=200,
             )
-            for order in orders:
-                prod = OrderItem.objects.filter(
-                    product_info__shop__user_id=request.user.id, order_id=order["id"]
-                )
-                order.update({"ordered_items": prod})
-            serializer = PartnerOrderSerializer(orders, many=True)
-            return JsonResponse({"Orders": serializer.data}, status=200)
+
+    @extend_schema(summary="Изменить статус заказов магазина")
+    def post(self, request, *args, **kwargs):
+        """
+        Переводит заказы ids в статус status (confirmed, assembled, sent,
+        delivered) одним запросом. Меняются только заказы с товарами магазина,
+        которые сейчас в предшествующем статусе, в ответе результат по каждому id.
+        """
+        if request.user.type != "shop":
+            return JsonResponse(
+                {"Status": False, "Error": "Только для магазинов"}, status=403
+            )
+        status = request.data.get("status")
+        order_ids = request.data.get("ids")
+        if not status or not order_ids:
+            return JsonResponse(
+                {"Status": False, "Errors": "Указаны не все необходимые аргументы"},
+                status=400,
+            )
+        if status not in PARTNER_STATUSES:
+            return JsonResponse(
+                {"Status": False, "Errors": "Недопустимый статус заказа"}, status=400
+            )
+        if isinstance(order_ids, str):
+            order_ids = order_ids.split(",")
+        if not isinstance(order_ids, list) or not all(
+            str(order_id).strip().isdigit() for order_id in order_ids
+        ):
+            return JsonResponse(
+                {"Status": False, "Errors": "ids должен быть списком чисел"},
+                status=400,
+            )
+        if len(order_ids) > TRANSITION_MAX_ORDERS:
+            return JsonResponse(
+                {
+                    "Status": False,
+                    "Errors": f"Не больше {TRANSITION_MAX_ORDERS} заказов за запрос",
+                },
+                status=400,
+            )
+
+        orders = Order.objects.filter(
+            id__in=OrderItem.objects.filter(
+                product_info__shop__user_id=request.user.id
+            ).values("order_id")
+        )
+        results = transition_orders(
+            orders, [int(order_id) for order_id in order_ids], status
+        )
+        return JsonResponse(
+            {
+                "Status": True,
+                "Changed": sum(result["Status"] for result in results),
+                "Results": results,
+            }
+        )
+
+
+class IsMetricsScraper(BasePermission):
+    """Администратор или сборщик метрик с токеном METRICS_TOKEN"""
+
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        return bool(settings.METRICS_TOKEN) and hmac.compare_digest(
+            request.META.get("HTTP_AUTHORIZATION", ""),
+            f"Bearer {settings.METRICS_TOKEN}",
+        )
+
+
+class MetricsView(APIView):
+    """
+    Метрики запросов к API в текстовом формате Prometheus.
+    Только для администраторов и сборщика метрик.
+    """
+
+    permission_classes = (IsMetricsScraper,)
+    throttle_classes = ()
+
+    @extend_schema(exclude=True)
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(
+            registry.render()
+            + render_cache_stats(get_cache_stats())
+            + render_auth_cache_stats(auth_cache.get_stats()),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "backend.apps.BackendConfig",
     "rest_framework",
     "rest_framework.authtoken",
@@ -55,6 +56,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "backend.middleware.RequestMetricsMiddleware",
+    "backend.middleware.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -66,6 +69,13 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "diplom.urls"
 
+# Порог, после которого запрос пишется в лог вместе со списком SQL-запросов
+SLOW_REQUEST_QUERIES = int(os.getenv("SLOW_REQUEST_QUERIES", 50))
+SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", 500))
+# Токен сборщика метрик: GET /metrics с заголовком Authorization: Bearer <токен>.
+# Без токена /metrics доступен только администраторам.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -96,9 +106,34 @@ DATABASES = {
         "PORT": os.getenv("DB_PORT"),
         "USER": os.getenv("DB_USER"),
         "PASSWORD": os.getenv("DB_PASSWORD"),
+        # постоянные подключения вместо нового на каждый запрос
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
+        # для PgBouncer в режиме transaction: iterator() без серверных курсоров
+        "DISABLE_SERVER_SIDE_CURSORS": os.getenv("DB_DISABLE_SERVER_SIDE_CURSORS")
+        == "1",
     }
 }
 
+# Реплики для чтения каталога: DB_REPLICA_HOSTS=host1,host2 -> replica_1, replica_2
+DATABASE_REPLICAS = []
+for number, host in enumerate(
+    filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(",")), 1
+):
+    alias = f"replica_{number}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host.strip(),
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ["backend.routers.ReplicaRouter"]
+# Сколько секунд после изменяющего запроса клиент читает только с основной базы
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 10))
+# Сколько секунд кешируются ответы каталога, прочитанные с реплики: реплика
+# могла еще не получить изменения, после которых кеш был сброшен
+REPLICA_CACHE_TIMEOUT = int(os.getenv("REPLICA_CACHE_TIMEOUT", 10))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -128,6 +163,13 @@ EMAIL_HOST_USER = os.getenv("EMAIL_HOST")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 EMAIL_PORT = 587
 
+# Очередь писем: размер пачки, писем в секунду (0 - без ограничения),
+# число попыток и задержка перед первой повторной отправкой в секундах
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", 100))
+EMAIL_OUTBOX_RATE = float(os.getenv("EMAIL_OUTBOX_RATE", 10))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", 5))
+EMAIL_OUTBOX_RETRY_DELAY = int(os.getenv("EMAIL_OUTBOX_RETRY_DELAY", 60))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -149,6 +191,9 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 MEDIA_URL = "/media/"
 
+# Загруженные аватары пишутся частями в MEDIA_ROOT/staging и обрабатываются воркером
+AVATAR_MAX_UPLOAD_SIZE = int(os.getenv("AVATAR_MAX_UPLOAD_SIZE", 10 * 1024 * 1024))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -162,7 +207,7 @@ AUTHENTICATION_BACKENDS = (
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "backend.authentication.CachedTokenAuthentication",
     ],
     "DEFAULT_THROTTLE_CLASSES": [
         "rest_framework.throttling.AnonRateThrottle",
@@ -198,3 +243,27 @@ REST_FRAMEWORK = {
 # Celery settings
 CELERY_BROKER_URL = "redis://localhost:6379"
 CELERY_RESULT_BACKEND = "redis://localhost:6379"
+CELERY_BEAT_SCHEDULE = {
+    "release-expired-reservations": {
+        "task": "backend.tasks.release_expired_reservations_task",
+        "schedule": 60,
+    },
+    "relay-order-events": {
+        "task": "backend.tasks.relay_order_events_task",
+        "schedule": 30,
+    },
+    "send-outbox-emails": {
+        "task": "backend.tasks.send_outbox_emails_task",
+        "schedule": 10,
+    },
+}
+
+# Сколько секунд товары нового заказа зарезервированы до подтверждения магазином
+ORDER_RESERVATION_TIMEOUT = int(os.getenv("ORDER_RESERVATION_TIMEOUT", 24 * 60 * 60))
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL", "redis://localhost:6379"),
+    }
+}
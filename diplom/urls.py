@@ -20,12 +20,15 @@ from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 from diplom.settings import MEDIA_ROOT, MEDIA_URL, STATIC_ROOT, STATIC_URL
 from django.conf.urls.static import static
 
+from backend.views import MetricsView
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/v1/", include("backend.urls", namespace="backend")),
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path("api/docs/", SpectacularSwaggerView.as_view(url_name="schema"), name="docs"),
     path("baton/", include("baton.urls")),
+    path("metrics", MetricsView.as_view(), name="metrics"),
 ]
 urlpatterns += static(MEDIA_URL, document_root=MEDIA_ROOT)
 urlpatterns += static(STATIC_URL, document_root=STATIC_ROOT)
@@ -2,7 +2,7 @@ import pytest
 from rest_framework.test import APIClient
 from model_bakery import baker
 
-from backend.models import CustomUser, Shop
+from backend.models import CustomUser, Parameter, ProductParameter, Shop
 from rest_framework.authtoken.models import Token
 
 
@@ -322,3 +322,88 @@ class TestProductInfo:
         data = response.json()
         print(data)
         assert data["Data"][0]["model"] == product_info.model
+
+    def test_productinfo_inactive_hidden(
+        self, shop_create, client, product_info_create, products_create, category_create
+    ):
+        shop = shop_create()
+        product = products_create(category_id=category_create().id)
+        product_info_create(shop_id=shop.id, product_id=product.id, is_active=False)
+        response = client.get(self.endpoint, data={"shop_id": shop.id})
+        assert response.status_code == 200
+        assert response.json()["Data"] == []
+
+    @pytest.fixture
+    def product(self, products_create, category_create):
+        return products_create(category_id=category_create().id)
+
+    def test_productinfo_keyset_pages(
+        self, client, shop_create, product_info_create, product
+    ):
+        shop = shop_create()
+        prices = [300, 100, 200, 100, 300, 100, 200]
+        for price in prices:
+            product_info_create(shop_id=shop.id, product_id=product.id, price=price)
+
+        seen, cursor = [], None
+        while True:
+            params = {"ordering": "price", "limit": 2, "fields": "id,price"}
+            if cursor:
+                params["cursor"] = cursor
+            data = client.get(self.endpoint, data=params).json()
+            assert all(set(row) == {"id", "price"} for row in data["Data"])
+            seen += data["Data"]
+            cursor = data["Next"]
+            if cursor is None:
+                break
+
+        assert [row["price"] for row in seen] == sorted(prices)
+        assert len({row["id"] for row in seen}) == len(prices)
+
+    def test_productinfo_page_query_count(
+        self,
+        client,
+        shop_create,
+        product_info_create,
+        product,
+        django_assert_num_queries,
+    ):
+        shop = shop_create()
+        product_info_create(shop_id=shop.id, product_id=product.id, _quantity=30)
+        first = client.get(self.endpoint, data={"limit": 10}).json()
+
+        with django_assert_num_queries(2):
+            response = client.get(
+                self.endpoint, data={"limit": 10, "cursor": first["Next"]}
+            )
+        assert len(response.json()["Data"]) == 10
+
+    def test_productinfo_filters(
+        self, client, shop_create, product_info_create, product
+    ):
+        shop = shop_create()
+        cheap = product_info_create(shop_id=shop.id, product_id=product.id, price=100)
+        expensive = product_info_create(
+            shop_id=shop.id, product_id=product.id, price=500
+        )
+        color = Parameter.objects.create(name="Цвет")
+        ProductParameter.objects.create(
+            product_info=expensive, parameter=color, value="белый"
+        )
+        ProductParameter.objects.create(
+            product_info=cheap, parameter=color, value="черный"
+        )
+
+        response = client.get(self.endpoint, data={"price_min": 200})
+        assert [row["id"] for row in response.json()["Data"]] == [expensive.id]
+        response = client.get(self.endpoint, data={"parameter": "Цвет:черный"})
+        data = response.json()["Data"]
+        assert [row["id"] for row in data] == [cheap.id]
+        assert data[0]["product_parameters"] == [
+            {"parameter": "Цвет", "value": "черный"}
+        ]
+
+    def test_productinfo_bad_params(self, client):
+        assert client.get(self.endpoint, data={"cursor": "bad"}).status_code == 400
+        assert client.get(self.endpoint, data={"fields": "secret"}).status_code == 400
+        assert client.get(self.endpoint, data={"limit": 0}).status_code == 400
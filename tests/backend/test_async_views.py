@@ -0,0 +1,87 @@
+import pytest
+from model_bakery import baker
+from rest_framework.throttling import AnonRateThrottle
+
+from backend.models import Parameter, ProductParameter
+from backend.orders import checkout
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def goods(goods_create, category_create, shop_create):
+    goods = goods_create(category=category_create())
+    # магазины добавлены не в порядке Shop.Meta.ordering
+    goods[0].product.category.shops.add(goods[0].shop, shop_create(name="ЯЯЯ"))
+    parameter = baker.make(Parameter, name="Цвет")
+    for info in goods:
+        baker.make(ProductParameter, product_info=info, parameter=parameter)
+    return goods
+
+
+@pytest.mark.parametrize(
+    "sync_url, async_url",
+    [
+        ("/api/v1/shops", "/api/v1/async/shops"),
+        ("/api/v1/category", "/api/v1/async/category"),
+        ("/api/v1/products?limit=1", "/api/v1/async/products?limit=1"),
+        (
+            "/api/v1/products?fields=id,price&price_min=200",
+            "/api/v1/async/products?fields=id,price&price_min=200",
+        ),
+    ],
+)
+def test_catalog_matches_sync(client, goods, sync_url, async_url):
+    expected = client.get(sync_url)
+    response = client.get(async_url)
+    assert response.status_code == expected.status_code == 200
+    assert response.json() == expected.json()
+
+
+def test_orders_match_sync(client, buyer, goods, contact_create):
+    client.post(
+        "/api/v1/basket",
+        {"items": [{"product_info": info.id, "quantity": 2} for info in goods]},
+        format="json",
+    )
+    order_id = client.get("/api/v1/basket").json()["answer"][0]["id"]
+    checkout(buyer.id, order_id, contact_create(user=buyer).id)
+    client.post(
+        "/api/v1/basket",
+        {"items": [{"product_info": goods[0].id, "quantity": 1}]},
+        format="json",
+    )
+
+    for sync_url, async_url in (
+        ("/api/v1/basket", "/api/v1/async/basket"),
+        ("/api/v1/order", "/api/v1/async/order"),
+    ):
+        assert client.get(async_url).json() == client.get(sync_url).json()
+
+
+def test_invalid_cursor(client):
+    response = client.get("/api/v1/async/products?cursor=broken")
+    assert response.status_code == 400
+    assert response.json()["Status"] is False
+
+
+def test_requires_token(client):
+    assert client.get("/api/v1/async/basket").status_code == 401
+    client.credentials(HTTP_AUTHORIZATION="Token missing")
+    assert client.get("/api/v1/async/order").status_code == 401
+
+
+def test_get_only(client):
+    assert client.post("/api/v1/async/shops").status_code == 405
+
+
+def test_throttled_like_sync(client, monkeypatch):
+    monkeypatch.setattr(AnonRateThrottle, "THROTTLE_RATES", {"anon": "2/minute"})
+    assert client.get("/api/v1/async/shops").status_code == 200
+    assert client.get("/api/v1/shops").status_code == 200
+
+    response = client.get("/api/v1/async/category")
+    assert response.status_code == 429
+    assert int(response["Retry-After"]) > 0
+    assert client.get("/api/v1/shops").status_code == 429
@@ -0,0 +1,112 @@
+import pytest
+from rest_framework.authtoken.models import Token
+
+from backend.authentication import LocalCache, auth_cache
+
+
+pytestmark = pytest.mark.django_db
+
+STATE_ENDPOINT = "/api/v1/partner/state"
+
+
+@pytest.fixture
+def partner(create_user, shop_create, client):
+    user = create_user(email="shop@example.com", type="shop", is_active=True)
+    shop_create(user=user, state=True)
+    token = Token.objects.create(user=user)
+    client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    return user
+
+
+def test_warm_cache_skips_auth_query(client, partner, django_assert_num_queries):
+    # токен с пользователем, магазин
+    with django_assert_num_queries(2):
+        assert client.get(STATE_ENDPOINT).status_code == 200
+    with django_assert_num_queries(1):
+        assert client.get(STATE_ENDPOINT).status_code == 200
+
+    auth_cache.local.clear()
+    with django_assert_num_queries(1):
+        assert client.get(STATE_ENDPOINT).status_code == 200
+    stats = auth_cache.get_stats()
+    assert (stats["misses"], stats["local_hits"], stats["redis_hits"]) == (1, 1, 1)
+
+
+def test_cached_user_fields(client, partner, django_assert_num_queries):
+    client.get(STATE_ENDPOINT)
+    # тип пользователя и магазин взяты из кеша
+    with django_assert_num_queries(0):
+        response = client.post(
+            "/api/v1/partner/update",
+            {"image": "http://example.com/a.png", "external_id": "x"},
+        )
+    assert response.status_code == 400
+
+
+def test_password_change_invalidates(
+    client, partner, django_capture_on_commit_callbacks
+):
+    client.get(STATE_ENDPOINT)
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post("/api/v1/users/details", {"password": "N3w-Passw0rd!"})
+        # до коммита кеш не сбрасывается
+        assert auth_cache.local.entries != {}
+    assert response.status_code == 200
+    assert response.json()["user"]["email"] == partner.email
+    assert auth_cache.local.entries == {}
+
+    partner.refresh_from_db()
+    assert partner.check_password("N3w-Passw0rd!")
+    assert partner.company == ""
+    assert client.get(STATE_ENDPOINT).status_code == 200
+
+
+def test_logout(client, partner, django_capture_on_commit_callbacks):
+    client.get(STATE_ENDPOINT)
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post("/api/v1/user/logout")
+    assert response.status_code == 200
+    assert not Token.objects.filter(user=partner).exists()
+    assert client.get(STATE_ENDPOINT).status_code == 401
+
+
+def test_deleted_and_inactive_users(
+    client, partner, django_capture_on_commit_callbacks
+):
+    client.get(STATE_ENDPOINT)
+    with django_capture_on_commit_callbacks(execute=True):
+        partner.is_active = False
+        partner.save()
+    assert client.get(STATE_ENDPOINT).status_code == 401
+
+    with django_capture_on_commit_callbacks(execute=True):
+        partner.delete()
+    assert client.get(STATE_ENDPOINT).status_code == 401
+
+
+def test_hit_rate_reported(client, create_user):
+    admin = create_user(email="admin@example.com", is_staff=True)
+    client.credentials(
+        HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=admin).key}"
+    )
+    client.get("/api/v1/cache/stats")
+    data = client.get("/api/v1/cache/stats").json()
+    assert data["Auth"]["hit_rate"] == 0.5
+    # сам запрос /metrics тоже проходит проверку токена
+    assert "auth_cache_local_hits_total 2" in client.get("/metrics").content.decode()
+
+
+def test_local_cache_lru_and_ttl(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("backend.authentication.time.monotonic", lambda: now[0])
+    local = LocalCache(size=2, timeout=10)
+    local.set("a", 1)
+    local.set("b", 2)
+    assert local.get("a") == 1
+    local.set("c", 3)
+    assert local.get("b") is None
+    assert local.get("a") == 1
+
+    now[0] = 11
+    assert local.get("a") is None
+    assert local.get("c") is None
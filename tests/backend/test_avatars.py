@@ -0,0 +1,91 @@
+import io
+import json
+import os
+
+import PIL.Image as Image
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from backend.models import AvatarUser
+from backend.tasks import upload_image
+from backend.thumbnails import thumbnail_name
+
+
+pytestmark = pytest.mark.django_db
+
+ENDPOINT = "/api/v1/avatar"
+
+
+def image_file(name="me.jpg", size=(2000, 1500), image_format="JPEG"):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "green").save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        "backend.views.upload_image.delay", lambda **kwargs: calls.append(kwargs)
+    )
+    return calls
+
+
+def staged_files(media):
+    staging = media / "staging"
+    return sorted(os.listdir(staging)) if staging.exists() else []
+
+
+def test_upload_is_staged_not_sent_to_broker(client, create_user, media, queued):
+    user = create_user(email="buyer@example.com")
+    response = client.post(
+        ENDPOINT,
+        {"user_id": user.id, "avatar": image_file(), "extra": image_file("x.png")},
+        format="multipart",
+    )
+    assert response.status_code == 200
+
+    (kwargs,) = queued
+    assert len(json.dumps(kwargs)) < 100
+    assert kwargs["user_id"] == user.id
+    assert staged_files(media) == [os.path.basename(kwargs["staging_name"])]
+
+    result = upload_image(**kwargs)
+    assert result["Status"] is True
+    avatar = AvatarUser.objects.get(user=user)
+    assert avatar.avatar.name.startswith("images/")
+    with Image.open(avatar.avatar.path) as image:
+        assert max(image.size) == 1024
+    assert (media / thumbnail_name(avatar.avatar.name, "small", "webp")).exists()
+    assert staged_files(media) == []
+
+
+def test_invalid_image_rejected(client, create_user, media, queued):
+    user = create_user(email="buyer@example.com")
+    client.post(
+        ENDPOINT,
+        {"user_id": user.id, "avatar": SimpleUploadedFile("me.jpg", b"not image")},
+        format="multipart",
+    )
+    result = upload_image(**queued[0])
+    assert result["Status"] is False
+    assert not AvatarUser.objects.exists()
+    assert staged_files(media) == []
+
+
+def test_missing_arguments_clean_staging(client, media, queued):
+    response = client.post(ENDPOINT, {"avatar": image_file()}, format="multipart")
+    assert response.status_code == 400
+    assert queued == []
+    assert staged_files(media) == []
+
+
+def test_upload_size_limit(client, create_user, media, queued, settings):
+    settings.AVATAR_MAX_UPLOAD_SIZE = 1024
+    user = create_user(email="buyer@example.com")
+    response = client.post(
+        ENDPOINT, {"user_id": user.id, "avatar": image_file()}, format="multipart"
+    )
+    assert response.status_code == 400
+    assert queued == []
+    assert staged_files(media) == []
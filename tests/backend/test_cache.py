@@ -0,0 +1,114 @@
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+from rest_framework.authtoken.models import Token
+
+from backend.cache import get_cache_stats
+
+
+pytestmark = pytest.mark.django_db
+
+
+class TestCatalogCache:
+    def test_hit_skips_database(self, client, shop_create, django_assert_num_queries):
+        shop_create(_quantity=3)
+        first = client.get("/api/v1/shops")
+
+        with django_assert_num_queries(0):
+            second = client.get("/api/v1/shops")
+
+        assert first.status_code == second.status_code == 200
+        assert first.content == second.content
+        stats = get_cache_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+    def test_query_params_are_part_of_key(self, client, shop_create):
+        shop = shop_create()
+        other = shop_create()
+        client.get("/api/v1/products", data={"shop_id": shop.id})
+        client.get("/api/v1/products", data={"shop_id": other.id})
+        assert get_cache_stats()["misses"] == 2
+
+    def test_save_invalidates(
+        self, client, shop_create, django_capture_on_commit_callbacks
+    ):
+        shop = shop_create(name="Old")
+        client.get("/api/v1/shops")
+        with django_capture_on_commit_callbacks(execute=True):
+            shop.name = "New"
+            shop.save()
+            # до коммита кеш не сбрасывается
+            assert get_cache_stats()["invalidations"] == 0
+        response = client.get("/api/v1/shops")
+        assert response.json()[0]["name"] == "New"
+
+    def test_partner_state_invalidates(self, client, create_user, shop_create):
+        user = create_user(email="shop@example.com", type="shop")
+        shop = shop_create(user_id=user.id, state=True)
+        token = Token.objects.create(user=user)
+        client.get("/api/v1/shops")
+
+        client.post(
+            "/api/v1/partner/state",
+            headers={"Authorization": f"Token {token.key}"},
+            data={"state": "False"},
+        )
+
+        response = client.get("/api/v1/shops")
+        assert response.json()[0]["state"] is False
+        assert get_cache_stats()["invalidations"] >= 1
+
+    def test_errors_are_not_cached(self, client):
+        client.get("/api/v1/products", data={"limit": "x"})
+        client.get("/api/v1/products", data={"limit": "x"})
+        assert get_cache_stats()["hits"] == 0
+
+    def test_replica_reads_cached_briefly(self, client, shop_create, settings):
+        # реплика - та же база, важно только, что чтение пошло через роутер
+        settings.DATABASE_REPLICAS = ["default"]
+        settings.REPLICA_CACHE_TIMEOUT = -1
+        shop_create()
+        client.get("/api/v1/shops")
+        client.get("/api/v1/shops")
+        assert get_cache_stats()["misses"] == 2
+
+        settings.DATABASE_REPLICAS = []
+        client.get("/api/v1/shops")
+        client.get("/api/v1/shops")
+        assert get_cache_stats()["hits"] == 1
+
+    def test_redis_down_fails_open(self, client, shop_create, monkeypatch):
+        class DownCache:
+            def __getattr__(self, name):
+                def fail(*args, **kwargs):
+                    raise RedisConnectionError("Redis is down")
+
+                return fail
+
+        monkeypatch.setattr("backend.cache.cache", DownCache())
+        shop = shop_create(name="Old")
+        shop.name = "New"
+        shop.save()
+
+        response = client.get("/api/v1/shops")
+        assert response.status_code == 200
+        assert response.json()[0]["name"] == "New"
+        assert client.get("/api/v1/products").status_code == 200
+        assert get_cache_stats()["hits"] == 0
+
+    def test_stats_admin_only(self, client, create_user):
+        user = create_user(email="user@example.com", type="buyer")
+        admin = create_user(email="admin@example.com", is_staff=True)
+        user_token = Token.objects.create(user=user)
+        admin_token = Token.objects.create(user=admin)
+        endpoint = "/api/v1/cache/stats"
+
+        response = client.get(
+            endpoint, headers={"Authorization": f"Token {user_token.key}"}
+        )
+        assert response.status_code == 403
+        response = client.get(
+            endpoint, headers={"Authorization": f"Token {admin_token.key}"}
+        )
+        assert response.status_code == 200
+        assert set(response.json()["Cache"]) >= {"hits", "misses", "hit_rate"}
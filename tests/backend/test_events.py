@@ -0,0 +1,149 @@
+import pytest
+from django.db import connections
+from model_bakery import baker
+
+from backend.events import RELAY_LOCK_KEY, record_order_events, relay_order_events
+from backend.models import Order, OrderEvent, OrderItem, OutboxEmail, ProductInfo
+from backend.orders import checkout, release_orders
+from backend.tasks import order_events_task
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def published(monkeypatch):
+    batches = []
+    monkeypatch.setattr(
+        "backend.tasks.order_events_task.delay", lambda events: batches.append(events)
+    )
+    return batches
+
+
+@pytest.fixture
+def basket(create_user, shop_create, products_create, category_create):
+    user = create_user(email="buyer@example.com", type="buyer")
+    order = baker.make(Order, user=user, status="basket")
+    for shop in shop_create(_quantity=2):
+        info = baker.make(
+            ProductInfo,
+            shop=shop,
+            product=products_create(category=category_create()),
+            price=100,
+            quantity=10,
+        )
+        baker.make(OrderItem, order=order, product_info=info, quantity=1)
+    return order
+
+
+def test_checkout_event_published_after_commit(
+    basket, contact_create, published, django_capture_on_commit_callbacks
+):
+    shop_ids = sorted(
+        basket.ordered_items.values_list("product_info__shop_id", flat=True)
+    )
+    with django_capture_on_commit_callbacks(execute=True):
+        checkout(basket.user_id, basket.id, contact_create(user=basket.user).id)
+        assert published == []
+
+    (events,) = published
+    assert events == [
+        {
+            "id": OrderEvent.objects.get().id,
+            "order_id": basket.id,
+            "user_id": basket.user_id,
+            "old_status": "basket",
+            "new_status": "new",
+            "shop_ids": shop_ids,
+        }
+    ]
+    assert OrderEvent.objects.filter(published_at__isnull=True).count() == 0
+
+
+def test_failed_checkout_records_nothing(basket, contact_create):
+    ProductInfo.objects.update(quantity=0)
+    with pytest.raises(ValueError):
+        checkout(basket.user_id, basket.id, contact_create(user=basket.user).id)
+    assert not OrderEvent.objects.exists()
+
+
+def test_cancel_keeps_old_status(basket, contact_create, published):
+    checkout(basket.user_id, basket.id, contact_create(user=basket.user).id)
+    Order.objects.filter(id=basket.id).update(status="confirmed")
+
+    release_orders(Order.objects.filter(id=basket.id))
+
+    event = OrderEvent.objects.get(new_status="canceled")
+    assert event.old_status == "confirmed"
+    assert len(event.shop_ids) == 2
+
+
+def test_relay_batches_in_order(create_user, published):
+    user = create_user(email="buyer@example.com")
+    orders = baker.make(Order, user=user, status="new", _quantity=2)
+    for old, new in (("new", "confirmed"), ("confirmed", "assembled")):
+        record_order_events([(order.id, user.id, old) for order in orders], new)
+
+    assert relay_order_events(batch_size=3) == 4
+    assert [len(batch) for batch in published] == [3, 1]
+    events = [event for batch in published for event in batch]
+    assert [event["id"] for event in events] == sorted(
+        OrderEvent.objects.values_list("id", flat=True)
+    )
+    assert [
+        event["new_status"] for event in events if event["order_id"] == orders[0].id
+    ] == ["confirmed", "assembled"]
+    assert relay_order_events() == 0
+
+
+def test_relay_after_commit_skips_busy_lock(
+    create_user, published, django_capture_on_commit_callbacks
+):
+    user = create_user(email="buyer@example.com")
+    order = baker.make(Order, user=user, status="new")
+    other = connections.create_connection("default")
+    try:
+        with other.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s)", [RELAY_LOCK_KEY])
+        with django_capture_on_commit_callbacks(execute=True):
+            record_order_events([(order.id, user.id, "new")], "confirmed")
+    finally:
+        other.close()
+
+    assert published == []
+    assert relay_order_events() == 1
+
+
+def test_broker_failure_keeps_events(create_user, monkeypatch):
+    def fail(events):
+        raise ConnectionError("broker is down")
+
+    monkeypatch.setattr("backend.tasks.order_events_task.delay", fail)
+    user = create_user(email="buyer@example.com")
+    order = baker.make(Order, user=user, status="new")
+    record_order_events([(order.id, user.id, "new")], "canceled")
+
+    with pytest.raises(ConnectionError):
+        relay_order_events()
+    assert OrderEvent.objects.filter(published_at__isnull=True).count() == 1
+
+
+def test_order_events_task_queues_emails(create_user, django_assert_num_queries):
+    users = [create_user(email=f"buyer{number}@example.com") for number in range(2)]
+    events = [
+        {
+            "id": number,
+            "order_id": number,
+            "user_id": user.id,
+            "old_status": "new",
+            "new_status": "sent",
+            "shop_ids": [],
+        }
+        for number, user in enumerate(users)
+    ]
+    with django_assert_num_queries(2):
+        assert order_events_task(events) == 2
+    assert sorted(email.to[0] for email in OutboxEmail.objects.all()) == [
+        user.email for user in users
+    ]
+    assert OutboxEmail.objects.first().body.endswith("Отправлен")
@@ -0,0 +1,74 @@
+import io
+
+import pytest
+import yaml
+
+from backend.feeds import FeedError, FeedReader, detect_format
+
+
+def read(content, format):
+    feed = FeedReader(io.BytesIO(content.encode("utf-8")), format)
+    return feed.shop, list(feed)
+
+
+class TestFeedReader:
+    def test_yaml_matches_full_load(self):
+        with open("data/shop1.yaml", "rb") as file:
+            feed = FeedReader(file, "yaml")
+            records = list(feed)
+        with open("data/shop1.yaml", encoding="utf-8") as file:
+            data = yaml.safe_load(file)
+
+        assert feed.shop == data["shop"]
+        assert [entry for kind, entry in records if kind == "category"] == data[
+            "categories"
+        ]
+        assert [entry for kind, entry in records if kind == "good"] == data["goods"]
+
+    def test_yaml_shop_must_be_first(self):
+        with pytest.raises(FeedError):
+            read("categories:\n  - id: 1\n    name: Flash\nshop: Test\n", "yaml")
+
+    def test_jsonl(self):
+        shop, records = read(
+            '{"shop": "Test"}\n'
+            '{"category": {"id": 1, "name": "Flash"}}\n'
+            "\n"
+            '{"good": {"id": 5, "category": 1, "name": "USB"}}\n',
+            "jsonl",
+        )
+        assert shop == "Test"
+        assert records == [
+            ("category", {"id": 1, "name": "Flash"}),
+            ("good", {"id": 5, "category": 1, "name": "USB"}),
+        ]
+
+    def test_csv(self):
+        shop, records = read(
+            "shop,category,category_name,id,name,model,price,price_rrc,quantity,param:Цвет\n"
+            "Test,1,Flash,5,USB,usb/1,100,120,3,белый\n"
+            "Test,1,Flash,6,USB 2,usb/2,200,220,4,\n",
+            "csv",
+        )
+        assert shop == "Test"
+        # числа приводит к int импортер, как и для других форматов
+        assert records[0] == ("category", {"id": "1", "name": "Flash"})
+        assert records[1] == (
+            "good",
+            {
+                "id": "5",
+                "category": "1",
+                "price": "100",
+                "price_rrc": "120",
+                "quantity": "3",
+                "name": "USB",
+                "model": "usb/1",
+                "parameters": {"Цвет": "белый"},
+            },
+        )
+        assert records[2][1]["parameters"] == {}
+
+    def test_detect_format(self):
+        assert detect_format("http://example.com/feed.csv?token=1") == "csv"
+        assert detect_format("http://example.com/feed.jsonl") == "jsonl"
+        assert detect_format("http://example.com/feed") == "yaml"
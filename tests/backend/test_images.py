@@ -0,0 +1,141 @@
+import hashlib
+import io
+import os
+import threading
+
+import PIL.Image as Image
+
+import pytest
+import requests
+from model_bakery import baker
+
+from backend.images import ImageFetcher, image_name
+from backend.models import ProductInfo
+from backend.tasks import fetch_images
+
+
+pytestmark = pytest.mark.django_db
+
+
+def png_bytes(color="red"):
+    buffer = io.BytesIO()
+    Image.new("RGB", (600, 300), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+PNG = png_bytes()
+
+
+class FakeResponse:
+    def __init__(self, url, status_code=200):
+        self.url = url
+        self.status_code = status_code
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}", response=self)
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(PNG), chunk_size):
+            yield PNG[start : start + chunk_size]
+
+
+class FakeSession:
+    """Отвечает по списку статусов для ссылки, по умолчанию 200."""
+
+    def __init__(self, statuses=None):
+        self.statuses = statuses or {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        with self.lock:
+            self.calls.append(url)
+            statuses = self.statuses.get(url, [])
+            status = statuses.pop(0) if statuses else 200
+        if status is None:
+            raise requests.ConnectionError("connection reset")
+        return FakeResponse(url, status)
+
+
+def test_fetch_all_dedup_and_cache(media):
+    session = FakeSession()
+    fetcher = ImageFetcher(session=session, backoff=0)
+    urls = ["http://example.com/a.png", "http://example.com/b.jpg"]
+
+    fetched, errors = fetcher.fetch_all(urls + urls)
+    assert errors == {}
+    assert sorted(session.calls) == sorted(urls)
+    assert fetched[urls[0]] == image_name(urls[0])
+    assert (media / fetched[urls[0]]).read_bytes() == PNG
+    assert not any(
+        name.endswith(".part") for _, _, files in os.walk(media) for name in files
+    )
+
+    fetcher.fetch_all(urls)
+    assert len(session.calls) == 2
+
+
+def test_retry_with_backoff(media):
+    url = "http://example.com/flaky.png"
+    session = FakeSession({url: [503, None, 200]})
+    fetched, errors = ImageFetcher(session=session, backoff=0).fetch_all([url])
+    assert url in fetched
+    assert session.calls == [url] * 3
+
+
+def test_errors_reported(media):
+    missing, broken = "http://example.com/404.png", "http://example.com/down.png"
+    session = FakeSession({missing: [404], broken: [500] * 3})
+    fetched, errors = ImageFetcher(session=session, retries=2, backoff=0).fetch_all(
+        [missing, broken]
+    )
+    assert fetched == {}
+    assert set(errors) == {missing, broken}
+    assert session.calls.count(missing) == 1
+    assert session.calls.count(broken) == 3
+    assert not os.path.exists(media / image_name(broken))
+
+
+def test_fetch_images_task(
+    media,
+    shop_create,
+    products_create,
+    category_create,
+    monkeypatch,
+    django_assert_num_queries,
+):
+    missing = "http://example.com/missing.png"
+    monkeypatch.setattr(
+        "backend.images.make_session", lambda workers: FakeSession({missing: [404]})
+    )
+    shop, other = shop_create(_quantity=2)
+    product = products_create(category=category_create())
+    goods = [
+        baker.make(ProductInfo, shop=shop, product=product, external_id=number)
+        for number in (1, 2, 3)
+    ]
+    foreign = baker.make(ProductInfo, shop=other, product=product, external_id=1)
+    urls = ["http://example.com/phone.png", "http://cdn.example.com/same.png"]
+
+    with django_assert_num_queries(2):
+        result = fetch_images(shop.id, [[1, urls[0]], [2, urls[1]], [3, missing]])
+
+    assert result["fetched"] == 2
+    assert result["updated"] == 2
+    assert list(result["errors"]) == [missing]
+    digest = hashlib.sha256(PNG).hexdigest()
+    original = f"images/{digest[:2]}/{digest}.png"
+    for info in goods[:2]:
+        info.refresh_from_db()
+        assert info.image.name == original
+    assert os.stat(media / original).st_nlink == 3
+    assert (media / f"thumbnails/{digest[:2]}/{digest}_small.webp").exists()
+    foreign.refresh_from_db()
+    assert foreign.image.name != original
@@ -0,0 +1,395 @@
+import io
+
+import pytest
+import ujson
+import yaml
+from django.core.files.base import ContentFile
+from rest_framework.authtoken.models import Token
+
+from backend.feeds import FeedReader
+from backend.importer import CatalogImporter
+from backend.models import (
+    Category,
+    ImportJob,
+    Order,
+    OrderItem,
+    ProductInfo,
+    ProductParameter,
+    ProductSearchIndex,
+)
+from backend.tasks import fetch_price_list, import_price_list, prefetch_images
+
+
+pytestmark = pytest.mark.django_db
+
+
+def load_feed(name):
+    with open(f"data/{name}", encoding="utf-8") as file:
+        return yaml.safe_load(file)
+
+
+def make_goods(count):
+    return [
+        {
+            "id": 1000 + index,
+            "category": 224,
+            "model": f"model/{index}",
+            "name": f"Товар {index}",
+            "price": 100 + index,
+            "price_rrc": 120 + index,
+            "quantity": 5,
+            "parameters": {"Цвет": "черный", "Память": index},
+        }
+        for index in range(count)
+    ]
+
+
+class TestCatalogImporter:
+    def test_import_feed(self, create_user, shop_create):
+        user = create_user(email="shop@example.com", type="shop")
+        shop = shop_create(user_id=user.id)
+        feed = load_feed("shop1.yaml")
+
+        stats = CatalogImporter(shop).run(feed["categories"], feed["goods"])
+
+        assert stats["categories"] == 3
+        assert stats["goods"] == stats["created"] == 4
+        assert ProductInfo.objects.filter(shop=shop).count() == 4
+        assert Category.objects.filter(shops=shop).count() == 3
+        assert ProductParameter.objects.count() == 16
+
+    def test_reimport_updates_without_duplicates(self, create_user, shop_create):
+        user = create_user(email="shop@example.com", type="shop")
+        shop = shop_create(user_id=user.id)
+        feed = load_feed("shop1.yaml")
+        CatalogImporter(shop).run(feed["categories"], feed["goods"])
+
+        feed["goods"][0]["price"] = 1
+        CatalogImporter(shop).run(feed["categories"], feed["goods"])
+
+        assert ProductInfo.objects.filter(shop=shop).count() == 4
+        assert ProductParameter.objects.count() == 16
+        info = ProductInfo.objects.get(shop=shop, external_id=feed["goods"][0]["id"])
+        assert info.price == 1
+
+    def test_sync_touches_only_changed_goods(self, create_user, shop_create):
+        user = create_user(email="shop@example.com", type="shop")
+        shop = shop_create(user_id=user.id)
+        feed = load_feed("shop1.yaml")
+        CatalogImporter(shop).run(feed["categories"], feed["goods"])
+        parameter_ids = set(ProductParameter.objects.values_list("id", flat=True))
+
+        changed, removed = feed["goods"][0], feed["goods"].pop()
+        changed["quantity"] = 1
+        stats = CatalogImporter(shop, missing="deactivate").run(
+            feed["categories"], feed["goods"]
+        )
+
+        assert stats["updated"] == 1
+        assert stats["unchanged"] == 2
+        assert stats["removed"] == 1
+        assert ProductInfo.objects.get(external_id=changed["id"]).quantity == 1
+        assert not ProductInfo.objects.get(external_id=removed["id"]).is_active
+        untouched = ProductParameter.objects.exclude(
+            product_info__external_id=changed["id"]
+        ).values_list("id", flat=True)
+        assert set(untouched) <= parameter_ids
+
+        feed["goods"].append(removed)
+        stats = CatalogImporter(shop, missing="delete").run([], feed["goods"])
+        assert stats["unchanged"] == 4
+        assert ProductInfo.objects.get(external_id=removed["id"]).is_active
+
+        stats = CatalogImporter(shop, missing="delete").run([], feed["goods"][:1])
+        assert stats["removed"] == 3
+        assert ProductInfo.objects.filter(shop=shop).count() == 1
+
+    def test_parameters_rewritten_only_when_changed(self, create_user, shop_create):
+        user = create_user(email="shop@example.com", type="shop")
+        shop = shop_create(user_id=user.id)
+        categories = [{"id": 224, "name": "Смартфоны"}]
+        goods = make_goods(2)
+        CatalogImporter(shop).run(categories, goods)
+        parameter_ids = set(ProductParameter.objects.values_list("id", flat=True))
+
+        goods[0]["price"] = 1
+        goods[1]["parameters"]["Цвет"] = "белый"
+        stats = CatalogImporter(shop).run(categories, goods)
+
+        assert stats["updated"] == 2
+        kept = ProductParameter.objects.filter(product_info__external_id=goods[0]["id"])
+        assert set(kept.values_list("id", flat=True)) <= parameter_ids
+        assert dict(
+            ProductParameter.objects.filter(
+                product_info__external_id=goods[1]["id"]
+            ).values_list("parameter__name", "value")
+        ) == {"Цвет": "белый", "Память": "1"}
+
+    def test_delete_keeps_ordered_goods(self, create_user, shop_create):
+        user = create_user(email="shop@example.com", type="shop")
+        shop = shop_create(user_id=user.id)
+        feed = load_feed("shop1.yaml")
+        CatalogImporter(shop).run(feed["categories"], feed["goods"])
+        buyer = create_user(email="buyer@example.com")
+        ordered = ProductInfo.objects.get(external_id=feed["goods"][-1]["id"])
+        order = Order.objects.create(user=buyer, status="new")
+        OrderItem.objects.create(
+            order=order, product_info=ordered, quantity=2, price=100
+        )
+        Order.objects.filter(id=order.id).update_totals()
+
+        stats = CatalogImporter(shop, missing="delete").run([], feed["goods"][:1])
+
+        assert stats["removed"] == 3
+        assert set(
+            ProductInfo.objects.filter(shop=shop).values_list("id", flat=True)
+        ) == {
+            ProductInfo.objects.get(external_id=feed["goods"][0]["id"]).id,
+            ordered.id,
+        }
+        ordered.refresh_from_db()
+        assert not ordered.is_active
+        order.refresh_from_db()
+        assert order.ordered_items.count() == 1
+        assert order.total == 200
+
+    def test_jsonl_string_values(self, create_user, shop_create):
+        user = create_user(email="shop@example.com", type="shop")
+        shop = shop_create(user_id=user.id)
+        good = {
+            "id": "2",
+            "category": "224",
+            "model": "m",
+            "name": "Товар",
+            "price": "100",
+            "price_rrc": "120",
+            "quantity": "5",
+            "parameters": {"Цвет": "черный"},
+        }
+        records = [
+            {"shop": "Связной"},
+            {"category": {"id": "224", "name": "Смартфоны"}},
+            {"good": good},
+            {"good": {**good, "id": "SKU-3"}},
+            {"good": {**good, "id": 4, "price": -1}},
+            {"good": "не товар"},
+        ]
+        content = "\n".join(ujson.dumps(record) for record in records).encode()
+
+        importer = CatalogImporter(shop, missing="delete")
+        stats = importer.run_feed(FeedReader(io.BytesIO(content), "jsonl"))
+
+        assert (stats["created"], stats["removed"]) == (1, 0)
+        info = ProductInfo.objects.get(shop=shop)
+        assert (info.external_id, info.price, info.product.category_id) == (
+            2,
+            100,
+            224,
+        )
+        assert [error["id"] for error in importer.errors] == ["SKU-3", 4, None]
+
+        stats = CatalogImporter(shop, missing="delete").run_feed(
+            FeedReader(io.BytesIO(content), "jsonl")
+        )
+        assert (stats["unchanged"], stats["removed"]) == (1, 0)
+
+    def test_errors_capped_ids_kept_only_for_missing(
+        self, create_user, shop_create, monkeypatch
+    ):
+        monkeypatch.setattr("backend.importer.IMPORT_MAX_ERRORS", 2)
+        user = create_user(email="shop@example.com", type="shop")
+        shop = shop_create(user_id=user.id)
+        categories = [{"id": 224, "name": "Смартфоны"}]
+        goods = make_goods(3) + [{"id": index} for index in range(5)]
+
+        importer = CatalogImporter(shop)
+        stats = importer.run(categories, goods)
+
+        assert stats["created"] == 3
+        assert len(importer.errors) == 2
+        assert stats["errors_dropped"] == 3
+        assert not importer.seen
+
+        importer = CatalogImporter(shop, missing="deactivate")
+        importer.run(categories, goods[:2])
+        assert importer.seen == {1000, 1001}
+
+    def test_queries_do_not_grow_with_rows(
+        self, create_user, shop_create, django_assert_max_num_queries
+    ):
+        user = create_user(email="shop@example.com", type="shop")
+        shop = shop_create(user_id=user.id)
+        categories = [{"id": 224, "name": "Смартфоны"}]
+
+        with django_assert_max_num_queries(20):
+            CatalogImporter(shop, batch_size=500).run(categories, make_goods(400))
+
+        assert ProductInfo.objects.filter(shop=shop).count() == 400
+
+    def test_reimport_queries_do_not_grow_with_rows(
+        self, create_user, shop_create, django_assert_max_num_queries
+    ):
+        user = create_user(email="shop@example.com", type="shop")
+        shop = shop_create(user_id=user.id)
+        categories = [{"id": 224, "name": "Смартфоны"}]
+        goods = make_goods(400)
+        CatalogImporter(shop, batch_size=500).run(categories, goods)
+
+        goods = goods[:200]
+        for item in goods:
+            item["parameters"]["Цвет"] = "белый"
+        with django_assert_max_num_queries(25):
+            stats = CatalogImporter(shop, batch_size=500, missing="delete").run(
+                categories, goods
+            )
+
+        assert (stats["updated"], stats["removed"]) == (200, 200)
+        assert ProductInfo.objects.filter(shop=shop).count() == 200
+        assert ProductParameter.objects.count() == 400
+        assert set(
+            ProductParameter.objects.filter(parameter__name="Цвет").values_list(
+                "value", flat=True
+            )
+        ) == {"белый"}
+        assert ProductSearchIndex.objects.count() == 200
+
+
+class FeedResponse:
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        with open(self.path, "rb") as file:
+            while chunk := file.read(chunk_size):
+                yield chunk
+
+
+class TestPartnerUpdate:
+    endpoint = "/api/v1/partner/update"
+
+    def test_post_url_starts_job(self, client, create_user, monkeypatch):
+        user = create_user(email="shop@example.com", type="shop")
+        token = Token.objects.create(user=user)
+        started = []
+        monkeypatch.setattr("backend.views.start_price_list_import", started.append)
+
+        response = client.post(
+            self.endpoint,
+            headers={"Authorization": f"Token {token.key}"},
+            data={"url": "http://example.com/shop2.yaml"},
+        )
+
+        assert response.status_code == 202
+        job = ImportJob.objects.get(id=response.json()["Job"])
+        assert started == [job]
+        assert job.status == "pending"
+        assert job.missing == "keep"
+
+    def test_post_invalid_url(self, client, create_user):
+        user = create_user(email="shop@example.com", type="shop")
+        token = Token.objects.create(user=user)
+        response = client.post(
+            self.endpoint,
+            headers={"Authorization": f"Token {token.key}"},
+            data={"url": "not-a-url"},
+        )
+        assert response.status_code == 400
+        assert ImportJob.objects.count() == 0
+
+
+class TestImportPipeline:
+    endpoint = "/api/v1/partner/update/status"
+
+    def test_pipeline(self, client, create_user, monkeypatch, settings, tmp_path):
+        settings.MEDIA_ROOT = str(tmp_path)
+        user = create_user(email="shop@example.com", type="shop")
+        token = Token.objects.create(user=user)
+        job = ImportJob.objects.create(user=user, url="http://example.com/shop1.yaml")
+        monkeypatch.setattr(
+            "backend.tasks.requests.get",
+            lambda url, **kwargs: FeedResponse("data/shop1.yaml"),
+        )
+        queued = []
+        monkeypatch.setattr(
+            "backend.tasks.fetch_images.delay",
+            lambda shop_id, images: queued.append((shop_id, images)),
+        )
+
+        prefetch_images(import_price_list(fetch_price_list(job.id)))
+
+        job.refresh_from_db()
+        assert job.status == "done"
+        assert job.rows_processed == 4
+        assert ProductInfo.objects.filter(shop__user=user).count() == 4
+        ((shop_id, images),) = queued
+        assert shop_id == job.shop_id
+        assert len(images) == 4
+        assert not job.feed
+
+        response = client.get(
+            self.endpoint, headers={"Authorization": f"Token {token.key}"}
+        )
+        assert response.status_code == 200
+        data = response.json()["Job"]
+        assert data["id"] == job.id
+        assert data["rows_processed"] == 4
+        assert data["elapsed"] is not None
+
+    def test_prefetch_skips_bad_ids(
+        self, create_user, shop_create, monkeypatch, settings, tmp_path
+    ):
+        settings.MEDIA_ROOT = str(tmp_path)
+        user = create_user(email="shop@example.com", type="shop")
+        job = ImportJob.objects.create(
+            user=user, shop=shop_create(user=user), format="jsonl"
+        )
+        goods = [
+            {"id": 1, "image": "http://example.com/1.png"},
+            {"id": "2", "image": "http://example.com/2.png"},
+            {"id": "SKU-3", "image": "http://example.com/3.png"},
+            {"id": -4, "image": "http://example.com/4.png"},
+            {"id": [5], "image": "http://example.com/5.png"},
+            {"id": 6, "image": {"url": "http://example.com/6.png"}},
+        ]
+        job.feed.save(
+            "feed.jsonl",
+            ContentFile(
+                "\n".join(
+                    ujson.dumps(record)
+                    for record in [{"shop": "Связной"}]
+                    + [{"good": good} for good in goods]
+                )
+            ),
+        )
+        queued = []
+        monkeypatch.setattr(
+            "backend.tasks.fetch_images.delay",
+            lambda shop_id, images: queued.append(images),
+        )
+
+        prefetch_images(job.id)
+
+        assert queued == [
+            [[1, "http://example.com/1.png"], [2, "http://example.com/2.png"]]
+        ]
+        job.refresh_from_db()
+        assert job.status == "done"
+
+    def test_status_not_found(self, client, create_user):
+        user = create_user(email="shop@example.com", type="shop")
+        token = Token.objects.create(user=user)
+        response = client.get(
+            self.endpoint,
+            headers={"Authorization": f"Token {token.key}"},
+            data={"job_id": 1},
+        )
+        assert response.status_code == 404
@@ -0,0 +1,244 @@
+from datetime import timedelta
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from model_bakery import baker
+from rest_framework.authtoken.models import Token
+
+from backend.importer import CatalogImporter
+from backend.models import (
+    Category,
+    CustomUser,
+    Order,
+    OrderItem,
+    Parameter,
+    Product,
+    ProductInfo,
+    ProductParameter,
+    Shop,
+)
+from backend.orders import release_expired_reservations
+
+
+pytestmark = pytest.mark.django_db
+
+SHOPS = 5
+GOODS = 250
+
+
+@pytest.fixture
+def seeded(create_user):
+    """
+    Несколько магазинов, категорий и покупателей, чтобы фильтры горячих путей
+    были избирательны, и ANALYZE. Затем seqscan запрещается для транзакции
+    теста: без подходящего индекса в плане останется Seq Scan или чужой индекс.
+    """
+    user = create_user(email="buyer@example.com", type="buyer", is_active=True)
+    partner = create_user(email="shop@example.com", type="shop", is_active=True)
+    shops = [baker.make(Shop, user=partner, state=True)] + baker.make(
+        Shop, state=True, _quantity=SHOPS - 1
+    )
+    categories = baker.make(Category, _quantity=SHOPS)
+    products = Product.objects.bulk_create(
+        Product(name=f"Товар {number}", category=categories[number % SHOPS])
+        for number in range(GOODS)
+    )
+    goods = ProductInfo.objects.bulk_create(
+        ProductInfo(
+            shop=shops[number // (GOODS // SHOPS)],
+            product=product,
+            external_id=number,
+            model="",
+            quantity=10,
+            price=number,
+            price_rrc=number,
+        )
+        for number, product in enumerate(products)
+    )
+    parameter = baker.make(Parameter, name="Цвет")
+    ProductParameter.objects.bulk_create(
+        ProductParameter(product_info=info, parameter=parameter, value=str(info.price))
+        for info in goods
+    )
+    now = timezone.now()
+    buyers = [user] + baker.make(CustomUser, type="buyer", _quantity=SHOPS - 1)
+    orders = Order.objects.bulk_create(
+        Order(
+            user=buyers[number % SHOPS],
+            status="basket" if number < SHOPS else "new",
+            reserved_until=now + timedelta(hours=1 if number % 50 else -1),
+        )
+        for number in range(GOODS)
+    )
+    OrderItem.objects.bulk_create(
+        OrderItem(order=order, product_info=info, quantity=1, price=info.price)
+        for order, info in zip(orders, goods)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+        cursor.execute("SET LOCAL enable_seqscan = off")
+    return {
+        "user": user,
+        "partner": partner,
+        "shop": shops[0],
+        "category": categories[0],
+        "info": goods[0],
+    }
+
+
+def as_user(client, user):
+    client.credentials(
+        HTTP_AUTHORIZATION=f"Token {Token.objects.get_or_create(user=user)[0].key}"
+    )
+    return client
+
+
+# Запросы горячих путей выполняются настоящим кодом: запросом к API,
+# импортом или задачей, а SQL, который при этом ушел в базу, проверяется
+# через EXPLAIN. Для каждого пути - таблица и индекс (или один из индексов),
+# который должен быть в плане.
+HOT_PATHS = {
+    "basket": (
+        lambda client, data: as_user(client, data["user"]).get("/api/v1/basket"),
+        "backend_order",
+        ("unique_user_basket", "order_user_status"),
+    ),
+    "basket_add": (
+        lambda client, data: as_user(client, data["user"]).post(
+            "/api/v1/basket",
+            {"items": [{"product_info": data["info"].id, "quantity": 1}]},
+            format="json",
+        ),
+        "backend_orderitem",
+        "unique_order_product_info",
+    ),
+    "user_orders": (
+        lambda client, data: as_user(client, data["user"]).get("/api/v1/order"),
+        "backend_order",
+        "order_user_status",
+    ),
+    "catalog": (
+        lambda client, data: client.get(
+            "/api/v1/products",
+            {"shop_id": data["shop"].id, "category_id": data["category"].id},
+        ),
+        "backend_productinfo",
+        # оба индекса начинаются с shop, выбор зависит от размера таблицы
+        ("productinfo_shop_product", "unique_shop_external_id"),
+    ),
+    "catalog_by_price": (
+        lambda client, data: client.get(
+            "/api/v1/products", {"price_min": 10, "ordering": "price"}
+        ),
+        "backend_productinfo",
+        "productinfo_active_price_id",
+    ),
+    "parameter_filter": (
+        lambda client, data: client.get("/api/v1/products", {"parameter": "Цвет:1"}),
+        "backend_productparameter",
+        "productparam_value",
+    ),
+    "partner_items": (
+        lambda client, data: as_user(client, data["partner"]).get(
+            "/api/v1/partner/orders"
+        ),
+        "backend_orderitem",
+        "orderitem_info_covering",
+    ),
+    "product_by_external_id": (
+        lambda client, data: CatalogImporter(data["shop"]).run(
+            [],
+            [
+                {
+                    "id": 1,
+                    "category": data["category"].id,
+                    "model": "",
+                    "name": "Товар 1",
+                    "price": 1,
+                    "price_rrc": 1,
+                    "quantity": 10,
+                }
+            ],
+        ),
+        "backend_productinfo",
+        "unique_shop_external_id",
+    ),
+    "parameter_by_name": (
+        lambda client, data: CatalogImporter(data["shop"]).resolve_parameters(["Цвет"]),
+        "backend_parameter",
+        "parameter_name",
+    ),
+    "expired_reservations": (
+        lambda client, data: release_expired_reservations(),
+        "backend_order",
+        "order_new_reserved_until",
+    ),
+}
+
+
+def explain_selects(queries, table):
+    """Планы всех SELECT из queries, которые читают table"""
+    plans = []
+    with connection.cursor() as cursor:
+        for query in queries:
+            sql = query["sql"]
+            if sql.startswith("SELECT") and f'"{table}"' in sql:
+                cursor.execute(f"EXPLAIN {sql}")
+                plans.append("\n".join(row[0] for row in cursor.fetchall()))
+    return plans
+
+
+@pytest.mark.parametrize("name", HOT_PATHS)
+def test_hot_path_uses_index(seeded, client, name):
+    run, table, indexes = HOT_PATHS[name]
+    if isinstance(indexes, str):
+        indexes = (indexes,)
+    with CaptureQueriesContext(connection) as captured:
+        run(client, seeded)
+    plans = explain_selects(captured.captured_queries, table)
+    assert plans, f"{name}: нет запросов к {table}"
+    assert any(index in plan for plan in plans for index in indexes), "\n\n".join(plans)
+
+
+@pytest.mark.parametrize(
+    "user, url, params, table, index, cursor",
+    [
+        (
+            None,
+            "/api/v1/products",
+            {"ordering": "price"},
+            "backend_productinfo",
+            "productinfo_active_price_id",
+            "Index Cond: (price >= ",
+        ),
+        (
+            None,
+            "/api/v1/products",
+            {"ordering": "-price"},
+            "backend_productinfo",
+            "productinfo_active_price_id",
+            "Index Cond: (price <= ",
+        ),
+        (
+            "partner",
+            "/api/v1/partner/orders",
+            {},
+            "backend_order",
+            "order_dt_id",
+            "Index Cond: (dt <= ",
+        ),
+    ],
+)
+def test_keyset_page_seeks_index(
+    seeded, client, user, url, params, table, index, cursor
+):
+    """Следующая страница начинается с позиции курсора в индексе"""
+    if user:
+        as_user(client, seeded[user])
+    next_cursor = client.get(url, params).json()["Next"]
+    with CaptureQueriesContext(connection) as captured:
+        client.get(url, {**params, "cursor": next_cursor})
+    plans = explain_selects(captured.captured_queries, table)
+    assert any(index in plan and cursor in plan for plan in plans), "\n\n".join(plans)
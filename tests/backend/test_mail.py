@@ -0,0 +1,136 @@
+import smtplib
+from datetime import timedelta
+
+import pytest
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.utils import timezone
+
+from backend.mail import queue_email, send_outbox
+from backend.models import ConfirmEmailToken, OutboxEmail
+
+
+pytestmark = pytest.mark.django_db
+
+
+class CountingBackend(EmailBackend):
+    """locmem, который считает открытые соединения и отказывает адресам из refused"""
+
+    opened = 0
+    refused = set()
+
+    def open(self):
+        CountingBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        for message in messages:
+            if self.refused.intersection(message.to):
+                raise smtplib.SMTPRecipientsRefused({message.to[0]: (550, b"")})
+        return super().send_messages(messages)
+
+
+@pytest.fixture
+def backend(settings):
+    settings.EMAIL_BACKEND = "tests.backend.test_mail.CountingBackend"
+    settings.EMAIL_OUTBOX_RATE = 0
+    CountingBackend.opened = 0
+    CountingBackend.refused = set()
+    return CountingBackend
+
+
+def test_registration_email_queued(client):
+    response = client.post(
+        "/api/v1/user/register",
+        {
+            "first_name": "Иван",
+            "last_name": "Петров",
+            "email": "buyer@example.com",
+            "password": "7667766Cvb",
+            "company": "ООО",
+        },
+    )
+    assert response.status_code == 200
+    assert mail.outbox == []
+
+    assert send_outbox() == {"sent": 1, "retried": 0, "dead": 0}
+    (message,) = mail.outbox
+    assert message.to == ["buyer@example.com"]
+    assert ConfirmEmailToken.objects.get().key in message.body
+    assert OutboxEmail.objects.get().status == "sent"
+
+
+def test_password_reset_not_sent_in_request(client, create_user):
+    create_user(email="buyer@example.com", is_active=True)
+    response = client.post(
+        "/api/v1/user/password_reset", {"email": "buyer@example.com"}
+    )
+    assert response.status_code == 200
+    assert mail.outbox == []
+    assert OutboxEmail.objects.get().to == ["buyer@example.com"]
+
+
+def test_batch_over_one_connection(backend):
+    for number in range(5):
+        queue_email("Тема", f"Письмо {number}", [f"user{number}@example.com"])
+
+    assert send_outbox(batch_size=3)["sent"] == 3
+    assert backend.opened == 1
+    assert send_outbox(batch_size=3)["sent"] == 2
+    assert send_outbox(batch_size=3)["sent"] == 0
+    assert backend.opened == 2
+    assert [message.body for message in mail.outbox] == [
+        f"Письмо {number}" for number in range(5)
+    ]
+
+
+def test_retry_then_dead_letter(backend, settings):
+    settings.EMAIL_OUTBOX_MAX_ATTEMPTS = 2
+    settings.EMAIL_OUTBOX_RETRY_DELAY = 60
+    backend.refused = {"bad@example.com"}
+    bad = queue_email("Тема", "Текст", ["bad@example.com"])
+    queue_email("Тема", "Текст", ["good@example.com"])
+
+    assert send_outbox() == {"sent": 1, "retried": 1, "dead": 0}
+    bad.refresh_from_db()
+    assert bad.status == "pending"
+    assert bad.attempts == 1
+    assert bad.send_after > timezone.now() + timedelta(seconds=50)
+    assert send_outbox()["retried"] == 0
+
+    OutboxEmail.objects.filter(id=bad.id).update(send_after=timezone.now())
+    assert send_outbox() == {"sent": 0, "retried": 0, "dead": 1}
+    bad.refresh_from_db()
+    assert bad.status == "dead"
+    assert bad.last_error
+    assert [message.to for message in mail.outbox] == [["good@example.com"]]
+
+
+def test_broken_message_does_not_stop_batch(backend):
+    # перевод строки в теме - BadHeaderError при сборке письма
+    broken = queue_email("Тема\nBcc: spam@example.com", "Текст", ["a@example.com"])
+    queue_email("Тема", "Текст", ["b@example.com"])
+
+    assert send_outbox() == {"sent": 1, "retried": 1, "dead": 0}
+    assert backend.opened == 1
+    broken.refresh_from_db()
+    assert (broken.status, broken.attempts) == ("pending", 1)
+    assert "Header values can't contain newlines" in broken.last_error
+    assert [message.to for message in mail.outbox] == [["b@example.com"]]
+
+
+def test_rate_limit(backend, monkeypatch):
+    clock = [0.0]
+    sleeps = []
+
+    def sleep(pause):
+        sleeps.append(pause)
+        clock[0] += pause
+
+    monkeypatch.setattr("backend.mail.time.monotonic", lambda: clock[0])
+    monkeypatch.setattr("backend.mail.time.sleep", sleep)
+    for number in range(3):
+        queue_email("Тема", "Текст", [f"user{number}@example.com"])
+
+    assert send_outbox(rate=2)["sent"] == 3
+    assert sleeps == [0.5, 0.5]
@@ -0,0 +1,101 @@
+import logging
+
+import pytest
+from rest_framework.authtoken.models import Token
+
+from backend.metrics import SECONDS_BUCKETS, Histogram, registry
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def clear_registry():
+    registry.clear()
+
+
+class TestRequestMetrics:
+    def test_server_timing(self, client, shop_create):
+        shop_create(_quantity=3)
+        response = client.get("/api/v1/shops")
+
+        timing = response["Server-Timing"]
+        assert 'desc="queries=1"' in timing
+        assert "serialize;dur=" in timing
+        assert "total;dur=" in timing
+
+    def test_metrics_endpoint(self, client, shop_create, settings):
+        settings.METRICS_TOKEN = "scrape-secret"
+        shop_create()
+        client.get("/api/v1/shops")
+        client.get("/api/v1/shops")
+
+        response = client.get(
+            "/metrics", headers={"Authorization": "Bearer scrape-secret"}
+        )
+        assert response.status_code == 200
+        text = response.content.decode()
+        labels = 'method="GET",status="200",view="ShopsView"'
+        assert f"http_request_duration_seconds_count{{{labels}}} 2" in text
+        assert f'http_request_db_queries_bucket{{{labels},le="+Inf"}} 2' in text
+        assert "catalog_cache_hits_total 1" in text
+
+    def test_metrics_not_public(self, client, create_user, settings):
+        settings.METRICS_TOKEN = ""
+        assert client.get("/metrics").status_code == 401
+        assert (
+            client.get("/metrics", headers={"Authorization": "Bearer "}).status_code
+            == 401
+        )
+
+        settings.METRICS_TOKEN = "scrape-secret"
+        response = client.get("/metrics", headers={"Authorization": "Bearer wrong"})
+        assert response.status_code == 401
+
+        buyer = create_user(email="buyer@example.com", type="buyer")
+        admin = create_user(email="admin@example.com", is_staff=True)
+        for user, status in ((buyer, 403), (admin, 200)):
+            token = Token.objects.create(user=user)
+            response = client.get(
+                "/metrics", headers={"Authorization": f"Token {token.key}"}
+            )
+            assert response.status_code == status
+
+    def test_streamed_response_measured(self, client, goods):
+        response = client.get("/api/v1/products", {"stream": 1, "fields": "id"})
+        assert registry.histograms["queries"].series == {}
+
+        content = b"".join(response.streaming_content)
+
+        ((labels, (_, queries)),) = registry.histograms["queries"].series.items()
+        assert dict(labels)["status"] == "200"
+        assert queries == 1
+        (_, size) = registry.histograms["size"].series[labels]
+        assert size == len(content)
+
+    def test_slow_request_logs_queries(self, client, shop_create, settings, caplog):
+        settings.SLOW_REQUEST_QUERIES = 0
+        shop_create()
+        with caplog.at_level(logging.WARNING, logger="backend.metrics"):
+            client.get("/api/v1/shops")
+
+        (record,) = caplog.records
+        assert "ShopsView" in record.getMessage()
+        assert 'FROM "backend_shop"' in record.getMessage()
+
+    def test_fast_request_not_logged(self, client, caplog):
+        with caplog.at_level(logging.WARNING, logger="backend.metrics"):
+            client.get("/api/v1/shops")
+        assert not caplog.records
+
+
+def test_histogram_buckets():
+    histogram = Histogram("latency", "", SECONDS_BUCKETS)
+    for value in (0.001, 0.005, 0.3, 20):
+        histogram.observe((("view", "A"),), value)
+
+    lines = histogram.render()
+    assert 'latency_bucket{view="A",le="0.005"} 2' in lines
+    assert 'latency_bucket{view="A",le="0.5"} 3' in lines
+    assert 'latency_bucket{view="A",le="+Inf"} 4' in lines
+    assert 'latency_count{view="A"} 4' in lines
@@ -0,0 +1,563 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import pytest
+from django.db import connection, transaction
+from django.utils import timezone
+from django.core.management import call_command
+from model_bakery import baker
+from rest_framework.authtoken.models import Token
+
+from backend.basket import BasketError, add_items, remove_items, update_items
+from backend.cache import get_cache_stats
+from backend.importer import CatalogImporter
+from backend.models import Order, OrderEvent, OrderItem, ProductInfo
+from backend.orders import InsufficientStock, checkout, release_orders
+from backend.tasks import release_expired_reservations_task
+
+
+pytestmark = pytest.mark.django_db
+
+
+class TestOrderTotals:
+    basket_endpoint = "/api/v1/basket"
+    order_endpoint = "/api/v1/order"
+
+    def add_to_basket(self, client, goods):
+        return client.post(
+            self.basket_endpoint,
+            {
+                "items": [
+                    {"product_info": goods[0].id, "quantity": 2},
+                    {"product_info": goods[1].id, "quantity": 1},
+                ]
+            },
+            format="json",
+        )
+
+    def test_basket_total(self, client, buyer, goods):
+        response = self.add_to_basket(client, goods)
+        assert response.status_code == 201
+        assert response.json()["Created_objects"] == 2
+
+        basket = Order.objects.get(user=buyer, status="basket")
+        assert basket.total == 450
+        data = client.get(self.basket_endpoint).json()["answer"][0]
+        assert data["total_sum"] == 450
+        assert sorted(item["price"] for item in data["ordered_items"]) == [100, 250]
+
+    def test_basket_put_and_delete_update_total(self, client, buyer, goods):
+        self.add_to_basket(client, goods)
+        basket = Order.objects.get(user=buyer, status="basket")
+        first, second = basket.ordered_items.order_by("product_info__price")
+
+        client.put(
+            self.basket_endpoint,
+            {"items": [{"id": first.id, "quantity": 5}]},
+            format="json",
+        )
+        basket.refresh_from_db()
+        assert basket.total == 750
+
+        client.delete(self.basket_endpoint, {"items": str(second.id)}, format="json")
+        basket.refresh_from_db()
+        assert basket.total == 500
+
+    def test_placed_order_keeps_prices(self, client, buyer, goods, contact_create):
+        self.add_to_basket(client, goods)
+        basket = Order.objects.get(user=buyer, status="basket")
+        contact = contact_create(user=buyer)
+        ProductInfo.objects.filter(id=goods[0].id).update(price=300)
+
+        response = client.post(
+            self.order_endpoint, {"id": basket.id, "contact": contact.id}
+        )
+        assert response.status_code == 201
+        basket.refresh_from_db()
+        assert basket.status == "new"
+        assert basket.total == 850
+        (event,) = OrderEvent.objects.all()
+        assert (event.order_id, event.old_status, event.new_status) == (
+            basket.id,
+            "basket",
+            "new",
+        )
+
+        ProductInfo.objects.filter(id=goods[0].id).update(price=1)
+        data = client.get(self.order_endpoint).json()["Orders"][0]
+        assert data["total_sum"] == 850
+
+    def test_backfill_order_totals(self, buyer, goods):
+        orders = baker.make(Order, user=buyer, status="new", _quantity=3)
+        for order in orders:
+            for info in goods:
+                baker.make(OrderItem, order=order, product_info=info, quantity=2)
+
+        call_command("backfill_order_totals", batch_size=2)
+
+        assert list(Order.objects.values_list("total", flat=True).distinct()) == [700]
+        assert not OrderItem.objects.filter(price=0).exists()
+
+    def test_import_refreshes_basket_prices(self, client, buyer, goods):
+        self.add_to_basket(client, goods)
+        placed = baker.make(Order, user=buyer, status="new")
+        baker.make(
+            OrderItem, order=placed, product_info=goods[0], quantity=1, price=100
+        )
+        ProductInfo.objects.filter(id=goods[0].id).update(price=120)
+
+        CatalogImporter.refresh_baskets([goods[0].id])
+
+        assert Order.objects.get(user=buyer, status="basket").total == 490
+        assert OrderItem.objects.get(order=placed).price == 100
+
+
+class TestCheckout:
+    endpoint = "/api/v1/order"
+
+    def make_basket(self, user, goods, quantity=1):
+        basket = baker.make(Order, user=user, status="basket")
+        for info in goods:
+            baker.make(OrderItem, order=basket, product_info=info, quantity=quantity)
+        return basket
+
+    def test_checkout_reserves_stock(self, client, buyer, goods, contact_create):
+        basket = self.make_basket(buyer, goods, quantity=4)
+        contact = contact_create(user=buyer)
+
+        checkout(buyer.id, basket.id, contact.id)
+
+        basket.refresh_from_db()
+        assert basket.status == "new"
+        assert basket.total == 1400
+        assert basket.reserved_until > timezone.now()
+        assert set(ProductInfo.objects.values_list("quantity", flat=True)) == {6}
+
+    def test_insufficient_stock(self, client, buyer, goods, contact_create):
+        basket = self.make_basket(buyer, goods, quantity=4)
+        ProductInfo.objects.filter(id=goods[1].id).update(quantity=3)
+
+        response = client.post(
+            self.endpoint,
+            {"id": basket.id, "contact": contact_create(user=buyer).id},
+            format="json",
+        )
+
+        assert response.status_code == 409
+        assert response.json()["Errors"] == {str(goods[1].id): "На складе 3 шт."}
+        basket.refresh_from_db()
+        assert basket.status == "basket"
+        assert ProductInfo.objects.get(id=goods[0].id).quantity == 10
+
+    def test_inactive_goods_error(self, client, buyer, goods, contact_create):
+        basket = self.make_basket(buyer, goods)
+        ProductInfo.objects.filter(id=goods[0].id).update(is_active=False)
+
+        response = client.post(
+            self.endpoint,
+            {"id": basket.id, "contact": contact_create(user=buyer).id},
+            format="json",
+        )
+
+        assert response.status_code == 409
+        assert response.json()["Errors"] == {str(goods[0].id): "Товар не продается"}
+
+    def test_catalog_cache_kept_while_in_stock(
+        self,
+        buyer,
+        goods,
+        contact_create,
+        monkeypatch,
+        django_capture_on_commit_callbacks,
+    ):
+        monkeypatch.setattr("backend.events.publish", lambda events: None)
+        contact = contact_create(user=buyer)
+        with django_capture_on_commit_callbacks(execute=True):
+            checkout(
+                buyer.id, self.make_basket(buyer, goods, quantity=4).id, contact.id
+            )
+        assert get_cache_stats()["invalidations"] == 0
+
+        basket = self.make_basket(buyer, goods[:1], quantity=6)
+        with django_capture_on_commit_callbacks(execute=True):
+            checkout(buyer.id, basket.id, contact.id)
+        assert get_cache_stats()["invalidations"] == 1
+
+        with django_capture_on_commit_callbacks(execute=True):
+            release_orders(Order.objects.filter(id=basket.id))
+        assert get_cache_stats()["invalidations"] == 2
+
+    def test_cancel_releases_stock(self, client, buyer, goods, contact_create):
+        basket = self.make_basket(buyer, goods, quantity=4)
+        checkout(buyer.id, basket.id, contact_create(user=buyer).id)
+
+        response = client.delete(self.endpoint, {"id": basket.id}, format="json")
+        assert response.status_code == 200
+        assert set(ProductInfo.objects.values_list("quantity", flat=True)) == {10}
+        assert Order.objects.get(id=basket.id).status == "canceled"
+
+        response = client.delete(self.endpoint, {"id": basket.id}, format="json")
+        assert response.status_code == 400
+
+    def test_admin_cancel_releases_stock(
+        self, client, buyer, goods, contact_create, create_user
+    ):
+        basket = self.make_basket(buyer, goods, quantity=4)
+        checkout(buyer.id, basket.id, contact_create(user=buyer).id)
+        Order.objects.filter(id=basket.id).update(status="confirmed")
+        delivered = baker.make(Order, user=buyer, status="delivered")
+        admin = create_user(email="admin@example.com", is_staff=True, is_superuser=True)
+        client.force_login(admin, backend="django.contrib.auth.backends.ModelBackend")
+
+        response = client.post(
+            "/admin/backend/order/",
+            {
+                "action": "mark_canceled",
+                "index": 0,
+                "_selected_action": [basket.id, delivered.id],
+            },
+            format="multipart",
+        )
+
+        assert response.status_code == 302
+        assert set(ProductInfo.objects.values_list("quantity", flat=True)) == {10}
+        assert Order.objects.get(id=basket.id).status == "canceled"
+        assert Order.objects.get(id=delivered.id).status == "delivered"
+        event = OrderEvent.objects.get(order_id=basket.id, new_status="canceled")
+        assert event.old_status == "confirmed"
+
+    def test_expired_reservations(self, buyer, goods, contact_create):
+        expired = self.make_basket(buyer, goods[:1], quantity=3)
+        checkout(buyer.id, expired.id, contact_create(user=buyer).id)
+        active = self.make_basket(buyer, goods[:1], quantity=2)
+        checkout(buyer.id, active.id, contact_create(user=buyer).id)
+        Order.objects.filter(id=expired.id).update(
+            reserved_until=timezone.now() - timedelta(minutes=1)
+        )
+
+        assert release_expired_reservations_task() == 1
+
+        assert ProductInfo.objects.get(id=goods[0].id).quantity == 8
+        assert Order.objects.get(id=active.id).status == "new"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_checkouts_do_not_oversell(
+    create_user,
+    shop_create,
+    products_create,
+    category_create,
+    contact_create,
+    monkeypatch,
+):
+    stock, buyers = 5, 16
+    published = []
+    monkeypatch.setattr("backend.events.publish", published.extend)
+    shop = shop_create(state=True)
+    goods = [
+        baker.make(
+            ProductInfo,
+            shop=shop,
+            product_id=products_create(category=category_create()).id,
+            price=10,
+            quantity=stock,
+        )
+        for _ in range(2)
+    ]
+    baskets = []
+    for number in range(buyers):
+        user = create_user(email=f"buyer{number}@example.com", type="buyer")
+        basket = baker.make(Order, user=user, status="basket")
+        # половина корзин добавляет товары в обратном порядке
+        for info in goods if number % 2 else reversed(goods):
+            baker.make(OrderItem, order=basket, product_info=info, quantity=1)
+        baskets.append((user.id, basket.id, contact_create(user=user).id))
+
+    barrier = threading.Barrier(buyers)
+
+    def place(args):
+        barrier.wait()
+        try:
+            checkout(*args)
+            return "ok"
+        except InsufficientStock:
+            return "out of stock"
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=buyers) as executor:
+        results = list(executor.map(place, baskets))
+
+    assert results.count("ok") == stock
+    assert results.count("out of stock") == buyers - stock
+    assert set(ProductInfo.objects.values_list("quantity", flat=True)) == {0}
+    assert Order.objects.filter(status="new").count() == stock
+    assert len(published) == stock
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_basket_adds_keep_quantities(create_user, goods):
+    adds = 8
+    user = create_user(email="buyer@example.com", type="buyer")
+    basket = baker.make(Order, user=user, status="basket")
+    barrier = threading.Barrier(adds)
+
+    def add(_):
+        barrier.wait()
+        try:
+            add_items(basket, [{"product_info": goods[0].id, "quantity": 1}])
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=adds) as executor:
+        list(executor.map(add, range(adds)))
+
+    assert OrderItem.objects.get(order=basket).quantity == adds
+    assert Order.objects.get(id=basket.id).total == adds * goods[0].price
+
+
+def test_placed_order_not_changed_through_basket(buyer, goods, contact_create):
+    basket = baker.make(Order, user=buyer, status="basket")
+    add_items(basket, [{"product_info": goods[0].id, "quantity": 2}])
+    item = OrderItem.objects.get(order=basket)
+    # basket в памяти остался корзиной, как у запроса, который начался
+    # до оформления заказа
+    checkout(buyer.id, basket.id, contact_create(user=buyer).id)
+
+    with pytest.raises(BasketError):
+        update_items(basket, [{"id": item.id, "quantity": 9}])
+    with pytest.raises(BasketError):
+        remove_items(basket, [item.id])
+    with pytest.raises(BasketError):
+        add_items(basket, [{"product_info": goods[0].id, "quantity": 1}])
+    item.refresh_from_db()
+    assert item.quantity == 2
+    assert ProductInfo.objects.get(id=goods[0].id).quantity == 8
+
+
+class TestBasketBulk:
+    endpoint = "/api/v1/basket"
+
+    def test_post_merges_quantities(self, client, buyer, goods):
+        items = [{"product_info": goods[0].id, "quantity": 1}]
+        client.post(self.endpoint, {"items": items * 2}, format="json")
+        response = client.post(self.endpoint, {"items": items}, format="json")
+
+        assert response.status_code == 201
+        data = response.json()["Basket"]
+        assert [item["quantity"] for item in data["ordered_items"]] == [3]
+        assert data["total_sum"] == 300
+
+    @pytest.mark.parametrize(
+        "changes, error",
+        [
+            ({"quantity": 10}, "На складе 10 шт."),
+            ({"is_active": False}, "Товар не продается"),
+        ],
+    )
+    def test_post_invalid_goods(self, client, buyer, goods, changes, error):
+        ProductInfo.objects.filter(id=goods[1].id).update(**changes)
+        response = client.post(
+            self.endpoint,
+            {
+                "items": [
+                    {"product_info": goods[0].id, "quantity": 1},
+                    {"product_info": goods[1].id, "quantity": 11},
+                ]
+            },
+            format="json",
+        )
+        assert response.status_code == 400
+        assert response.json()["Errors"] == {str(goods[1].id): error}
+        assert not OrderItem.objects.exists()
+
+    def test_put_checks_stock(self, client, buyer, goods):
+        client.post(
+            self.endpoint,
+            {"items": [{"product_info": goods[0].id, "quantity": 1}]},
+            format="json",
+        )
+        item = OrderItem.objects.get()
+        response = client.put(
+            self.endpoint, {"items": [{"id": item.id, "quantity": 20}]}, format="json"
+        )
+        assert response.status_code == 400
+        item.refresh_from_db()
+        assert item.quantity == 1
+
+    def test_bulk_query_count(
+        self,
+        client,
+        buyer,
+        shop_create,
+        products_create,
+        category_create,
+        django_assert_max_num_queries,
+    ):
+        shop = shop_create(state=True)
+        category = category_create()
+        goods = [
+            baker.make(
+                ProductInfo,
+                shop=shop,
+                product_id=products_create(category=category).id,
+                price=10,
+                quantity=5,
+            )
+            for _ in range(100)
+        ]
+        items = [{"product_info": info.id, "quantity": 2} for info in goods]
+        with django_assert_max_num_queries(15):
+            response = client.post(self.endpoint, {"items": items}, format="json")
+        assert response.json()["Basket"]["total_sum"] == 2000
+
+        basket_items = OrderItem.objects.values_list("id", flat=True)
+        items = [{"id": item_id, "quantity": 5} for item_id in basket_items]
+        with django_assert_max_num_queries(15):
+            response = client.put(self.endpoint, {"items": items}, format="json")
+        assert response.json()["Basket"]["total_sum"] == 5000
+
+
+class TestPartnerOrders:
+    endpoint = "/api/v1/partner/orders"
+
+    @pytest.fixture
+    def partner(self, create_user, client):
+        user = create_user(email="shop@example.com", type="shop", is_active=True)
+        token = Token.objects.create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        return user
+
+    @pytest.fixture
+    def make_orders(self, partner, goods, shop_create, create_user):
+        goods[0].shop.user = partner
+        goods[0].shop.save()
+        goods[1].shop = shop_create(state=True)
+        goods[1].save()
+        buyer = create_user(email="buyer@example.com", type="buyer", is_active=True)
+
+        def make(count, status="new"):
+            orders = baker.make(Order, user=buyer, status=status, _quantity=count)
+            for order in orders:
+                baker.make(
+                    OrderItem, order=order, product_info=goods[0], quantity=2, price=100
+                )
+                baker.make(
+                    OrderItem, order=order, product_info=goods[1], quantity=1, price=250
+                )
+            return orders
+
+        return make
+
+    def test_only_shop_items(self, client, make_orders):
+        (order,) = make_orders(1)
+        make_orders(1, status="basket")
+
+        data = client.get(self.endpoint).json()
+        assert [item["id"] for item in data["Orders"]] == [order.id]
+        assert data["Orders"][0]["total"] == 200
+        assert len(data["Orders"][0]["ordered_items"]) == 1
+        assert data["Next"] is None
+
+    def test_pages_and_status(self, client, make_orders):
+        orders = make_orders(3)
+        make_orders(2, status="sent")
+
+        first = client.get(self.endpoint, {"limit": 2, "status": "new"}).json()
+        second = client.get(
+            self.endpoint, {"limit": 2, "status": "new", "cursor": first["Next"]}
+        ).json()
+        ids = [order["id"] for order in first["Orders"] + second["Orders"]]
+        assert ids == [order.id for order in reversed(orders)]
+        assert second["Next"] is None
+
+        response = client.get(self.endpoint, {"status": "basket"})
+        assert response.status_code == 400
+
+    def test_query_count(self, client, make_orders, django_assert_num_queries):
+        make_orders(10)
+        # токен, заказы, позиции с товарами, параметры
+        with django_assert_num_queries(4):
+            response = client.get(self.endpoint)
+        assert len(response.json()["Orders"]) == 10
+
+    def test_buyer_forbidden(self, client, buyer):
+        assert client.get(self.endpoint).status_code == 403
+
+    def test_bulk_transition(self, client, make_orders):
+        confirmed = make_orders(3, status="confirmed")
+        new = make_orders(1)
+        foreign = baker.make(Order, user=new[0].user, status="confirmed")
+        ids = [order.id for order in confirmed + new] + [foreign.id, 0]
+
+        response = client.post(
+            self.endpoint, {"ids": ids, "status": "assembled"}, format="json"
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["Changed"] == 3
+        assert [result["id"] for result in data["Results"]] == ids
+        assert data["Results"][0] == {
+            "id": confirmed[0].id,
+            "Status": True,
+            "old_status": "confirmed",
+        }
+        assert "new" in data["Results"][3]["Error"]
+        assert data["Results"][4]["Error"] == "Заказ не найден"
+        assert set(
+            Order.objects.filter(status="assembled").values_list("id", flat=True)
+        ) == {order.id for order in confirmed}
+        assert Order.objects.get(id=foreign.id).status == "confirmed"
+
+        events = OrderEvent.objects.order_by("order_id")
+        assert [event.order_id for event in events] == [order.id for order in confirmed]
+        assert all(len(event.shop_ids) == 2 for event in events)
+
+    def test_bulk_transition_query_count(
+        self, client, make_orders, django_assert_num_queries
+    ):
+        orders = make_orders(300, status="sent")
+        ids = ",".join(str(order.id) for order in orders)
+        # токен, UPDATE, магазины заказов, события, SAVEPOINT и RELEASE
+        with django_assert_num_queries(6):
+            response = client.post(
+                self.endpoint, {"ids": ids, "status": "delivered"}, format="json"
+            )
+        assert response.json()["Changed"] == 300
+
+    @pytest.mark.parametrize(
+        "data",
+        [
+            {"ids": [1]},
+            {"ids": [1], "status": "canceled"},
+            {"ids": [1], "status": "basket"},
+            {"ids": "1,a", "status": "sent"},
+        ],
+    )
+    def test_bulk_transition_invalid(self, client, partner, data):
+        response = client.post(self.endpoint, data, format="json")
+        assert response.status_code == 400
+
+    def test_bulk_transition_buyer_forbidden(self, client, buyer):
+        response = client.post(
+            self.endpoint, {"ids": [1], "status": "sent"}, format="json"
+        )
+        assert response.status_code == 403
+
+
+def test_state_machine(create_user):
+    user = create_user(email="buyer@example.com")
+    order = baker.make(Order, user=user, status="confirmed")
+    assert order.can_transition("assembled")
+    assert order.can_transition("canceled")
+    assert not order.can_transition("delivered")
+    assert not order.can_transition("basket")
+
+    with transaction.atomic():
+        assert Order.objects.filter(id=order.id).transition("delivered") == []
+        assert Order.objects.filter(id=order.id).transition("assembled") == [
+            (order.id, user.id, "confirmed")
+        ]
+    with pytest.raises(ValueError):
+        Order.objects.transition("lost")
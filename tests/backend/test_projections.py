@@ -0,0 +1,71 @@
+import pytest
+from django.core.files.base import ContentFile
+from model_bakery import baker
+
+from backend.models import (
+    Order,
+    OrderItem,
+    Parameter,
+    ProductInfo,
+    ProductParameter,
+)
+from backend.projections import (
+    ORDER_VALUES,
+    product_info_values,
+    serialize_orders,
+    serialize_product_infos,
+)
+from backend.serializers import OrderSerializer, ProductInfoSerializer
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def goods(goods_create, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    goods = goods_create((100, 250, 300))
+    goods[0].image.save("phone.png", ContentFile(b"png"))
+    for name in ("Цвет", "Память"):
+        parameter = baker.make(Parameter, name=name)
+        for info in goods[:2]:
+            baker.make(ProductParameter, product_info=info, parameter=parameter)
+    return goods
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [
+        ProductInfoSerializer.Meta.fields,
+        ("id", "product", "price"),
+        ("product_parameters",),
+    ],
+)
+def test_product_infos_match_serializer(goods, fields):
+    queryset = ProductInfo.objects.order_by("id")
+    expected = ProductInfoSerializer(queryset, many=True, fields=fields).data
+    assert serialize_product_infos(product_info_values(queryset), fields) == expected
+
+
+def test_orders_match_serializer(
+    goods, create_user, contact_create, django_assert_num_queries
+):
+    user = create_user(email="buyer@example.com", type="buyer")
+    orders = [
+        baker.make(Order, user=user, status="new", contact=contact_create(user=user)),
+        baker.make(Order, user=user, status="basket"),
+        baker.make(Order, user=user, status="new"),
+    ]
+    for order in orders[:2]:
+        for info in goods:
+            baker.make(OrderItem, order=order, product_info=info, quantity=2)
+
+    queryset = Order.objects.order_by("id")
+    expected = OrderSerializer(queryset, many=True).data
+    with django_assert_num_queries(4):
+        assert serialize_orders(queryset.values(*ORDER_VALUES)) == expected
+
+
+def test_empty_orders(django_assert_num_queries):
+    with django_assert_num_queries(1):
+        assert serialize_orders(Order.objects.values(*ORDER_VALUES)) == []
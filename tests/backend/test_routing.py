@@ -0,0 +1,125 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.conf import settings as django_settings
+from django.db import connections
+from django.test import RequestFactory
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from backend import async_views
+from backend.middleware import ReplicaRoutingMiddleware
+from backend.models import Shop
+from backend.routers import ReplicaRouter, replica_reads
+from backend.views import BasketView, PartnerState, ShopsView
+
+
+@pytest.fixture
+def replicas(settings):
+    settings.DATABASE_REPLICAS = ["replica_1"]
+
+
+@pytest.fixture
+def route():
+    """Прогоняет запрос через middleware и возвращает базу для чтения в view."""
+    factory = RequestFactory()
+
+    def run(method, view, token=None):
+        routed = []
+
+        def get_response(request):
+            view_func = view.as_view() if hasattr(view, "as_view") else view
+            middleware.process_view(request, view_func, (), {})
+            routed.append(ReplicaRouter().db_for_read(Shop))
+            return None
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        headers = {"HTTP_AUTHORIZATION": f"Token {token}"} if token else {}
+        middleware(getattr(factory, method)("/", **headers))
+        return routed[0]
+
+    return run
+
+
+class TestReplicaRouter:
+    def test_reads_default_outside_replica_views(self, replicas):
+        router = ReplicaRouter()
+        assert router.db_for_read(Shop) == "default"
+
+        token = replica_reads.set(True)
+        try:
+            assert router.db_for_read(Shop) == "replica_1"
+            assert router.db_for_write(Shop) == "default"
+        finally:
+            replica_reads.reset(token)
+
+    def test_no_replicas_configured(self, settings):
+        settings.DATABASE_REPLICAS = []
+        token = replica_reads.set(True)
+        try:
+            assert ReplicaRouter().db_for_read(Shop) == "default"
+        finally:
+            replica_reads.reset(token)
+
+    def test_allow_migrate_only_default(self):
+        assert ReplicaRouter().allow_migrate("default", "backend")
+        assert not ReplicaRouter().allow_migrate("replica_1", "backend")
+
+
+class TestReplicaRoutingMiddleware:
+    def test_catalog_reads_replica(self, replicas, route):
+        assert route("get", ShopsView) == "replica_1"
+        assert route("get", BasketView, token="abc") == "default"
+
+    def test_async_catalog_reads_replica(self, replicas, route):
+        assert route("get", async_views.shops) == "replica_1"
+        assert route("get", async_views.basket, token="abc") == "default"
+
+    def test_read_your_writes(self, replicas, route):
+        assert route("get", ShopsView, token="abc") == "replica_1"
+        assert route("post", PartnerState, token="abc") == "default"
+        assert route("get", ShopsView, token="abc") == "default"
+        assert route("get", ShopsView, token="other") == "replica_1"
+
+    def test_stickiness_expires(self, replicas, route, settings):
+        settings.REPLICA_STICKY_SECONDS = -1
+        route("post", PartnerState, token="abc")
+        assert route("get", ShopsView, token="abc") == "replica_1"
+
+    def test_redis_down_reads_primary(self, replicas, route, monkeypatch):
+        class DownCache:
+            def __getattr__(self, name):
+                def fail(*args, **kwargs):
+                    raise RedisConnectionError("Redis is down")
+
+                return fail
+
+        monkeypatch.setattr("backend.middleware.cache", DownCache())
+        assert route("get", ShopsView) == "default"
+        assert route("post", PartnerState, token="abc") == "default"
+
+        async def get_response(request):
+            return "ok"
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        request = RequestFactory().post("/")
+        assert async_to_sync(middleware)(request) == "ok"
+
+    def test_context_reset_after_request(self, replicas, route):
+        route("get", ShopsView)
+        assert ReplicaRouter().db_for_read(Shop) == "default"
+
+
+@pytest.mark.skipif(
+    len(django_settings.DATABASES) < 2, reason="Нужна реплика: DB_REPLICA_HOSTS"
+)
+@pytest.mark.django_db(databases="__all__", transaction=True)
+def test_catalog_served_from_replica(client, shop_create, settings):
+    settings.DATABASE_REPLICAS = [
+        alias for alias in settings.DATABASES if alias != "default"
+    ]
+    shop_create(name="Связной")
+    try:
+        response = client.get("/api/v1/shops")
+    finally:
+        for alias in settings.DATABASE_REPLICAS:
+            connections[alias].close()
+    assert response.json()[0]["name"] == "Связной"
@@ -0,0 +1,88 @@
+import pytest
+import yaml
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from backend.importer import CatalogImporter
+from backend.models import ProductInfo, ProductSearchIndex
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def catalog(create_user, shop_create):
+    shops = []
+    for number, name in ((1, "shop1.yaml"), (2, "shop2.yaml")):
+        user = create_user(email=f"shop{number}@example.com", type="shop")
+        shop = shop_create(user_id=user.id, state=True)
+        with open(f"data/{name}", encoding="utf-8") as file:
+            feed = yaml.safe_load(file)
+        CatalogImporter(shop).run(feed["categories"], feed["goods"])
+        shops.append(shop)
+    return shops
+
+
+class TestSearch:
+    endpoint = "/api/v1/products/search"
+
+    def test_import_builds_index(self, catalog):
+        assert ProductSearchIndex.objects.count() == ProductInfo.objects.count()
+
+    def test_search_ranked_hits_and_facets(self, client, catalog):
+        response = client.get(self.endpoint, data={"q": "iphone красный"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["Data"]
+        assert all("красный" in hit["name"] for hit in data["Data"])
+        ranks = [hit["rank"] for hit in data["Data"]]
+        assert ranks == sorted(ranks, reverse=True)
+        assert {facet["shop_id"] for facet in data["Facets"]["shops"]} == {
+            shop.id for shop in catalog
+        }
+        colors = {
+            facet["value"]: facet["count"]
+            for facet in data["Facets"]["parameters"]
+            if facet["parameter__name"] == "Цвет"
+        }
+        assert colors == {"красный": len(data["Data"])}
+
+    def test_search_filters_and_inactive(
+        self, client, catalog, django_capture_on_commit_callbacks
+    ):
+        shop = catalog[0]
+        response = client.get(self.endpoint, data={"q": "iphone", "shop_id": shop.id})
+        hits = response.json()["Data"]
+        assert hits and all(hit["shop_id"] == shop.id for hit in hits)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            CatalogImporter(shop, missing="deactivate").run([], [])
+        response = client.get(self.endpoint, data={"q": "iphone", "shop_id": shop.id})
+        assert response.json()["Data"] == []
+
+    def test_admin_edit_updates_index(
+        self, client, catalog, django_capture_on_commit_callbacks
+    ):
+        info = ProductInfo.objects.filter(shop=catalog[0]).first()
+        info.model = "uniquemodelname"
+        with django_capture_on_commit_callbacks(execute=True):
+            info.save()
+        response = client.get(self.endpoint, data={"q": "uniquemodelname"})
+        assert [hit["id"] for hit in response.json()["Data"]] == [info.id]
+
+    def test_search_requires_query(self, client):
+        assert client.get(self.endpoint).status_code == 400
+
+    def test_rebuild_and_benchmark_commands(self, catalog):
+        ProductSearchIndex.objects.all().delete()
+        call_command("rebuild_search_index", batch_size=2)
+        assert ProductSearchIndex.objects.count() == ProductInfo.objects.count()
+        call_command("search_benchmark", "iphone", runs=3, threshold_ms=5000)
+
+
+def test_benchmark_seeds_empty_database():
+    call_command("search_benchmark", "iphone", runs=2, threshold_ms=5000, scale=0.0001)
+    assert ProductSearchIndex.objects.count() == ProductInfo.objects.count() == 100
+
+    with pytest.raises(CommandError):
+        call_command("search_benchmark", runs=2, scale=0.0001)
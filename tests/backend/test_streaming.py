@@ -0,0 +1,84 @@
+import json
+import tracemalloc
+
+import pytest
+from model_bakery import baker
+from rest_framework.authtoken.models import Token
+
+from backend.models import Order, OrderItem, ProductInfo
+from backend.streaming import iter_chunks, iter_json
+
+
+pytestmark = pytest.mark.django_db
+
+
+def read_stream(response):
+    assert response.streaming
+    return json.loads(b"".join(response.streaming_content))
+
+
+@pytest.fixture
+def goods(goods_create):
+    return goods_create((100, 250, 300))
+
+
+@pytest.mark.parametrize(
+    "params",
+    [{}, {"fields": "id,price,image"}, {"ordering": "-price", "price_min": 200}],
+)
+def test_products_stream_matches_pages(client, goods, params):
+    expected = client.get("/api/v1/products", {**params, "limit": 500}).json()
+    data = read_stream(client.get("/api/v1/products", {**params, "stream": 1}))
+    assert data == {"Status": True, "Data": expected["Data"]}
+
+
+def test_products_stream_from_cursor(client, goods):
+    first = client.get("/api/v1/products", {"limit": 1}).json()
+    data = read_stream(
+        client.get("/api/v1/products", {"stream": 1, "cursor": first["Next"]})
+    )
+    assert [row["id"] for row in data["Data"]] == [info.id for info in goods[1:]]
+
+
+def test_orders_and_users_stream(client, create_user, goods):
+    user = create_user(email="buyer@example.com", type="buyer", is_active=True)
+    client.credentials(
+        HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user).key}"
+    )
+    for _ in range(3):
+        order = baker.make(Order, user=user, status="new")
+        baker.make(OrderItem, order=order, product_info=goods[0], quantity=1)
+
+    orders = read_stream(client.get("/api/v1/order", {"stream": 1}))
+    assert orders == client.get("/api/v1/order").json()
+    users = read_stream(client.get("/api/v1/user/register", {"stream": 1}))
+    assert users == client.get("/api/v1/user/register").json()
+
+
+def test_stream_is_lazy(client, goods, django_assert_num_queries):
+    with django_assert_num_queries(0):
+        response = client.get("/api/v1/products", {"stream": 1, "fields": "id"})
+    with django_assert_num_queries(1):
+        assert len(read_stream(response)["Data"]) == len(goods)
+
+
+def test_iter_chunks_sizes(goods):
+    chunks = list(iter_chunks(ProductInfo.objects.order_by("id"), len, chunk_size=2))
+    assert chunks == [2, 1]
+
+
+def test_memory_bounded_by_chunk():
+    """Пик памяти не растет с размером выдачи: в памяти одна пачка."""
+
+    def peak(chunks_count):
+        chunk = [{"id": number, "model": "x" * 100} for number in range(500)]
+        tracemalloc.start()
+        for _ in iter_json(
+            {"Status": True}, "Data", (chunk for _ in range(chunks_count))
+        ):
+            pass
+        _, result = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return result
+
+    assert peak(200) < peak(2) * 1.5
@@ -0,0 +1,79 @@
+import os
+
+import PIL.Image as Image
+import pytest
+from model_bakery import baker
+
+from backend.models import AvatarUser, ProductInfo
+from backend.serializers import ProductInfoSerializer, UserSerializer
+from backend.thumbnails import (
+    THUMBNAIL_SIZES,
+    generate_thumbnails,
+    store_original,
+    thumbnail_name,
+    thumbnail_urls,
+)
+
+
+def write_image(path, color="red", mode="RGB", image_format="PNG"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new(mode, (1000, 500), color).save(path, image_format)
+    return str(path)
+
+
+def test_identical_images_stored_once(media):
+    first = write_image(media / "shop_1" / "a.png")
+    second = write_image(media / "shop_2" / "b.png")
+    other = write_image(media / "shop_2" / "c.png", color="blue")
+
+    name = store_original(first)
+    assert store_original(second) == name
+    assert store_original(other) != name
+    assert os.stat(media / name).st_nlink == 3
+    assert os.path.samefile(second, media / name)
+
+
+def test_thumbnails_sizes_and_formats(media):
+    name = store_original(write_image(media / "a.png", mode="RGBA"))
+    assert generate_thumbnails([name]) == {name: None}
+
+    for size, pixels in THUMBNAIL_SIZES.items():
+        for extension in ("webp", "jpeg"):
+            with Image.open(media / thumbnail_name(name, size, extension)) as image:
+                assert image.size == (pixels, pixels // 2)
+
+
+def test_thumbnails_in_process_pool(media):
+    names = [
+        store_original(write_image(media / f"{color}.png", color=color))
+        for color in ("red", "green", "blue")
+    ]
+    (media / "broken.png").write_bytes(b"not an image")
+    broken = store_original(str(media / "broken.png"))
+
+    results = generate_thumbnails(names + [broken])
+    assert [results[name] for name in names] == [None, None, None]
+    assert results[broken]
+    assert (media / thumbnail_name(names[2], "medium", "webp")).exists()
+
+
+def test_thumbnail_urls():
+    assert thumbnail_urls("products_image/default.png") is None
+    assert thumbnail_urls("") is None
+    name = f"images/ab/{'ab' * 32}.png"
+    urls = thumbnail_urls(name)
+    assert set(urls) == set(THUMBNAIL_SIZES)
+    assert urls["small"]["webp"] == f"/media/thumbnails/ab/{'ab' * 32}_small.webp"
+
+
+@pytest.mark.django_db
+def test_serializers_expose_thumbnails(create_user):
+    name = f"images/ab/{'ab' * 32}.png"
+    info = baker.prepare(ProductInfo, image=name)
+    serializer = ProductInfoSerializer(info, fields=("image", "thumbnails"))
+    assert serializer.data["thumbnails"] == thumbnail_urls(name)
+
+    user = create_user(email="buyer@example.com")
+    AvatarUser.objects.create(user=user, avatar=name)
+    (avatar,) = UserSerializer(user).data["avatars"]
+    assert avatar["thumbnails"] == thumbnail_urls(name)
@@ -0,0 +1,107 @@
+"""
+Сравнение синхронного (gunicorn, WSGI) и асинхронного (uvicorn, ASGI) чтения.
+
+    gunicorn diplom.wsgi -w 4 -b 0.0.0.0:8000
+    gunicorn diplom.asgi -w 4 -k uvicorn.workers.UvicornWorker -b 0.0.0.0:8001
+    python -m tests.benchmarks.compare_servers --connections 1000 --duration 30 \
+        --sync http://localhost:8000/api/v1/shops \
+        --async http://localhost:8001/api/v1/async/shops
+
+Клиент держит --connections keep-alive соединений в одном цикле asyncio
+и печатает запросы в секунду, p50/p99 и число ошибок для каждого адреса.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from urllib.parse import urlsplit
+
+from tests.benchmarks.load import percentile
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Соединение закрыто сервером")
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def client(url, headers, deadline, timings, errors):
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    request = (
+        f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+        + "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        + "\r\n"
+    ).encode()
+    reader = writer = None
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(
+                    parts.hostname, parts.port or 80
+                )
+            writer.write(request)
+            await writer.drain()
+            status = await read_response(reader)
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+            errors.append(1)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.1)
+            continue
+        timings.append((time.perf_counter() - start) * 1000)
+        if status >= 400:
+            errors.append(status)
+    if writer is not None:
+        writer.close()
+
+
+async def run(url, connections, duration, headers):
+    timings, errors = [], []
+    deadline = time.monotonic() + duration
+    await asyncio.gather(
+        *(client(url, headers, deadline, timings, errors) for _ in range(connections))
+    )
+    return {
+        "requests": len(timings),
+        "rps": round(len(timings) / duration, 2),
+        "p50_ms": round(percentile(timings, 50), 1),
+        "p99_ms": round(percentile(timings, 99), 1),
+        "errors": len(errors),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sync", required=True, help="адрес WSGI-сервера")
+    parser.add_argument("--async", dest="async_", required=True, help="адрес ASGI")
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--duration", type=int, default=30)
+    parser.add_argument("--token", help="токен для корзины и заказов")
+    args = parser.parse_args(argv)
+
+    headers = {"Authorization": f"Token {args.token}"} if args.token else {}
+    report = {
+        name: asyncio.run(run(url, args.connections, args.duration, headers))
+        for name, url in (("wsgi", args.sync), ("asgi", args.async_))
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Нагрузочные тесты запускаются отдельно от основного набора:
+
+    RUN_BENCHMARKS=1 pytest tests/benchmarks --nomigrations
+
+BENCHMARK_SCALE задает объем данных (1 - полный объем из backend.benchmark_data),
+BENCHMARK_UPDATE_BASELINES=1 перезаписывает базовые линии текущими
+результатами вместо сравнения с ними.
+
+По умолчанию сравнивается только число SQL-запросов (baselines.json): оно не
+зависит от машины. Медианы времени сравниваются, если BENCHMARK_TIMINGS
+называет окружение (например, ci): базовые линии времени хранятся в
+timings.json отдельно для каждого окружения.
+"""
+import json
+import os
+from pathlib import Path
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from backend.benchmark_data import seed
+
+
+BASELINES_PATH = Path(__file__).with_name("baselines.json")
+TIMINGS_PATH = Path(__file__).with_name("timings.json")
+SCALE = os.getenv("BENCHMARK_SCALE", "0.001")
+TIMINGS_ENV = os.getenv("BENCHMARK_TIMINGS")
+# допустимое замедление медианы относительно базовой линии
+LATENCY_TOLERANCE = float(os.getenv("BENCHMARK_TOLERANCE", "0.5"))
+UPDATE_BASELINES = os.getenv("BENCHMARK_UPDATE_BASELINES") == "1"
+
+
+def pytest_ignore_collect(collection_path, config):
+    return not os.getenv("RUN_BENCHMARKS") and collection_path.suffix == ".py"
+
+
+@pytest.fixture(scope="session")
+def dataset(django_db_setup, django_db_blocker):
+    with django_db_blocker.unblock():
+        return seed(float(SCALE))
+
+
+@pytest.fixture(autouse=True)
+def no_throttling(settings):
+    settings.REST_FRAMEWORK = {
+        **settings.REST_FRAMEWORK,
+        "DEFAULT_THROTTLE_CLASSES": [],
+    }
+
+
+@pytest.fixture
+def no_cache(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+    }
+
+
+@pytest.fixture
+def auth_client(db):
+    def make(user):
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        return client
+
+    return make
+
+
+def load_baselines(path):
+    data = json.loads(path.read_text()) if path.exists() else {}
+    yield data
+    if UPDATE_BASELINES and data:
+        path.write_text(
+            json.dumps(data, indent=2, ensure_ascii=False, sort_keys=True) + "\n"
+        )
+
+
+@pytest.fixture(scope="session")
+def baselines():
+    yield from load_baselines(BASELINES_PATH)
+
+
+@pytest.fixture(scope="session")
+def timings():
+    yield from load_baselines(TIMINGS_PATH)
+
+
+def check_baseline(baselines, name, value, tolerance, unit):
+    """value не больше базовой линии с допуском; без нее value записывается."""
+    if UPDATE_BASELINES or name not in baselines:
+        baselines[name] = value
+        return
+    limit = baselines[name] * (1 + tolerance)
+    assert value <= limit, f"{name}: {value} {unit}, в базовой линии {baselines[name]}"
+
+
+@pytest.fixture
+def measure(benchmark, baselines, timings, request):
+    """
+    Прогоняет запрос через pytest-benchmark, отдельно считает SQL-запросы
+    и сравнивает их число с baselines.json для текущего SCALE, а медиану -
+    с timings.json для окружения BENCHMARK_TIMINGS, если оно задано.
+    """
+
+    def run(call, expected_status=200):
+        with CaptureQueriesContext(connection) as queries:
+            response = call()
+        assert response.status_code == expected_status, response.content
+        query_count = len(queries)
+        benchmark(call)
+
+        result = {
+            "queries": query_count,
+            "median_ms": round(benchmark.stats.stats.median * 1000, 3),
+        }
+        benchmark.extra_info.update(result)
+        name = request.node.name
+        check_baseline(
+            baselines.setdefault(SCALE, {}),
+            name,
+            result["queries"],
+            tolerance=0,
+            unit="SQL-запросов",
+        )
+        if TIMINGS_ENV:
+            check_baseline(
+                timings.setdefault(TIMINGS_ENV, {}).setdefault(SCALE, {}),
+                name,
+                result["median_ms"],
+                tolerance=LATENCY_TOLERANCE,
+                unit="мс (медиана)",
+            )
+        return result
+
+    return run
@@ -0,0 +1,181 @@
+"""
+Нагрузочный прогон сценариев против запущенного сервера.
+
+    python -m tests.benchmarks.load --host http://localhost:8000 \
+        --buyer-token <token> --partner-token <token> --users 50 --duration 60 \
+        --output load.json --baseline previous_load.json
+
+Данные для сервера можно сгенерировать так же, как в pytest-бенчмарках:
+
+    python manage.py shell -c "from backend.benchmark_data import seed; seed(0.01)"
+
+Каждый виртуальный пользователь в своем потоке выбирает сценарий по весу,
+выполняет его и ждет think time. В конце печатаются p50/p95/p99 и доля ошибок
+по сценариям; с --baseline прогон завершается с кодом 1, если p95 или доля
+ошибок хуже базовой линии больше чем на --tolerance.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+
+def browse_catalog(session, host, state):
+    response = session.get(f"{host}/api/v1/products", params={"limit": 50})
+    cursor = response.json().get("Next") if response.ok else None
+    if cursor:
+        session.get(f"{host}/api/v1/products", params={"limit": 50, "cursor": cursor})
+    return response
+
+
+def search(session, host, state):
+    return session.get(f"{host}/api/v1/products/search", params={"q": "смартфон"})
+
+
+def view_basket(session, host, state):
+    return session.get(f"{host}/api/v1/basket", headers=state["buyer_headers"])
+
+
+def view_orders(session, host, state):
+    return session.get(f"{host}/api/v1/order", headers=state["buyer_headers"])
+
+
+def partner_orders(session, host, state):
+    return session.get(
+        f"{host}/api/v1/partner/orders",
+        params={"limit": 20},
+        headers=state["partner_headers"],
+    )
+
+
+SCENARIOS = {
+    "browse_catalog": (browse_catalog, 50),
+    "search": (search, 20),
+    "view_basket": (view_basket, 15),
+    "view_orders": (view_orders, 10),
+    "partner_orders": (partner_orders, 5),
+}
+
+
+def percentile(values, percent):
+    if len(values) < 2:
+        return values[0] if values else 0
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+class LoadRunner:
+    def __init__(self, host, state, users, duration, think_time):
+        self.host = host.rstrip("/")
+        self.state = state
+        self.users = users
+        self.duration = duration
+        self.think_time = think_time
+        self.lock = threading.Lock()
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def user(self, deadline):
+        names = list(SCENARIOS)
+        weights = [SCENARIOS[name][1] for name in names]
+        with requests.Session() as session:
+            while time.monotonic() < deadline:
+                name = random.choices(names, weights)[0]
+                start = time.perf_counter()
+                try:
+                    ok = SCENARIOS[name][0](session, self.host, self.state).ok
+                except requests.RequestException:
+                    ok = False
+                elapsed = (time.perf_counter() - start) * 1000
+                with self.lock:
+                    self.timings[name].append(elapsed)
+                    if not ok:
+                        self.errors[name] += 1
+                time.sleep(random.uniform(0, self.think_time))
+
+    def run(self):
+        deadline = time.monotonic() + self.duration
+        threads = [
+            threading.Thread(target=self.user, args=(deadline,), daemon=True)
+            for _ in range(self.users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report()
+
+    def report(self):
+        return {
+            name: {
+                "requests": len(values),
+                "rps": round(len(values) / self.duration, 2),
+                "p50_ms": round(percentile(values, 50), 1),
+                "p95_ms": round(percentile(values, 95), 1),
+                "p99_ms": round(percentile(values, 99), 1),
+                "error_rate": round(self.errors[name] / len(values), 4),
+            }
+            for name, values in sorted(self.timings.items())
+        }
+
+
+def compare(report, baseline, tolerance):
+    problems = []
+    for name, expected in baseline.items():
+        actual = report.get(name)
+        if actual is None:
+            problems.append(f"{name}: сценарий не выполнялся")
+            continue
+        if actual["p95_ms"] > expected["p95_ms"] * (1 + tolerance):
+            problems.append(
+                f"{name}: p95 {actual['p95_ms']} мс, в базовой линии {expected['p95_ms']} мс"
+            )
+        if actual["error_rate"] > expected["error_rate"] + 0.01:
+            problems.append(
+                f"{name}: ошибок {actual['error_rate']:.2%}, "
+                f"в базовой линии {expected['error_rate']:.2%}"
+            )
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="http://localhost:8000")
+    parser.add_argument("--buyer-token", required=True)
+    parser.add_argument("--partner-token", required=True)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--duration", type=int, default=30)
+    parser.add_argument("--think-time", type=float, default=0.5)
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    args = parser.parse_args(argv)
+
+    state = {
+        "buyer_headers": {"Authorization": f"Token {args.buyer_token}"},
+        "partner_headers": {"Authorization": f"Token {args.partner_token}"},
+    }
+    report = LoadRunner(
+        args.host, state, args.users, args.duration, args.think_time
+    ).run()
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            problems = compare(report, json.load(file), args.tolerance)
+        for problem in problems:
+            print(problem, file=sys.stderr)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.backends.locmem import EmailBackend
+
+from backend.mail import queue_email, send_outbox
+
+
+pytestmark = pytest.mark.django_db
+
+MESSAGES = 100
+MIN_SPEEDUP = 5
+
+
+class SlowSmtpBackend(EmailBackend):
+    """locmem с задержками SMTP: установка сессии и отправка одного письма"""
+
+    connect_delay = 0.02
+    message_delay = 0.001
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connected = False
+
+    def open(self):
+        if self.connected:
+            return False
+        time.sleep(self.connect_delay)
+        self.connected = True
+        return True
+
+    def close(self):
+        self.connected = False
+
+    def send_messages(self, messages):
+        created = self.open()
+        try:
+            time.sleep(self.message_delay * len(messages))
+            return super().send_messages(messages)
+        finally:
+            if created:
+                self.close()
+
+
+def test_outbox_throughput(settings):
+    """Письмо на соединение против пачки через одно соединение."""
+    settings.EMAIL_BACKEND = "tests.benchmarks.test_outbox.SlowSmtpBackend"
+    recipients = [f"user{number}@example.com" for number in range(MESSAGES)]
+
+    start = time.perf_counter()
+    for recipient in recipients:
+        EmailMultiAlternatives("Тема", "Текст", None, [recipient]).send()
+    single_time = time.perf_counter() - start
+
+    for recipient in recipients:
+        queue_email("Тема", "Текст", [recipient])
+    start = time.perf_counter()
+    stats = send_outbox(batch_size=MESSAGES, rate=0)
+    batch_time = time.perf_counter() - start
+
+    assert stats["sent"] == MESSAGES
+    assert len(mail.outbox) == 2 * MESSAGES
+    speedup = single_time / batch_time
+    print(
+        f"по одному {MESSAGES / single_time:.0f} писем/с, "
+        f"пачкой {MESSAGES / batch_time:.0f} писем/с, x{speedup:.1f}"
+    )
+    assert speedup >= MIN_SPEEDUP
@@ -0,0 +1,71 @@
+import time
+
+import pytest
+from model_bakery import baker
+
+from backend.models import Parameter, Product, ProductInfo, ProductParameter, Shop
+from backend.projections import product_info_values, serialize_product_infos
+from backend.serializers import ProductInfoSerializer
+
+
+pytestmark = pytest.mark.django_db
+
+ROWS = 10_000
+MIN_SPEEDUP = 5
+
+
+@pytest.fixture
+def product_infos(create_user):
+    shop = baker.make(Shop, user=create_user(email="shop@example.com", type="shop"))
+    products = baker.prepare(
+        Product, category=baker.make("backend.Category"), _quantity=ROWS
+    )
+    products = Product.objects.bulk_create(products)
+    infos = ProductInfo.objects.bulk_create(
+        ProductInfo(
+            shop=shop,
+            product=product,
+            external_id=number,
+            model=f"model-{number}",
+            quantity=10,
+            price=number,
+            price_rrc=number,
+        )
+        for number, product in enumerate(products)
+    )
+    parameters = baker.make(Parameter, _quantity=2)
+    ProductParameter.objects.bulk_create(
+        ProductParameter(product_info=info, parameter=parameter, value=str(info.id))
+        for info in infos
+        for parameter in parameters
+    )
+    return ProductInfo.objects.order_by("id")
+
+
+def best_of(call, rounds=3):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = call()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def test_projection_speedup(product_infos):
+    """Сериализатор DRF против values()-проекции на 10 тысячах товаров."""
+    drf_time, expected = best_of(
+        lambda: ProductInfoSerializer(
+            product_infos.select_related("product__category").prefetch_related(
+                "product_param__parameter"
+            ),
+            many=True,
+        ).data
+    )
+    fast_time, data = best_of(
+        lambda: serialize_product_infos(product_info_values(product_infos))
+    )
+
+    assert data == expected
+    speedup = drf_time / fast_time
+    print(f"DRF {drf_time:.3f} с, проекция {fast_time:.3f} с, x{speedup:.1f}")
+    assert speedup >= MIN_SPEEDUP
@@ -0,0 +1,62 @@
+import pytest
+
+from backend.models import Order
+
+
+pytestmark = pytest.mark.django_db
+
+
+def test_product_info_page(dataset, client, measure, no_cache):
+    shop_id = dataset["shop"].id
+    measure(lambda: client.get("/api/v1/products", {"shop_id": shop_id}))
+
+
+def test_product_info_cached(dataset, client, measure):
+    shop_id = dataset["shop"].id
+    measure(lambda: client.get("/api/v1/products", {"shop_id": shop_id}))
+
+
+def test_product_info_deep_page(dataset, client, measure, no_cache):
+    first = client.get("/api/v1/products", {"ordering": "price", "limit": 500})
+    cursor = first.json()["Next"]
+    measure(
+        lambda: client.get(
+            "/api/v1/products", {"ordering": "price", "limit": 500, "cursor": cursor}
+        )
+    )
+
+
+def test_basket_get(dataset, auth_client, measure):
+    client = auth_client(dataset["buyer"])
+    measure(lambda: client.get("/api/v1/basket"))
+
+
+def test_basket_put(dataset, auth_client, measure):
+    client = auth_client(dataset["buyer"])
+    basket = Order.objects.get(user=dataset["buyer"], status="basket")
+    items = [
+        {"id": item_id, "quantity": 1}
+        for item_id in basket.ordered_items.values_list("id", flat=True)
+    ]
+    measure(lambda: client.put("/api/v1/basket", {"items": items}, format="json"))
+
+
+def test_orders_get(dataset, auth_client, measure):
+    client = auth_client(dataset["buyer"])
+    measure(lambda: client.get("/api/v1/order"))
+
+
+def test_partner_orders(dataset, auth_client, measure):
+    client = auth_client(dataset["partner"])
+    measure(lambda: client.get("/api/v1/partner/orders", {"limit": 100}))
+
+
+def test_partner_update(dataset, auth_client, measure, monkeypatch):
+    monkeypatch.setattr("backend.views.start_price_list_import", lambda job: None)
+    client = auth_client(dataset["partner"])
+    measure(
+        lambda: client.post(
+            "/api/v1/partner/update", {"url": "https://example.com/shop.yaml"}
+        ),
+        expected_status=202,
+    )
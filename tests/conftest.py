@@ -1,11 +1,36 @@
 import uuid
 import pytest
+from django.core.cache import cache
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from model_bakery import baker
 
+from backend.authentication import auth_cache
 from backend.models import Category, Contact, Product, ProductInfo, Shop
 
 
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    cache.clear()
+    auth_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def primary_only(settings):
+    """Реплики видят только закоммиченные данные, тесты читают с default."""
+    settings.DATABASE_REPLICAS = []
+
+
+@pytest.fixture
+def media(settings, tmp_path):
+    """MEDIA_ROOT во временном каталоге теста"""
+    settings.MEDIA_ROOT = str(tmp_path)
+    return tmp_path
+
+
 @pytest.fixture
 def client():
     return APIClient()
@@ -43,6 +68,34 @@ def product_info_create():
     return create
 
 
+@pytest.fixture
+def goods_create(shop_create, products_create, category_create):
+    """
+    Товары одного магазина в продаже, по одному на цену из prices.
+    Без category у каждого товара своя категория.
+    """
+
+    def create(prices=(100, 250), category=None):
+        shop = shop_create(state=True)
+        return [
+            baker.make(
+                ProductInfo,
+                shop=shop,
+                product_id=products_create(category=category or category_create()).id,
+                price=price,
+                quantity=10,
+            )
+            for price in prices
+        ]
+
+    return create
+
+
+@pytest.fixture
+def goods(goods_create):
+    return goods_create()
+
+
 @pytest.fixture
 def contact_create():
     def create(*args, **kwargs):
@@ -65,3 +118,12 @@ def create_user(db, django_user_model, test_password):
         return django_user_model.objects.create_user(**kwargs)
 
     return make_user
+
+
+@pytest.fixture
+def buyer(create_user, client):
+    """Покупатель, client авторизован его токеном"""
+    user = create_user(email="buyer@example.com", type="buyer", is_active=True)
+    token = Token.objects.create(user=user)
+    client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    return user